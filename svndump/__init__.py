@@ -26,24 +26,34 @@ from __future__ import print_function
 import re
 import common
 from file import SvnDumpFile
+from pipeline import SvnDumpPipeline, SvnDumpRevMap
+from shard import copy_dump_shards
 
-__all__ = ["common", "cvs2svnfix", "diff", "eolfix", "file", "merge",
-           "node", "props", "sanitize", "tools"]
+__all__ = ["chain", "common", "compress", "cvs2svnfix", "diff", "eolfix",
+           "file", "index", "merge", "node", "pipeline", "props", "sanitize",
+           "shard", "tools", "tree"]
 
 __doc__ = """A package for processing subversion dump files."""
 __version = "0.8.0"
 
 
-def copy_dump_file(srcfile, dstfile, transformer=None):
+def copy_dump_file(srcfile, dstfile, transformer=None, jobs=1):
     """
     Copy a dump file.
 
+    Reading, transforming and writing is done in a pipeline, see
+    svndump.pipeline.SvnDumpPipeline. With more than one job the
+    revisions are split into shards copied by separate processes if
+    possible, see svndump.shard.copy_dump_shards().
+
     @type srcfile: string
     @param srcfile: Source filename.
-    @type dstfile: string
-    @param dstfile: Destination filename.
+    @type dstfile: string or file object
+    @param dstfile: Destination filename, '-' for stdout or a file object.
     @type transformer: class with method transform(dump)
     @param transformer: A class to perform a transformation on each revision, or None.
+    @type jobs: integer
+    @param jobs: Count of processes copying shards of the dump file.
     """
 
     # SvnDumpFile classes for reading/writing dumps
@@ -51,37 +61,27 @@ def copy_dump_file(srcfile, dstfile, transformer=None):
     dstdmp = SvnDumpFile()
 
     # Copy_from_rev casacading
-    oldRevToNewRev = dict()
+    revmap = SvnDumpRevMap()
+
+    def write_rev(revision):
+        if revision.is_dropped():
+            revmap.add_rev(revision.get_rev_nr(), dstdmp.get_rev_nr())
+            return
+        revmap.map_nodes(revision)
+        dstdmp.add_rev_from_dump(revision)
+        revmap.add_rev(revision.get_rev_nr(), dstdmp.get_rev_nr())
 
     # open source file
+    srcdmp.set_use_mmap(True)
     srcdmp.open(srcfile)
 
     hasrev = srcdmp.read_next_rev()
     if hasrev:
-        # create the dump file
-        dstdmp.create_like(dstfile, srcdmp)
-        # now copy all the revisions
-        while hasrev:
-            if transformer is not None:
-                transformer.transform(srcdmp)
-            for node in srcdmp.get_nodes_iter():
-                if node.has_copy_from():
-                    if oldRevToNewRev.has_key(node.get_copy_from_rev()):
-                        node.set_copy_from_rev(oldRevToNewRev[node.get_copy_from_rev()])
-                    else:
-                        # We have a problem, the copy from revision is missing.
-                        # We look for a previous revision containing the file
-                        found = False
-                        candidate = node.get_copy_from_rev()
-                        while candidate > 0 and not found:
-                            candidate = candidate - 1
-                            found = oldRevToNewRev.has_key(candidate)
-                        if found:
-                            oldRevToNewRev[node.get_copy_from_rev()] = candidate
-                            node.set_copy_from_rev(candidate)
-            dstdmp.add_rev_from_dump(srcdmp)
-            oldRevToNewRev[srcdmp.get_rev_nr()] = dstdmp.get_rev_nr()
-            hasrev = srcdmp.read_next_rev()
+        # create the dump file, now copy all the revisions
+        if dstdmp.create_like(dstfile, srcdmp) and \
+                not copy_dump_shards(srcfile, srcdmp, dstfile, dstdmp,
+                                     transformer, jobs):
+            SvnDumpPipeline(srcdmp, transformer).execute(write_rev)
     else:
         print("no revisions in the source dump '%s' ???" % srcfile)
 
@@ -25,9 +25,66 @@ from __future__ import print_function
 
 from optparse import OptionParser
 import os
+import tempfile
 
-from svndump import __version, SvnDumpFile
+from svndump import __version, copy_dump_file
 from node import SvnDumpNode
+from common import TextDigestWriter, sdt_redirect_stdout
+
+
+class AddGitIgnoreTransformer:
+    """
+    A class adding .gitignore files in all directories that have an
+    svn:ignore property.
+    """
+
+    pipeline_safe = True
+
+    def __init__(self):
+        """
+        Creates an AddGitIgnoreTransformer class.
+        """
+
+        # paths of the existing .gitignore files
+        self.__gitignores = {}
+
+    def transform(self, dump):
+        nodes = []
+        for node in dump.get_nodes_iter():
+            # add the original node
+            nodes.append(node)
+            if node.get_property("svn:ignore") is not None:
+                # find out what the change is and act on it appropriately
+                path = node.get_path() + "/.gitignore"
+                action = node.get_action()
+                if action == "change" or action == "add":
+                    if path in self.__gitignores:
+                        # already saw this one - it is a change to the .gitignore file
+                        newnode = SvnDumpNode(path, "change", "file")
+                    else:
+                        # haven't seen this one yet
+                        newnode = SvnDumpNode(path, "add", "file")
+                        self.__gitignores[path] = True
+                    # the temp file is removed when the node is released
+                    fd, filename = tempfile.mkstemp(prefix="gitignore")
+                    f = TextDigestWriter(os.fdopen(fd, "wb"))
+                    f.write(node.get_property("svn:ignore"))
+                    f.close()
+                    digest = f.get_digest()
+                    newnode.set_text_file(filename,
+                                          digest.get_length(),
+                                          digest.get_md5(), True,
+                                          digest.get_sha1(),
+                                          digest.get_sha256())
+                    nodes.append(newnode)
+                elif action == "delete":
+                    newnode = SvnDumpNode(path, "delete", "file")
+                    nodes.append(newnode)
+                    del self.__gitignores[path]
+                else:
+                    print("Unhandled action: '%s'" % action)
+        if len(nodes) != dump.get_node_count():
+            dump.set_nodes(nodes)
 
 
 def copy_adding_git_ignore(srcfile, dstfile):
@@ -41,62 +98,7 @@ def copy_adding_git_ignore(srcfile, dstfile):
     @param dstfile: Destination filename.
     """
 
-    # SvnDumpFile classes for reading/writing dumps
-    srcdmp = SvnDumpFile()
-    dstdmp = SvnDumpFile()
-
-    # open source file
-    srcdmp.open(srcfile)
-    gitignores = {}
-    # used to ensure that copyfrom-revs are correct after the copy.  If
-    # there are any empty revision in the source dump file, the copyfrom-revs
-    # could be affected.
-    revmap = {}
-
-    hasrev = srcdmp.read_next_rev()
-    if hasrev:
-        # create the dump file
-        dstdmp.create_like(dstfile, srcdmp)
-        # now copy all the revisions
-        while hasrev:
-            dstdmp.add_rev(srcdmp.get_rev_props())
-            for node in srcdmp.get_nodes_iter():
-                if node.has_copy_from():
-                    node.set_copy_from(node.get_copy_from_path(), revmap[node.get_copy_from_rev()])
-                # add the original node
-                dstdmp.add_node(node)
-                if node.get_property("svn:ignore") is not None:
-                    # find out what the change is and act on it appropriately
-                    path = node.get_path() + "/.gitignore"
-                    action = node.get_action()
-                    if action == "change" or action == "add":
-                        if path in gitignores:
-                            # already saw this one - it is a change to the .gitignore file
-                            newnode = SvnDumpNode(path, "change", "file")
-                        else:
-                            # haven't seen this one yet
-                            newnode = SvnDumpNode(path, "add", "file")
-                            gitignores[path] = True
-                        f = open("gitignore", "wb")
-                        f.write(node.get_property("svn:ignore"))
-                        f.close()
-                        newnode.set_text_file("gitignore")
-                        dstdmp.add_node(newnode)
-                        os.remove("gitignore")
-                    elif action == "delete":
-                        newnode = SvnDumpNode(path, "delete", "file")
-                        dstdmp.add_node(newnode)
-                        del gitignores[path]
-                    else:
-                        print("Unhandled action: '%s'" % action)
-            revmap[srcdmp.get_rev_nr()] = dstdmp.get_rev_nr()
-            hasrev = srcdmp.read_next_rev()
-    else:
-        print("no revisions in the source dump '%s' ???" % srcfile)
-
-    # cleanup
-    srcdmp.close()
-    dstdmp.close()
+    copy_dump_file(srcfile, dstfile, AddGitIgnoreTransformer())
 
 
 def svndump_add_git_ignore(appname, args):
@@ -123,6 +125,8 @@ def svndump_add_git_ignore(appname, args):
     if len(args) != 2:
         print("specify a source dump file and a destination dump file")
         return 1
+    if args[1] == "-":
+        sdt_redirect_stdout()
 
     copy_adding_git_ignore(args[0], args[1])
     return 0
@@ -0,0 +1,182 @@
+# ===============================================================================
+#
+# Copyright (C) 2003 Martin Furter <mf@rola.ch>
+#
+# This file is part of SvnDumpTool
+#
+# SvnDumpTool is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# SvnDumpTool is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with SvnDumpTool; see the file COPYING.  If not, write to
+# the Free Software Foundation, 675 Mass Ave, Cambridge, MA 02139, USA.
+#
+# ===============================================================================
+
+from __future__ import print_function
+
+import shlex
+from optparse import OptionParser
+
+from svndump import __version, copy_dump_file
+from common import sdt_redirect_stdout
+from pipeline import SvnDumpTransformChain
+from props import RevisionPropertyTransformer, \
+    EolRevisionPropertyTransformer, PropertyTransformer, \
+    EolPropertyTransformer, ApplyAutoprops
+from sanitize import SanitizeDumpFile, sanitize_option_parser
+from remove_prop import RemovePropertyTransformer
+from delrevs import DeleteEmptyRevsTransformer
+from add_git_ignore import AddGitIgnoreTransformer
+
+__doc__ = """Chaining several transformations of a dump file."""
+
+
+def create_transformer(name, args):
+    """
+    Creates the transformer of a command which copies a dump file.
+
+    The arguments are those of the command without the dump files.
+
+    @type name: string
+    @param name: Name of the command, one of 'add-git-ignore',
+        'apply-autoprops', 'delete-empty-revs', 'eolfix-prop',
+        'eolfix-revprop', 'remove-prop', 'sanitize', 'transform-prop'
+        and 'transform-revprop'.
+    @type args: list( string )
+    @param args: Arguments of the command.
+    @rtype: class with method transform(dump)
+    @return: The transformer.
+    """
+
+    if name == "add-git-ignore":
+        return AddGitIgnoreTransformer()
+    elif name == "apply-autoprops":
+        autoprops = ApplyAutoprops(None, None, args[0])
+        autoprops._read_config()
+        return autoprops
+    elif name == "delete-empty-revs":
+        return DeleteEmptyRevsTransformer()
+    elif name == "eolfix-prop":
+        return EolPropertyTransformer(args[0])
+    elif name == "eolfix-revprop":
+        return EolRevisionPropertyTransformer(args[0])
+    elif name == "remove-prop":
+        return RemovePropertyTransformer(args[0], args[1])
+    elif name == "sanitize":
+        usage = "usage: --sanitize '[options]'"
+        (options, rest) = sanitize_option_parser(usage).parse_args(args)
+        if len(rest) > 0:
+            raise ValueError("unexpected sanitize arguments: %s" %
+                             " ".join(rest))
+        return SanitizeDumpFile(options)
+    elif name == "transform-prop":
+        return PropertyTransformer(args[0], args[1], args[2])
+    elif name == "transform-revprop":
+        return RevisionPropertyTransformer(args[0], args[1], args[2])
+    raise ValueError("unknown transformation '%s'" % name)
+
+
+def _add_stage(option, opt_str, value, parser):
+    """
+    Option callback appending a transformation to the list of stages.
+    """
+
+    name = opt_str[2:]
+    if value is None:
+        args = []
+    elif name == "sanitize":
+        args = shlex.split(value)
+    elif isinstance(value, tuple):
+        args = list(value)
+    else:
+        args = [value]
+    parser.values.stages.append((name, args))
+
+
+def svndump_pipeline_cmdline(appname, args):
+    """
+    Parses the commandline and executes the transformations.
+
+    Usage:
+
+        >>> svndump_pipeline_cmdline( sys.argv[0], sys.argv[1:] )
+
+    @type appname: string
+    @param appname: Name of the application (used in help text).
+    @type args: list( string )
+    @param args: Commandline arguments.
+    @rtype: integer
+    @return: Return code (0 = OK).
+    """
+
+    usage = "usage: %s [options] source destination\n\n" % appname
+    usage += "Copies a dump file once doing all the specified " \
+             "transformations\nin the order they are given."
+    parser = OptionParser(usage=usage, version="%prog " + __version)
+    parser.set_defaults(stages=[])
+    parser.add_option("--sanitize",
+                      action="callback", callback=_add_stage,
+                      type="string", metavar="OPTIONS",
+                      help="sanitize, OPTIONS are the options of the "
+                           "sanitize command as one argument")
+    parser.add_option("--remove-prop",
+                      action="callback", callback=_add_stage,
+                      type="string", nargs=2, metavar="PROPNAME REGEX",
+                      help="remove properties with values matching REGEX")
+    parser.add_option("--delete-empty-revs",
+                      action="callback", callback=_add_stage,
+                      help="delete empty revisions")
+    parser.add_option("--add-git-ignore",
+                      action="callback", callback=_add_stage,
+                      help="add .gitignore files for svn:ignore properties")
+    parser.add_option("--apply-autoprops",
+                      action="callback", callback=_add_stage,
+                      type="string", metavar="CONFIGFILE",
+                      help="apply the auto-props of a Subversion config file")
+    parser.add_option("--transform-prop",
+                      action="callback", callback=_add_stage,
+                      type="string", nargs=3,
+                      metavar="PROPNAME REGEX REPLACE",
+                      help="transform a node property")
+    parser.add_option("--transform-revprop",
+                      action="callback", callback=_add_stage,
+                      type="string", nargs=3,
+                      metavar="PROPNAME REGEX REPLACE",
+                      help="transform a revision property")
+    parser.add_option("--eolfix-prop",
+                      action="callback", callback=_add_stage,
+                      type="string", metavar="PROPNAME",
+                      help="fix EOL of a node property")
+    parser.add_option("--eolfix-revprop",
+                      action="callback", callback=_add_stage,
+                      type="string", metavar="PROPNAME",
+                      help="fix EOL of a revision property")
+    parser.add_option("-j", "--jobs",
+                      action="store", type="int", dest="jobs", default=1,
+                      help="number of processes copying the dump file "
+                           "(only if all transformations support it)")
+    (options, args) = parser.parse_args(args)
+
+    if len(args) != 2:
+        print("specify exactly one source and one destination dump file.")
+        return 1
+    if len(options.stages) == 0:
+        print("specify at least one transformation.")
+        return 1
+    if args[1] == "-":
+        sdt_redirect_stdout()
+
+    transformers = []
+    for name, stageargs in options.stages:
+        transformers.append(create_transformer(name, stageargs))
+    copy_dump_file(args[0], args[1], SvnDumpTransformChain(transformers),
+                   options.jobs)
+    return 0
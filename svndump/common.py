@@ -23,7 +23,12 @@
 from __future__ import print_function
 
 import calendar
+import os
+import re
+import sys
+import threading
 import time
+from mmap import mmap
 
 try:
     import hashlib
@@ -37,15 +42,97 @@ __doc__ = """Common functions and classes."""
 # functions provided by the svn python bindings +++++
 # <sussman> it's our own string format, in libsvn_subr/time.c
 # <sussman> svn_time_[to|from]_cstring()
+
+# svn date strings have a fixed format: 2003-01-25T14:23:54.123456Z
+_svn_date_re = re.compile(r"(\d{4})-(\d\d)-(\d\d)T(\d\d):(\d\d):(\d\d)"
+                          r"\.(\d{6})Z\Z")
+_days_in_month = (0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+
+
+def _split_svn_date_str(dateStr):
+    """
+    Split a canonical svn date string into its fields.
+
+    @type dateStr: string
+    @param dateStr: A svn date string.
+    @rtype: tuple( integer )
+    @return: Year, month, day, hour, minute, second and micros or None
+        if the string is not a canonical svn date string (wrong format or
+        fields out of range).
+    """
+
+    match = _svn_date_re.match(dateStr)
+    if match is None:
+        return None
+    fields = tuple([int(f) for f in match.groups()])
+    year, month, day, hour, minute, second = fields[:6]
+    if year < 1970 or month < 1 or month > 12 or day < 1 or \
+            hour > 23 or minute > 59 or second > 59:
+        return None
+    if day > _days_in_month[month]:
+        if month != 2 or day != 29 or not calendar.isleap(year):
+            return None
+    return fields
+
+
+def _svn_timegm(year, month, day, hour, minute, second):
+    """
+    Convert a UTC date to time_t, like calendar.timegm() but faster.
+    """
+
+    # days since 1970-01-01 of the proleptic gregorian calendar
+    if month <= 2:
+        year -= 1
+        month += 9
+    else:
+        month -= 3
+    era = year // 400
+    yoe = year - era * 400
+    doy = (153 * month + 2) // 5 + day - 1
+    doe = yoe * 365 + yoe // 4 - yoe // 100 + doy
+    days = era * 146097 + doe - 719468
+    return ((days * 24 + hour) * 60 + minute) * 60 + second
+
+
+def is_canonical_svn_date_str(dateStr):
+    """
+    Checks whether a string is a valid svn date string in canonical form.
+
+    For a canonical date string create_svn_date_str(parse_svn_date_str(s))
+    returns s again, so it can be used as is.
+
+    @type dateStr: string
+    @param dateStr: A svn date string.
+    @rtype: bool
+    @return: True if the string is a canonical svn date string.
+    """
+
+    # all fields have a fixed width so they can be compared as strings
+    match = _svn_date_re.match(dateStr)
+    if match is None:
+        return False
+    year, month, day, hour, minute, second, micros = match.groups()
+    if year < "1970" or month < "01" or month > "12" or day < "01" or \
+            hour > "23" or minute > "59" or second > "59":
+        return False
+    if day > "28":
+        return _split_svn_date_str(dateStr) is not None
+    return True
+
+
 def parse_svn_date_str(dateStr):
     """
     Parse a svn date string and return a tuple containing time_t and micros.
     """
 
+    fields = _split_svn_date_str(dateStr)
+    if fields is not None:
+        return _svn_timegm(*fields[:6]), fields[6]
     if len(dateStr) != 27:
         return 0, 0
     if dateStr[19] != "." or dateStr[26] != "Z":
         return 0, 0
+    # not canonical (leap second for example), let the time module handle it
     dat = time.strptime(dateStr[:19], "%Y-%m-%dT%H:%M:%S")
     return int(calendar.timegm(dat)), int(dateStr[20:26])
 
@@ -56,9 +143,9 @@ def create_svn_date_str(dateTuple):
     """
 
     dat = time.gmtime(dateTuple[0])
-    dstr = time.strftime("%Y-%m-%dT%H:%M:%S", dat)
-    mstr = ".%06dZ" % (dateTuple[1])
-    return dstr + mstr
+    return "%04d-%02d-%02dT%02d:%02d:%02d.%06dZ" % (dat[0], dat[1], dat[2],
+                                                    dat[3], dat[4], dat[5],
+                                                    dateTuple[1])
 
 
 def is_valid_md5_string(md5):
@@ -95,34 +182,187 @@ def is_valid_sha1_string(sha1):
     return True
 
 
+def is_valid_sha256_string(sha256):
+    """
+    Checks a sha256 string.
+
+    @type sha256: object
+    @param sha256: SHA256 string.
+    @rtype: bool
+    @return: True if the string looks like an sha256 sum.
+    """
+
+    if len(sha256) != 64:
+        return False
+    if sha256.lower().strip("0123456789abcdef") != "":
+        return False
+    return True
+
+
 class SvnDumpException(Exception):
     """A simple exception class."""
 
     def __init__(self, text):
+        Exception.__init__(self, text)
         self.text = text
 
     def __str__(self):
         return self.text
 
 
-class ListDictIter:
+def parse_prop_block(data):
+    """
+    Parse the properties of a node or revision.
+
+    @type data: string
+    @param data: The properties including PROPS-END.
+    @rtype: dict( string -> string )
+    @return: A dict containing the properties or None if data isn't a
+        valid property block.
+    """
+
+    end = len(data) - 10
+    if end < 0 or data[end:] != "PROPS-END\n":
+        return None
+    props = ListDict()
+    pos = 0
+    find = data.find
+    try:
+        while pos < end:
+            # key: "K <len>" or "D <len>"
+            eol = find("\n", pos)
+            what = data[pos:pos + 2]
+            if what != "K " and what != "D ":
+                return None
+            length = int(data[pos + 2:eol])
+            if length < 0:
+                return None
+            pos = eol + 1 + length
+            key = data[eol + 1:pos]
+            if data[pos] != "\n":
+                return None
+            pos += 1
+            # value: "V <len>"
+            value = None
+            if what == "K ":
+                eol = find("\n", pos)
+                if data[pos:pos + 2] != "V ":
+                    return None
+                length = int(data[pos + 2:eol])
+                if length < 0:
+                    return None
+                pos = eol + 1 + length
+                value = data[eol + 1:pos]
+                if data[pos] != "\n":
+                    return None
+                pos += 1
+            # set property
+            props[key] = value
+    except (ValueError, IndexError):
+        return None
+    if pos != end:
+        return None
+    return props
+
+
+def create_prop_string(properties):
+    """
+    Create a string from a dict containing properties.
+
+    @type properties: dict( string -> string )
+    @param properties: A dict containing the properties.
+    @rtype: string
+    @return: A string containing the properties.
+    """
+
+    if properties is None:
+        return ""
+    parts = []
+    for key, val in properties.items():
+        if val is not None:
+            # add/change property
+            parts.extend(("K ", str(len(key)), "\n", key, "\nV ",
+                          str(len(val)), "\n", val, "\n"))
+        else:
+            # delete property
+            parts.extend(("D ", str(len(key)), "\n", key, "\n"))
+    parts.append("PROPS-END\n")
+    return "".join(parts)
+
+
+def get_content_length(tags):
     """
-    Iterator class used by ListDict.
+    Returns the length of the content following a tag list.
+
+    That's Content-length if present, else the sum of Prop-content-length
+    and Text-content-length (older dump files).
+
+    @type tags: dict( string -> string )
+    @param tags: The tags of a revision or node record.
+    @rtype: integer
+    @return: Length of the content in bytes.
+    """
+
+    if tags.has_key("Content-length:"):
+        return int(tags["Content-length:"])
+    length = 0
+    if tags.has_key("Prop-content-length:"):
+        length += int(tags["Prop-content-length:"])
+    if tags.has_key("Text-content-length:"):
+        length += int(tags["Text-content-length:"])
+    return length
+
+
+# marks deleted keys in the key list of ListDict
+_deleted = object()
+
+
+class ListDictView:
+    """
+    A view of the keys, values or items of a ListDict.
+
+    Supports iteration, len(), 'in' and indexing (int and slice) like a
+    list but doesn't copy anything.
     """
 
     def __init__(self, listdict, type):
+        """
+        Initialize.
+
+        @type listdict: ListDict
+        @param listdict: The ListDict.
+        @type type: integer
+        @param type: 0 for items, 1 for keys, 2 for values.
+        """
         self.__listdict = listdict
         self.__type = type
-        self.__index = 0
 
     def __iter__(self):
-        return self
+        if self.__type == 1:
+            return self.__listdict.iterkeys()
+        elif self.__type == 2:
+            return self.__listdict.itervalues()
+        else:
+            return self.__listdict.iteritems()
+
+    def __len__(self):
+        return len(self.__listdict)
+
+    def __contains__(self, value):
+        if self.__type == 1:
+            return self.__listdict.has_key(value)
+        elif self.__type == 0:
+            key, value = value
+            return self.__listdict.has_key(key) and \
+                   self.__listdict[key] == value
+        for v in self:
+            if v == value:
+                return True
+        return False
 
-    def next(self):
-        index = self.__index
-        if index >= len(self.__listdict):
-            raise StopIteration()
-        self.__index = index + 1
+    def __getitem__(self, index):
+        if type(index) is slice:
+            return [self[i] for i in range(*index.indices(len(self)))]
         if self.__type == 1:
             return self.__listdict.key(index)
         elif self.__type == 2:
@@ -130,12 +370,27 @@ class ListDictIter:
         else:
             return self.__listdict.item(index)
 
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __repr__(self):
+        return repr(list(self))
+
 
 class ListDict(dict):
     """
     A mix of list and dict.
 
     If the key is an int this class acts like a list else like a dict.
+
+    The keys are kept in a list in insertion order. Deleted keys are only
+    marked as deleted in that list, it is compacted when more than half of
+    it are deleted keys. Access by index uses a Fenwick tree counting the
+    keys which are not deleted, it is built on the first access by index
+    after a delete and then updated by deletes and appends.
     """
 
     def __init__(self):
@@ -143,7 +398,72 @@ class ListDict(dict):
         Initialize.
         """
         dict.__init__(self)
-        self.__index = []
+        # keys in insertion order, deleted ones replaced by _deleted
+        self.__keys = []
+        # position of each key in self.__keys
+        self.__pos = {}
+        # count of deleted keys in self.__keys
+        self.__holes = 0
+        # Fenwick tree over self.__keys (1-based) or None if not built
+        self.__tree = None
+
+    def __compact(self):
+        """
+        Removes the deleted keys from the key list.
+        """
+        keys = [key for key in self.__keys if key is not _deleted]
+        self.__keys = keys
+        self.__pos = dict(zip(keys, range(len(keys))))
+        self.__holes = 0
+        self.__tree = None
+
+    def __build_tree(self):
+        """
+        Builds the Fenwick tree of the key list.
+        """
+        keys = self.__keys
+        n = len(keys)
+        tree = [0] * (n + 1)
+        for i in range(1, n + 1):
+            if keys[i - 1] is not _deleted:
+                tree[i] += 1
+            j = i + (i & -i)
+            if j <= n:
+                tree[j] += tree[i]
+        self.__tree = tree
+
+    def __index_key(self, index):
+        """
+        Returns the key for the given index.
+
+        @type index: int
+        @param index: Index of the key.
+        @rtype: object
+        @return: A key.
+        """
+        if self.__holes == 0:
+            return self.__keys[index]
+        count = len(self)
+        if index < 0:
+            index += count
+        if index < 0 or index >= count:
+            raise IndexError("ListDict index out of range")
+        if self.__tree is None:
+            self.__build_tree()
+        # find the slot of the (index+1)th key
+        tree = self.__tree
+        n = len(tree) - 1
+        pos = 0
+        rest = index + 1
+        step = 1
+        while step * 2 <= n:
+            step *= 2
+        while step > 0:
+            if pos + step <= n and tree[pos + step] < rest:
+                pos += step
+                rest -= tree[pos]
+            step //= 2
+        return self.__keys[pos]
 
     def __delitem__(self, key):
         """
@@ -153,12 +473,20 @@ class ListDict(dict):
         @param key: Index or key.
         """
         if type(key) is int:
-            index = key
-            key = self.__index[index]
-        else:
-            index = self.__index.index(key)
-        del self.__index[index]
+            key = self.__index_key(key)
         dict.__delitem__(self, key)
+        pos = self.__pos.pop(key)
+        self.__keys[pos] = _deleted
+        self.__holes += 1
+        if self.__holes > 32 and self.__holes * 2 > len(self.__keys):
+            self.__compact()
+        elif self.__tree is not None:
+            tree = self.__tree
+            n = len(tree) - 1
+            i = pos + 1
+            while i <= n:
+                tree[i] -= 1
+                i += i & -i
 
     def __getitem__(self, key):
         """
@@ -170,17 +498,17 @@ class ListDict(dict):
         @return: An object.
         """
         if type(key) is int:
-            key = self.__index[key]
+            key = self.__index_key(key)
         return dict.__getitem__(self, key)
 
     def __iter__(self):
         """
-        Returns an iterator returning key/value tuples ordered by index.
+        Returns an iterator returning the keys ordered by index.
 
         @rtype: iterator
-        @return: An iterator over the items.
+        @return: An iterator over the keys.
         """
-        return ListDictIter(self, 1)
+        return self.iterkeys()
 
     def __setitem__(self, key, value):
         """
@@ -194,9 +522,21 @@ class ListDict(dict):
         @param value: A value.
         """
         if type(key) is int:
-            key = self.__index[key]
-        if not self.has_key(key):
-            self.__index.append(key)
+            key = self.__index_key(key)
+        elif key not in self:
+            keys = self.__keys
+            self.__pos[key] = len(keys)
+            keys.append(key)
+            tree = self.__tree
+            if tree is not None:
+                # the new node counts itself and the nodes it covers
+                i = len(keys)
+                count = 1
+                j = 1
+                while j < i & -i:
+                    count += tree[i - j]
+                    j *= 2
+                tree.append(count)
         dict.__setitem__(self, key, value)
 
     def clear(self):
@@ -205,7 +545,10 @@ class ListDict(dict):
         """
 
         dict.clear(self)
-        self.__index = []
+        self.__keys = []
+        self.__pos = {}
+        self.__holes = 0
+        self.__tree = None
 
     def item(self, index):
         """
@@ -216,20 +559,17 @@ class ListDict(dict):
         @rtype: tuple
         @return: An item (key/value pair).
         """
-        key = self.__index[index]
+        key = self.__index_key(index)
         return key, dict.__getitem__(self, key)
 
     def items(self):
         """
-        Returns a list of key/value tuples ordered by index.
+        Returns a view of the key/value tuples ordered by index.
 
-        @rtype: list
-        @return: A list of values.
+        @rtype: ListDictView
+        @return: A view of the items.
         """
-        ret = []
-        for key in self.__index:
-            ret.append((key, dict.__getitem__(self, key)))
-        return ret
+        return ListDictView(self, 0)
 
     def iteritems(self):
         """
@@ -238,7 +578,10 @@ class ListDict(dict):
         @rtype: iterator
         @return: An iterator over the items.
         """
-        return ListDictIter(self, 0)
+        for key in self.__keys:
+            # the key list may have been compacted in the meantime
+            if key is not _deleted and key in self:
+                yield key, dict.__getitem__(self, key)
 
     def iterkeys(self):
         """
@@ -247,7 +590,9 @@ class ListDict(dict):
         @rtype: iterator
         @return: An iterator over the keys.
         """
-        return ListDictIter(self, 1)
+        for key in self.__keys:
+            if key is not _deleted and key in self:
+                yield key
 
     def itervalues(self):
         """
@@ -256,7 +601,9 @@ class ListDict(dict):
         @rtype: iterator
         @return: An iterator over the values.
         """
-        return ListDictIter(self, 2)
+        for key in self.__keys:
+            if key is not _deleted and key in self:
+                yield dict.__getitem__(self, key)
 
     def key(self, index):
         """
@@ -267,28 +614,25 @@ class ListDict(dict):
         @rtype: object
         @return: A key.
         """
-        return self.__index[index]
+        return self.__index_key(index)
 
     def keys(self):
         """
-        Returns a list of keys ordered by index.
+        Returns a view of the keys ordered by index.
 
-        @rtype: list
-        @return: A list of keys.
+        @rtype: ListDictView
+        @return: A view of the keys.
         """
-        return self.__index
+        return ListDictView(self, 1)
 
     def values(self):
         """
-        Returns a list of values ordered by index.
+        Returns a view of the values ordered by index.
 
-        @rtype: list
-        @return: A list of values.
+        @rtype: ListDictView
+        @return: A view of the values.
         """
-        ret = []
-        for key in self.__index:
-            ret.append(dict.__getitem__(self, key))
-        return ret
+        return ListDictView(self, 2)
 
 
 def sdt_md5():
@@ -298,3 +642,351 @@ def sdt_md5():
     For compatibility with python <2.5.
     """
     return hashlib.md5()
+
+
+# calculate sha256 sums of texts, see sdt_set_sha256()
+_sdt_sha256 = False
+
+
+def sdt_set_sha256(enable):
+    """
+    Enables or disables calculation of SHA256 sums of node texts.
+
+    Dump files contain only MD5 and SHA1 sums, if enabled the SHA256 sums
+    of texts set with SvnDumpNode.set_text_file() are calculated too.
+
+    @type enable: bool
+    @param enable: New value for the flag.
+    """
+
+    global _sdt_sha256
+    _sdt_sha256 = enable
+
+
+def is_sha256_enabled():
+    """
+    Returns True if SHA256 sums of node texts are calculated.
+
+    @rtype: bool
+    @return: The value set with sdt_set_sha256().
+    """
+    return _sdt_sha256
+
+
+class TextDigest:
+    """
+    Calculates length, MD5, SHA1 and optionally SHA256 sum of a text.
+
+    All sums are calculated from the same data, so the text has to be read
+    only once.
+    """
+
+    def __init__(self, sha256=None):
+        """
+        Initialize.
+
+        @type sha256: bool
+        @param sha256: Calculate the SHA256 sum too, None to use the value
+            set with sdt_set_sha256().
+        """
+
+        if sha256 is None:
+            sha256 = _sdt_sha256
+        self.__length = 0
+        self.__md5 = sdt_md5()
+        self.__sha1 = hashlib.sha1()
+        self.__sha256 = None
+        if sha256:
+            self.__sha256 = hashlib.sha256()
+
+    def update(self, data):
+        """
+        Adds data to the text.
+
+        @type data: string
+        @param data: The data.
+        """
+
+        self.__length += len(data)
+        self.__md5.update(data)
+        self.__sha1.update(data)
+        if self.__sha256 is not None:
+            self.__sha256.update(data)
+
+    def get_length(self):
+        """
+        Returns the length of the text.
+
+        @rtype: integer
+        @return: Length of the text.
+        """
+        return self.__length
+
+    def get_md5(self):
+        """
+        Returns the MD5 sum of the text.
+
+        @rtype: string
+        @return: The MD5 sum as hex string.
+        """
+        return self.__md5.hexdigest()
+
+    def get_sha1(self):
+        """
+        Returns the SHA1 sum of the text.
+
+        @rtype: string
+        @return: The SHA1 sum as hex string.
+        """
+        return self.__sha1.hexdigest()
+
+    def get_sha256(self):
+        """
+        Returns the SHA256 sum of the text.
+
+        @rtype: string
+        @return: The SHA256 sum as hex string or an empty string if not
+            calculated.
+        """
+
+        if self.__sha256 is None:
+            return ""
+        return self.__sha256.hexdigest()
+
+
+class TextDigestWriter:
+    """
+    A file object wrapper calculating the digests of the written data.
+
+    Used by commands writing new node texts to temp files, so the texts
+    don't need to be read again to calculate their sums.
+    """
+
+    def __init__(self, fileobj):
+        """
+        Initialize.
+
+        @type fileobj: file object
+        @param fileobj: A file object opened for writing.
+        """
+
+        self.__file = fileobj
+        self.__digest = TextDigest()
+
+    def write(self, data):
+        """
+        Writes data to the file.
+
+        @type data: string
+        @param data: The data.
+        """
+
+        self.__digest.update(data)
+        self.__file.write(data)
+
+    def writelines(self, lines):
+        """
+        Writes a sequence of strings to the file.
+
+        @type lines: list( string )
+        @param lines: The strings.
+        """
+
+        for line in lines:
+            self.write(line)
+
+    def close(self):
+        """
+        Closes the file.
+        """
+        self.__file.close()
+
+    def get_digest(self):
+        """
+        Returns the digests of the data written so far.
+
+        @rtype: TextDigest
+        @return: The digests.
+        """
+        return self.__digest
+
+
+def sdt_buffer(obj, offset, length):
+    """
+    Returns a zero-copy slice of obj (a string or mmap object).
+
+    Uses buffer() for python 2 and memoryview for python 3.
+
+    @type obj: object supporting the buffer interface
+    @param obj: The object to slice.
+    @type offset: integer
+    @param offset: Start offset.
+    @type length: integer
+    @param length: Length of the slice.
+    @rtype: buffer or memoryview
+    @return: The slice.
+    """
+    try:
+        return buffer(obj, offset, length)
+    except NameError:
+        return memoryview(obj)[offset:offset + length]
+
+
+# files opened by sdt_digest_file_ranges(), { filename -> file object }
+_digest_files = {}
+
+
+def sdt_digest_file_ranges(filename, ranges):
+    """
+    Calculates MD5 and/or SHA1 sums of byte ranges of a file.
+
+    This function is used by the worker processes of the parallel digest
+    check (see SvnDumpFileWithHistory.set_check_workers()), each process
+    keeps the file open. os.pread is used if available.
+
+    @type filename: string
+    @param filename: Name of the file.
+    @type ranges: list( tuple( integer, integer, bool, bool ) )
+    @param ranges: List of (offset, length, md5, sha1) tuples.
+    @rtype: list( tuple( string, string ) )
+    @return: List of (md5, sha1) hex digests, None for digests not
+        requested.
+    """
+
+    fileobj = _digest_files.get(filename)
+    if fileobj is None:
+        fileobj = open(filename, "rb")
+        _digest_files[filename] = fileobj
+    pread = getattr(os, "pread", None)
+    results = []
+    for offset, length, domd5, dosha1 in ranges:
+        mds = []
+        if domd5:
+            mds.append(sdt_md5())
+        if dosha1:
+            mds.append(hashlib.sha1())
+        if pread is None:
+            fileobj.seek(offset)
+        while length > 0:
+            count = min(length, _copy_buffer_size)
+            if pread is not None:
+                data = pread(fileobj.fileno(), count, offset)
+            else:
+                data = fileobj.read(count)
+            if len(data) == 0:
+                raise SvnDumpException("unexpected end of file %s" % filename)
+            for md in mds:
+                md.update(data)
+            offset += len(data)
+            length -= len(data)
+        digests = [md.hexdigest() for md in mds]
+        md5sum = None
+        sha1sum = None
+        if domd5:
+            md5sum = digests.pop(0)
+        if dosha1:
+            sha1sum = digests.pop(0)
+        results.append((md5sum, sha1sum))
+    return results
+
+
+# size of the buffer used by sdt_copy_file_range()
+_copy_buffer_size = 1048576
+# data up to this size is copied without the buffer
+_small_copy_size = 65536
+# the copy buffer of each thread, writer threads copy concurrently
+_copy_buffers = threading.local()
+
+
+def sdt_copy_file_range(srcfile, offset, length, dstfile):
+    """
+    Copies a part of a file to the current position of an other file.
+
+    The data is copied using readinto() and a buffer which is allocated
+    once per thread and then reused, or written directly if srcfile is
+    memory mapped.
+
+    @type srcfile: file object
+    @param srcfile: The file to copy from.
+    @type offset: integer
+    @param offset: Offset of the data in srcfile.
+    @type length: integer
+    @param length: Count of bytes to copy.
+    @type dstfile: file object
+    @param dstfile: The file to copy to.
+    """
+
+    if length <= 0:
+        return
+    if isinstance(srcfile, mmap):
+        dstfile.write(sdt_buffer(srcfile, offset, length))
+        return
+    srcfile.seek(offset)
+    if length <= _small_copy_size:
+        # small amounts of data are read and written at once, they end up
+        # in the write buffer of dstfile together with the record headers
+        data = srcfile.read(length)
+        if len(data) != length:
+            raise SvnDumpException("unexpected end of file")
+        dstfile.write(data)
+        return
+    view = getattr(_copy_buffers, "view", None)
+    if view is None:
+        view = memoryview(bytearray(_copy_buffer_size))
+        _copy_buffers.view = view
+    readinto = getattr(srcfile, "readinto", None)
+    while length > 0:
+        count = min(length, _copy_buffer_size)
+        if readinto is not None:
+            count = readinto(view[:count])
+            data = view[:count]
+        else:
+            data = srcfile.read(count)
+            count = len(data)
+        if count == 0:
+            raise SvnDumpException("unexpected end of file")
+        dstfile.write(data)
+        length -= count
+
+
+# stdout when a dump file is written to it, see sdt_dump_stdout()
+_dump_stdout = None
+
+
+def sdt_dump_stdout():
+    """
+    Returns stdout for writing a dump file to it.
+
+    sys.stdout isn't changed, see sdt_redirect_stdout().
+
+    @rtype: file object
+    @return: The original stdout.
+    """
+
+    global _dump_stdout
+    if _dump_stdout is None:
+        stdout = sys.stdout
+        stdout.flush()
+        if hasattr(stdout, "buffer"):
+            _dump_stdout = stdout.buffer
+        else:
+            # python 2 opens stdout in text mode which doesn't accept
+            # buffers or memoryviews
+            try:
+                _dump_stdout = os.fdopen(os.dup(stdout.fileno()), "wb")
+            except (AttributeError, EnvironmentError, ValueError):
+                _dump_stdout = stdout
+    return _dump_stdout
+
+
+def sdt_redirect_stdout():
+    """
+    Redirects sys.stdout to stderr for writing a dump file to stdout.
+
+    Messages printed while processing would end up in the dump file. Only
+    the commandline functions call this, library functions writing a dump
+    file to '-' leave sys.stdout alone.
+    """
+
+    sdt_dump_stdout()
+    sys.stdout = sys.stderr
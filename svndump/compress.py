@@ -0,0 +1,718 @@
+# ===============================================================================
+#
+# Copyright (C) 2003 Martin Furter <mf@rola.ch>
+#
+# This file is part of SvnDumpTool
+#
+# SvnDumpTool is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# SvnDumpTool is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with SvnDumpTool; see the file COPYING.  If not, write to
+# the Free Software Foundation, 675 Mass Ave, Cambridge, MA 02139, USA.
+#
+# ===============================================================================
+
+import bisect
+import threading
+import zlib
+from collections import deque
+
+try:
+    import bz2
+except ImportError:
+    bz2 = None
+
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import multiprocessing
+    from multiprocessing.pool import ThreadPool
+except ImportError:
+    multiprocessing = None
+
+from common import SvnDumpException
+
+__doc__ = """Reading and writing compressed dump files."""
+
+# size of the chunks of compressed data fed to the decompressors
+_CHUNK_SIZE = 65536
+# initial distance of the checkpoints (in uncompressed bytes)
+_CHECKPOINT_SPAN = 4 * 1024 * 1024
+# maximum count of checkpoints holding a decompressor state
+_MAX_CHECKPOINTS = 256
+# decompressed data kept for seeking back (in uncompressed bytes)
+_WINDOW_SIZE = 16 * 1024 * 1024
+# count of checkpoints kept at half the window size behind the window
+_RECENT_CHECKPOINTS = 8
+
+# compression threads shared by all CompressingWriters, see _get_pool()
+_pool = None
+_pool_threads = 0
+_pool_lock = threading.Lock()
+
+
+def _gzip_decompressor():
+    return zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+
+def _bzip2_decompressor():
+    return bz2.BZ2Decompressor()
+
+
+def _xz_decompressor():
+    return lzma.LZMADecompressor()
+
+
+def _zstd_decompressor():
+    return zstandard.ZstdDecompressor().decompressobj()
+
+
+def _gzip_compress(data):
+    compobj = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compobj.compress(data) + compobj.flush()
+
+
+def _bzip2_compress(data):
+    return bz2.compress(data, 9)
+
+
+def _xz_compress(data):
+    return lzma.compress(data, preset=6)
+
+
+def _zstd_compress(data):
+    return zstandard.ZstdCompressor(level=3).compress(data)
+
+
+# compression formats: name, magic bytes, filename extension, python module,
+# decompressor factory, block compression function, block size
+_FORMATS = [
+    ("gzip", "\x1f\x8b", ".gz", zlib,
+     _gzip_decompressor, _gzip_compress, 1024 * 1024),
+    ("bzip2", "BZh", ".bz2", bz2,
+     _bzip2_decompressor, _bzip2_compress, 900 * 1000),
+    ("xz", "\xfd7zXZ\x00", ".xz", lzma,
+     _xz_decompressor, _xz_compress, 8 * 1024 * 1024),
+    ("zstd", "\x28\xb5\x2f\xfd", ".zst", zstandard,
+     _zstd_decompressor, _zstd_compress, 4 * 1024 * 1024),
+]
+
+
+def _get_format(name):
+    """
+    Returns the entry of _FORMATS of a compression format.
+    """
+
+    for format in _FORMATS:
+        if format[0] == name:
+            return format
+    raise SvnDumpException("unknown compression format '%s'" % name)
+
+
+def detect_compression(fileobj):
+    """
+    Detects the compression format of a file by its magic bytes.
+
+    The magic bytes are read at the current offset of the file object
+    which is restored afterwards.
+
+    @type fileobj: file object
+    @param fileobj: A seekable file object opened for reading.
+    @rtype: string
+    @return: 'gzip', 'bzip2', 'xz', 'zstd' or None if the file is not
+        compressed.
+    """
+
+    offset = fileobj.tell()
+    head = fileobj.read(6)
+    fileobj.seek(offset)
+    for format in _FORMATS:
+        if head.startswith(format[1]):
+            return format[0]
+    return None
+
+
+def compression_by_filename(filename):
+    """
+    Returns the compression format of a file by its extension.
+
+    @type filename: string
+    @param filename: Name of the file.
+    @rtype: string
+    @return: 'gzip', 'bzip2', 'xz', 'zstd' or None if the name has none
+        of the extensions .gz, .bz2, .xz and .zst.
+    """
+
+    for format in _FORMATS:
+        if filename.endswith(format[2]):
+            return format[0]
+    return None
+
+
+def is_compressed_file(filename):
+    """
+    Returns True if a file is compressed.
+
+    @type filename: string
+    @param filename: Name of the file.
+    @rtype: bool
+    @return: True if the file is compressed.
+    """
+
+    fileobj = open(filename, "rb")
+    try:
+        return detect_compression(fileobj) is not None
+    finally:
+        fileobj.close()
+
+
+def open_dump_file(filename):
+    """
+    Opens a dump file for reading, decompressing it if it's compressed.
+
+    @type filename: string
+    @param filename: Name of the dump file.
+    @rtype: file object
+    @return: The opened file or a DecompressingReader.
+    """
+
+    fileobj = open(filename, "rb")
+    compression = detect_compression(fileobj)
+    if compression is None:
+        return fileobj
+    return DecompressingReader(fileobj, compression)
+
+
+def create_dump_file(filename, bufsize=-1):
+    """
+    Creates a dump file, compressing it if the name has the extension
+    of a compression format (see compression_by_filename()).
+
+    @type filename: string
+    @param filename: Name of the dump file.
+    @type bufsize: integer
+    @param bufsize: Size of the write buffer of an uncompressed file,
+        negative for the system default.
+    @rtype: file object
+    @return: The opened file or a CompressingWriter.
+    """
+
+    compression = compression_by_filename(filename)
+    if compression is not None:
+        _check_module(_get_format(compression), filename)
+        return CompressingWriter(open(filename, "wb"), compression)
+    return open(filename, "wb", bufsize)
+
+
+def _get_pool():
+    """
+    Returns the thread pool shared by all CompressingWriters.
+
+    The pool is created on the first call with one thread per CPU, so
+    writing several compressed files at once (like split does) doesn't
+    start more compression threads than there are CPUs.
+
+    @rtype: tuple( ThreadPool, integer )
+    @return: The pool and its count of threads.
+    """
+
+    global _pool, _pool_threads
+
+    with _pool_lock:
+        if _pool is None:
+            try:
+                _pool_threads = multiprocessing.cpu_count()
+            except NotImplementedError:
+                _pool_threads = 1
+            _pool = ThreadPool(_pool_threads)
+        return _pool, _pool_threads
+
+
+def _check_module(format, filename):
+    """
+    Raises an exception if the python module of a compression format is
+    missing.
+    """
+
+    if format[3] is None:
+        raise SvnDumpException("cannot handle %s compressed file %s, "
+                               "python module missing" %
+                               (format[0], filename))
+
+
+class DecompressingReader:
+    """
+    A seekable read-only file object returning the decompressed data of
+    a compressed file.
+
+    The decompressed data of the last _WINDOW_SIZE bytes is kept, so
+    seeking back within the current revision (to read a node text or
+    copy a raw node record) doesn't decompress anything again.
+
+    Seeking further back is done by restarting decompression at a
+    checkpoint. A checkpoint is recorded at the start of each stream of
+    the file (gzip member, bzip2 or xz stream, zstd frame). For gzip the
+    state of the decompressor is additionally saved at regular
+    distances, the distance is doubled and every second checkpoint
+    dropped whenever there are too many of them. The last few states
+    are also kept at half the window size apart, so seeking back a bit
+    more than the window size is cheap even when the checkpoints are far
+    apart.
+    """
+
+    def __init__(self, fileobj, compression, closefile=True):
+        """
+        Initialize.
+
+        @type fileobj: file object
+        @param fileobj: The compressed file, seekable and positioned at the
+            start of the compressed data.
+        @type compression: string
+        @param compression: Compression format, see detect_compression().
+        @type closefile: bool
+        @param closefile: Close fileobj in close().
+        """
+
+        format = _get_format(compression)
+        _check_module(format, getattr(fileobj, "name", ""))
+        self.name = getattr(fileobj, "name", "")
+        # the compressed file
+        self.__file = fileobj
+        self.__close_file = closefile
+        self.__magic = format[1]
+        self.__factory = format[4]
+        self.__can_copy = compression == "gzip"
+        # current decompressor, None at the start of a stream
+        self.__decomp = None
+        # offset of the next compressed data to decompress
+        self.__coffset = fileobj.tell()
+        # uncompressed offset of the next decompressed data
+        self.__end = 0
+        # window of decompressed chunks and their offsets
+        self.__chunks = []
+        self.__chunk_offsets = []
+        self.__window = 0
+        # index of the current chunk in the window
+        self.__cur = -1
+        # current chunk, its offset and the read position in it
+        self.__buf = ""
+        self.__buf_offset = 0
+        self.__pos = 0
+        # checkpoints: uncompressed offsets and (compressed offset,
+        # decompressor state) tuples
+        self.__cp_offsets = [0]
+        self.__cp_states = [(self.__coffset, None)]
+        self.__cp_span = _CHECKPOINT_SPAN
+        self.__cp_count = 0
+        self.__last_cp = 0
+        # recent checkpoints: (offset, compressed offset, state) tuples
+        self.__recent = deque(maxlen=_RECENT_CHECKPOINTS)
+
+    def __add_checkpoint(self, offset, state):
+        """
+        Records a checkpoint if it's behind the last one.
+
+        @type offset: integer
+        @param offset: Uncompressed offset.
+        @type state: decompressor object
+        @param state: Copy of the decompressor state or None for the
+            start of a stream.
+        """
+
+        if offset <= self.__cp_offsets[-1]:
+            return
+        self.__cp_offsets.append(offset)
+        self.__cp_states.append((self.__coffset, state))
+        self.__last_cp = offset
+        if state is None:
+            return
+        self.__cp_count += 1
+        if self.__cp_count <= _MAX_CHECKPOINTS:
+            return
+        # too many checkpoints, thin them out
+        offsets = []
+        states = []
+        keep = False
+        for i in range(len(self.__cp_offsets)):
+            if self.__cp_states[i][1] is not None:
+                keep = not keep
+                if not keep:
+                    self.__cp_count -= 1
+                    continue
+            offsets.append(self.__cp_offsets[i])
+            states.append(self.__cp_states[i])
+        self.__cp_offsets = offsets
+        self.__cp_states = states
+        self.__cp_span *= 2
+
+    def __set_chunk(self, index):
+        """
+        Makes a chunk of the window the current one.
+
+        @type index: integer
+        @param index: Index of the chunk.
+        """
+
+        self.__cur = index
+        self.__buf = self.__chunks[index]
+        self.__buf_offset = self.__chunk_offsets[index]
+        self.__pos = 0
+
+    def __fill(self):
+        """
+        Makes the next chunk of data the current one, decompressing it if
+        it's not in the window.
+
+        @rtype: bool
+        @return: False at the end of the file.
+        """
+
+        if self.__cur + 1 < len(self.__chunks):
+            self.__set_chunk(self.__cur + 1)
+            return True
+        while True:
+            self.__file.seek(self.__coffset)
+            data = self.__file.read(_CHUNK_SIZE)
+            if len(data) == 0:
+                return False
+            if self.__decomp is None:
+                if not data.startswith(self.__magic):
+                    # trailing garbage (zero padding for example)
+                    return False
+                self.__add_checkpoint(self.__end, None)
+                self.__decomp = self.__factory()
+            unused = ""
+            try:
+                out = self.__decomp.decompress(data)
+                unused = self.__decomp.unused_data
+                if getattr(self.__decomp, "eof", False) and len(unused) == 0:
+                    self.__decomp = None
+            except EOFError:
+                # the stream ended with the previous chunk
+                out = ""
+                unused = data
+            self.__coffset += len(data) - len(unused)
+            if len(unused) > 0:
+                self.__decomp = None
+            if len(out) == 0:
+                continue
+            self.__chunks.append(out)
+            self.__chunk_offsets.append(self.__end)
+            self.__window += len(out)
+            self.__end += len(out)
+            # drop the oldest chunks, not the new current one
+            drop = 0
+            while self.__window > _WINDOW_SIZE and \
+                    drop < len(self.__chunks) - 1:
+                self.__window -= len(self.__chunks[drop])
+                drop += 1
+            if drop > 0:
+                del self.__chunks[:drop]
+                del self.__chunk_offsets[:drop]
+            self.__set_chunk(len(self.__chunks) - 1)
+            if self.__can_copy and self.__decomp is not None:
+                if self.__end - self.__last_cp >= self.__cp_span:
+                    self.__add_checkpoint(self.__end, self.__decomp.copy())
+                if len(self.__recent) == 0 or self.__end - \
+                        self.__recent[-1][0] >= _WINDOW_SIZE // 2:
+                    self.__recent.append((self.__end, self.__coffset,
+                                          self.__decomp.copy()))
+            return True
+
+    def __restart(self, offset):
+        """
+        Restarts decompression at the last checkpoint before an offset.
+
+        @type offset: integer
+        @param offset: The uncompressed offset.
+        """
+
+        i = bisect.bisect_right(self.__cp_offsets, offset) - 1
+        cpoffset = self.__cp_offsets[i]
+        self.__coffset, state = self.__cp_states[i]
+        for recent in self.__recent:
+            if cpoffset < recent[0] <= offset:
+                cpoffset, self.__coffset, state = recent
+        if state is not None:
+            state = state.copy()
+        self.__decomp = state
+        self.__end = cpoffset
+        self.__chunks = []
+        self.__chunk_offsets = []
+        self.__window = 0
+        self.__cur = -1
+        self.__buf = ""
+        self.__buf_offset = cpoffset
+        self.__pos = 0
+
+    def read(self, size=-1):
+        """
+        Reads data.
+
+        @type size: integer
+        @param size: Count of bytes to read, negative to read all.
+        @rtype: string
+        @return: The data read, an empty string at end of file.
+        """
+
+        pos = self.__pos
+        if size >= 0 and pos + size <= len(self.__buf):
+            self.__pos = pos + size
+            return self.__buf[pos:pos + size]
+        parts = [self.__buf[pos:]]
+        count = len(parts[0])
+        self.__pos = len(self.__buf)
+        while size < 0 or count < size:
+            if not self.__fill():
+                break
+            if size >= 0 and count + len(self.__buf) > size:
+                self.__pos = size - count
+            else:
+                self.__pos = len(self.__buf)
+            parts.append(self.__buf[:self.__pos])
+            count += self.__pos
+        return "".join(parts)
+
+    def readline(self):
+        """
+        Reads one line.
+
+        @rtype: string
+        @return: The line including LF, an empty string at end of file.
+        """
+
+        pos = self.__pos
+        end = self.__buf.find("\n", pos)
+        if end >= 0:
+            self.__pos = end + 1
+            return self.__buf[pos:end + 1]
+        parts = [self.__buf[pos:]]
+        self.__pos = len(self.__buf)
+        while self.__fill():
+            end = self.__buf.find("\n")
+            if end >= 0:
+                self.__pos = end + 1
+                parts.append(self.__buf[:end + 1])
+                break
+            self.__pos = len(self.__buf)
+            parts.append(self.__buf)
+        return "".join(parts)
+
+    def tell(self):
+        """
+        Returns the current (uncompressed) offset.
+
+        @rtype: integer
+        @return: The offset.
+        """
+
+        return self.__buf_offset + self.__pos
+
+    def seek(self, offset, whence=0):
+        """
+        Sets the current (uncompressed) offset.
+
+        Seeking relative to the end of the file is not supported.
+
+        @type offset: integer
+        @param offset: The offset.
+        @type whence: integer
+        @param whence: 0 for an absolute offset, 1 for one relative to the
+            current offset.
+        """
+
+        if whence == 1:
+            offset += self.tell()
+        elif whence != 0:
+            raise IOError("cannot seek relative to the end of a "
+                          "compressed file")
+        if offset < 0:
+            raise IOError("negative seek offset %d" % offset)
+        if self.__buf_offset <= offset <= self.__buf_offset + len(self.__buf):
+            self.__pos = offset - self.__buf_offset
+            return
+        if len(self.__chunks) > 0 and \
+                self.__chunk_offsets[0] <= offset < self.__end:
+            # in the window
+            self.__set_chunk(bisect.bisect_right(self.__chunk_offsets,
+                                                 offset) - 1)
+            self.__pos = offset - self.__buf_offset
+            return
+        i = bisect.bisect_right(self.__cp_offsets, offset) - 1
+        if offset < self.__end or self.__cp_offsets[i] > self.__end:
+            # before the window or a checkpoint saves decompressing
+            self.__restart(offset)
+        elif len(self.__chunks) > 0:
+            self.__set_chunk(len(self.__chunks) - 1)
+            self.__pos = len(self.__buf)
+        while self.__end < offset:
+            if not self.__fill():
+                self.__pos = len(self.__buf)
+                return
+        self.__pos = offset - self.__buf_offset
+
+    def close(self):
+        """
+        Closes the file.
+        """
+
+        if self.__close_file:
+            self.__file.close()
+        self.__buf = ""
+        self.__chunks = []
+        self.__chunk_offsets = []
+        self.__recent.clear()
+        self.__cp_offsets = [0]
+        self.__cp_states = [(0, None)]
+
+
+class CompressingWriter:
+    """
+    A write-only file object compressing the data written to it.
+
+    The data is split into blocks which are compressed independently by a
+    pool of threads (the compression functions release the GIL), the
+    compressed blocks are written in order. By default all writers share
+    one pool with a thread per CPU. Each block is a complete gzip
+    member, bzip2 or xz stream or zstd frame, the concatenation of them is
+    a valid compressed file.
+    """
+
+    def __init__(self, fileobj, compression, threads=0, closefile=True):
+        """
+        Initialize.
+
+        @type fileobj: file object
+        @param fileobj: The file to write the compressed data to.
+        @type compression: string
+        @param compression: Compression format, see detect_compression().
+        @type threads: integer
+        @param threads: Count of compression threads of a pool used only
+            by this writer, 0 means the shared pool (see _get_pool()).
+        @type closefile: bool
+        @param closefile: Close fileobj in close().
+        """
+
+        format = _get_format(compression)
+        _check_module(format, getattr(fileobj, "name", ""))
+        self.name = getattr(fileobj, "name", "")
+        # the compressed file
+        self.__file = fileobj
+        self.__close_file = closefile
+        self.__compress = format[5]
+        self.__block_size = format[6]
+        # data of the current block
+        self.__buf = bytearray()
+        # count of bytes written
+        self.__offset = 0
+        # compressed blocks not written yet
+        self.__pending = deque()
+        self.__pool = None
+        # the pool is terminated in close()
+        self.__own_pool = False
+        if multiprocessing is not None:
+            if threads <= 0:
+                self.__pool, threads = _get_pool()
+            else:
+                self.__pool = ThreadPool(threads)
+                self.__own_pool = True
+            # limits the memory used by blocks waiting for compression
+            self.__max_pending = threads * 2
+
+    def __submit(self):
+        """
+        Hands the current block over to the compression threads.
+        """
+
+        block = bytes(self.__buf)
+        self.__buf = bytearray()
+        if self.__pool is None:
+            self.__file.write(self.__compress(block))
+            return
+        self.__pending.append(self.__pool.apply_async(self.__compress,
+                                                      (block,)))
+        while len(self.__pending) > self.__max_pending:
+            self.__file.write(self.__pending.popleft().get())
+
+    def write(self, data):
+        """
+        Writes data.
+
+        @type data: string or buffer
+        @param data: The data to write.
+        """
+
+        self.__buf.extend(data)
+        self.__offset += len(data)
+        if len(self.__buf) >= self.__block_size:
+            self.__submit()
+
+    def writelines(self, lines):
+        """
+        Writes a list of strings.
+
+        @type lines: list( string )
+        @param lines: The strings to write.
+        """
+
+        for line in lines:
+            self.write(line)
+
+    def flush(self):
+        """
+        Writes the blocks which have been compressed already.
+
+        The data of the current block is kept until the block is full.
+        """
+
+        while len(self.__pending) > 0 and self.__pending[0].ready():
+            self.__file.write(self.__pending.popleft().get())
+        self.__file.flush()
+
+    def tell(self):
+        """
+        Returns the count of (uncompressed) bytes written.
+
+        @rtype: integer
+        @return: The offset.
+        """
+
+        return self.__offset
+
+    def close(self):
+        """
+        Compresses and writes the remaining data and closes the file.
+        """
+
+        try:
+            if len(self.__buf) > 0:
+                self.__submit()
+            while len(self.__pending) > 0:
+                self.__file.write(self.__pending.popleft().get())
+        finally:
+            if self.__own_pool:
+                self.__pool.terminate()
+                self.__pool.join()
+            self.__pool = None
+            self.__pending.clear()
+            if self.__close_file:
+                self.__file.close()
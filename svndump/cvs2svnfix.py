@@ -26,8 +26,10 @@ import sys
 from optparse import OptionParser
 
 from svndump import __version, copy_dump_file
-from common import create_svn_date_str
+from common import create_svn_date_str, sdt_redirect_stdout
 from file import SvnDumpFile
+from index import get_copy_sources
+from tree import SvnDumpTree
 
 __doc__ = """Various tools."""
 
@@ -45,7 +47,7 @@ class SvnDumpCvs2SvnFix:
         Initialize.
         """
 
-        self.__history = {}
+        self.__history = SvnDumpTree()
 
     def execute(self, inputfile, outputfile):
         """
@@ -63,7 +65,7 @@ class SvnDumpCvs2SvnFix:
         outdump = SvnDumpFile()
         outdump.create_like(outputfile, indump)
         rc = 0
-        self.__history = {}
+        self.__history.set_kept_revs(get_copy_sources(inputfile))
 
         while has_rev and rc == 0:
             outdump.add_rev(indump.get_rev_props())
@@ -158,31 +160,12 @@ class SvnDumpCvs2SvnFix:
         @rtype: string
         @return: "dir" for dirs, "file" for files or None.
         """
-        if not self.__history.has_key(path):
+        kind = self.__history.get_kind(revnr, path)
+        if kind is None:
             return None
-        nodehist = self.__history[path]
-        i = self.__rev_index(nodehist, revnr)
-        if i is None:
-            return None
-        return nodehist[0]
-
-    def __rev_index(self, nodehist, revnr):
-        """
-        Returns the index into the node history or None.
-
-        @type nodehist: list
-        @param nodehist: History of a node.
-        @type revnr: int
-        @param revnr: Current revision number.
-        """
-        i = len(nodehist) - 1
-        while i > 0 and revnr < nodehist[i][0]:
-            i -= 1
-        if i == 0:
-            return None
-        if revnr > nodehist[i][1] >= 0:
-            return None
-        return i
+        if kind == "F":
+            return "file"
+        return "dir"
 
     def __add_node(self, revnr, node):
         """
@@ -193,33 +176,15 @@ class SvnDumpCvs2SvnFix:
         @type node: SvnDumpNode
         @param node: Node to add.
         """
-        path = node.get_path()
-        if not self.__history.has_key(path):
-            # create revision list for path
-            self.__history[path] = [(node.get_kind())]
-        # add revision range
-        self.__history[path].append([revnr, -1])
-        kind = self.__history[path][0]
-        # continue only if it's a dir with copy-from
-        if kind == "file" or not node.has_copy_from():
-            return
-        # recursive copy
-        cfpath = node.get_copy_from_path() + "/"
-        cfpathlen = len(cfpath)
-        cfrev = node.get_copy_from_rev()
-        path += "/"
-        for cfnodepath in self.__history.keys()[:]:
-            if cfnodepath.startswith(cfpath):
-                cfnodehist = self.__history[cfnodepath]
-                i = self.__rev_index(cfnodehist, cfrev)
-                if i is not None:
-                    npath = path + cfnodepath[cfpathlen:]
-                    # add new path
-                    if not self.__history.has_key(npath):
-                        # create revision list for npath
-                        self.__history[npath] = [cfnodehist[0]]
-                    # add revision range
-                    self.__history[npath].append([revnr, -1])
+        kind = "D"
+        if node.get_kind() == "file":
+            kind = "F"
+        if node.has_copy_from():
+            self.__history.add(revnr, node.get_path(), kind,
+                               node.get_copy_from_path(),
+                               node.get_copy_from_rev())
+        else:
+            self.__history.add(revnr, node.get_path(), kind)
 
     def __delete_node(self, revnr, node):
         """
@@ -230,20 +195,7 @@ class SvnDumpCvs2SvnFix:
         @type node: SvnDumpNode
         @param node: Node to add.
         """
-        # set end revision
-        path = node.get_path()
-        self.__history[path][-1][1] = revnr - 1
-        kind = self.__history[path][0]
-        # continue only if it's a dir
-        if kind == "file":
-            return
-        # recursive delete
-        path += "/"
-        for nodepath in self.__history.keys()[:]:
-            if nodepath.startswith(path):
-                nodehist = self.__history[nodepath]
-                if nodehist[-1][1] == -1:
-                    nodehist[-1][1] = revnr - 1
+        self.__history.delete(revnr, node.get_path())
 
 
 def svndump_cvs2svnfix_cmdline(appname, args):
@@ -270,5 +222,7 @@ def svndump_cvs2svnfix_cmdline(appname, args):
     if len(args) != 2:
         print("Please specify exactly one input and one output file name.")
         return 1
+    if args[1] == "-":
+        sdt_redirect_stdout()
 
     return c2sfix.execute(args[0], args[1])
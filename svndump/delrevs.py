@@ -25,7 +25,24 @@ from __future__ import print_function
 
 from optparse import OptionParser
 
-from svndump import __version, SvnDumpFile
+from svndump import __version, copy_dump_file
+from common import sdt_redirect_stdout
+
+
+class DeleteEmptyRevsTransformer:
+    """
+    A class dropping all revisions without nodes.
+
+    Copy-from revisions referring to a dropped revision are mapped to the
+    revision preceding it.
+    """
+
+    pipeline_safe = True
+
+    def transform(self, dump):
+        if dump.get_node_count() == 0:
+            print("Dropping empty revision: %d." % dump.get_rev_nr())
+            dump.drop()
 
 
 def copy_without_empty_revs(srcfile, dstfile):
@@ -38,37 +55,7 @@ def copy_without_empty_revs(srcfile, dstfile):
     @param dstfile: Destination filename.
     """
 
-    # SvnDumpFile classes for reading/writing dumps
-    srcdmp = SvnDumpFile()
-    dstdmp = SvnDumpFile()
-
-    # open source file
-    srcdmp.open(srcfile)
-    # used to ensure that copyfrom-revs are correct after the copy.  If
-    # there are any empty revision in the source dump file, the copyfrom-revs
-    # could be affected.
-    revmap = {}
-    hasrev = srcdmp.read_next_rev()
-    if hasrev:
-        # create the dump file
-        dstdmp.create_like(dstfile, srcdmp)
-        # now copy all the revisions
-        while hasrev:
-            if srcdmp.get_node_count() > 0:
-                for node in srcdmp.get_nodes_iter():
-                    if node.has_copy_from():
-                        node.set_copy_from(node.get_copy_from_path(), revmap[node.get_copy_from_rev()])
-                dstdmp.add_rev_from_dump(srcdmp)
-            else:
-                print("Dropping empty revision: %d." % srcdmp.get_rev_nr())
-            revmap[srcdmp.get_rev_nr()] = dstdmp.get_rev_nr()
-            hasrev = srcdmp.read_next_rev()
-    else:
-        print("no revisions in the source dump '%s' ???" % srcfile)
-
-    # cleanup
-    srcdmp.close()
-    dstdmp.close()
+    copy_dump_file(srcfile, dstfile, DeleteEmptyRevsTransformer())
 
 
 def svndump_delete_empty_revs(appname, args):
@@ -94,6 +81,8 @@ def svndump_delete_empty_revs(appname, args):
     if len(args) != 2:
         print("specify a source dump file and a destination dump file")
         return 1
+    if args[1] == "-":
+        sdt_redirect_stdout()
 
     copy_without_empty_revs(args[0], args[1], )
     return 0
@@ -511,6 +511,8 @@ class SvnDumpDiff:
         # open files
         dump1 = SvnDumpFile()
         dump2 = SvnDumpFile()
+        dump1.set_use_mmap(True)
+        dump2.set_use_mmap(True)
         dump1.open(self.__filename1)
         dump2.open(self.__filename2)
 
@@ -533,12 +535,13 @@ class SvnDumpDiff:
             # next revision...
             callback.next_revision(dump1.get_rev_nr(), dump2.get_rev_nr())
 
-            # compare rev date
-            if dump1.get_rev_date() != dump2.get_rev_date():
-                callback.rev_diff("RevDate",
-                                  str(dump1.get_rev_date()),
-                                  str(dump2.get_rev_date()))
+            # compare rev date (the date strings are canonical, if they
+            # are equal the dates are equal too and needn't be parsed)
             if dump1.get_rev_date_str() != dump2.get_rev_date_str():
+                if dump1.get_rev_date() != dump2.get_rev_date():
+                    callback.rev_diff("RevDate",
+                                      str(dump1.get_rev_date()),
+                                      str(dump2.get_rev_date()))
                 callback.rev_diff("RevDateStr", dump1.get_rev_date_str(), dump2.get_rev_date_str())
 
             # compare rev author
@@ -653,6 +656,8 @@ class SvnDumpDiff:
             callback.node_diff("TextLen", node1.get_text_length(), node2.get_text_length())
         if node1.get_text_md5() != node2.get_text_md5():
             callback.node_diff("TextMD5", node1.get_text_md5(), node2.get_text_md5())
+        if self.__compare_text_buffers(node1, node2, callback):
+            return
         md1 = sdt_md5()
         md2 = sdt_md5()
         handle1 = node1.text_open()
@@ -763,6 +768,47 @@ class SvnDumpDiff:
         elif cmpmode == 2:
             callback.text_diff("Text")
 
+    def __compare_text_buffers(self, node1, node2, callback):
+        """
+        Compare the texts of two nodes without copying them.
+
+        This works only if both dump files are memory mapped and, when
+        checking EOL's, if the texts are equal.
+
+        @type node1: SvnDumpNode
+        @param node1: First dump node.
+        @type node2: SvnDumpNode
+        @param node2: Second dump node.
+        @type callback: SvnDumpDiffCallback
+        @param callback: Callback object for diffs found.
+        @rtype: bool
+        @return: False if the texts have to be compared by reading them.
+        """
+
+        buf1 = node1.get_text_buffer()
+        buf2 = node2.get_text_buffer()
+        if buf1 is None or buf2 is None:
+            return False
+        equal = buf1 == buf2
+        if not equal and self.__check_eol:
+            return False
+        md1 = sdt_md5()
+        md1.update(buf1)
+        mdstr1 = md1.hexdigest()
+        if equal:
+            mdstr2 = mdstr1
+        else:
+            md2 = sdt_md5()
+            md2.update(buf2)
+            mdstr2 = md2.hexdigest()
+        if node1.get_text_md5() != mdstr1:
+            callback.wrong_md5(1, node1.get_text_md5(), mdstr1)
+        if node2.get_text_md5() != mdstr2:
+            callback.wrong_md5(2, node2.get_text_md5(), mdstr2)
+        if not equal:
+            callback.text_diff("Text")
+        return True
+
     def __compare_properties(self, revprops, props1, props2, callback):
         """
         Compare properties.
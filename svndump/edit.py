@@ -26,6 +26,7 @@ from __future__ import print_function
 from optparse import OptionParser
 
 from svndump import __version
+from common import sdt_redirect_stdout
 from file import SvnDumpFile
 from node import SvnDumpNode
 
@@ -310,6 +311,8 @@ def svndump_edit_cmdline(appname, args):
         return 1
     edit.set_input_file(args[0])
     if len(args) == 2:
+        if args[1] == "-":
+            sdt_redirect_stdout()
         edit.set_output_file(args[1])
     edit.verbose = options.verbose
     if options.dry_run:
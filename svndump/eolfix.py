@@ -23,12 +23,15 @@
 from __future__ import print_function
 
 from optparse import OptionParser
+import os
 import re
+import tempfile
 
 from svndump import __version
 from file import SvnDumpFile
 from node import SvnDumpNode
-from common import sdt_md5
+from common import TextDigest, sdt_redirect_stdout
+from pipeline import SvnDumpPipeline
 
 __doc__ = """Classes and functions for fixing EOL's in a dump file."""
 
@@ -83,8 +86,14 @@ def eolfix_callback_regexp(dumpfile, node, expressions):
 class SvnDumpEolFix:
     """
     A class for fixing mixed EOL style files in a svn dump file.
+
+    The revisions are converted in a SvnDumpPipeline, so the callback
+    set with set_mode_callback() is called with a SvnDumpRevision
+    instead of the dump file.
     """
 
+    pipeline_safe = True
+
     def __init__(self):
         """
         Initialize.
@@ -109,10 +118,6 @@ class SvnDumpEolFix:
         # temp directory
         self.__temp_dir = "./"
 
-        # temp files
-        self.__temp_file_max_nr = 0
-        self.__temp_file_nr = 0
-
     def set_input_file(self, filename):
         """
         Sets the input dump file name.
@@ -126,8 +131,11 @@ class SvnDumpEolFix:
         """
         Sets the output dump file name and clears the dry-run flag.
 
-        @type filename: string
-        @param filename: Name of the output file.
+        Instead of a filename a file object or '-' for stdout can be
+        specified, see SvnDumpFile.create_with_rev_0().
+
+        @type filename: string or file object
+        @param filename: Name of the output file or a file object.
         """
         self.__out_file = filename
         self.__dry_run = False
@@ -167,7 +175,13 @@ class SvnDumpEolFix:
         """
         Sets mode to 'callback'.
 
-        @type callback: function( SvnDumpFile, SvnDumpNode, parameter )
+        The callback is called with a SvnDumpRevision, not with the
+        SvnDumpFile as before SvnDumpEolFix used a SvnDumpPipeline. It has
+        the methods of SvnDumpFile for the current revision and its nodes
+        (get_uuid(), get_rev_nr(), get_rev_props(), get_node() and so on)
+        but none for reading or writing the dump file.
+
+        @type callback: function( SvnDumpRevision, SvnDumpNode, parameter )
         @param callback: Callback function to check if conversion is needed.
         @type parameter: any
         @param parameter: A parameter given to the callback function.
@@ -277,6 +291,7 @@ class SvnDumpEolFix:
 
         # +++ catch exception and return errorcode
         srcdmp = SvnDumpFile()
+        srcdmp.set_use_mmap(True)
         srcdmp.open(self.__in_file)
 
         dstdmp = None
@@ -298,10 +313,12 @@ class SvnDumpEolFix:
                                              srcdmp.get_uuid(),
                                              srcdmp.get_rev_nr())
             # now copy all the revisions
-            while hasrev:
-                print("\n\n*** r%d ***\n" % srcdmp.get_rev_nr())
-                self.__process_rev(srcdmp, dstdmp)
-                hasrev = srcdmp.read_next_rev()
+            if hasrev:
+                SvnDumpPipeline(srcdmp, self).execute(
+                    lambda revision: self.__write_rev(dstdmp, revision))
+        srcdmp.close()
+        if dstdmp is not None:
+            dstdmp.close()
         if self.__warning_file is not None:
             self.__warning_file.write(
                 "\n\n# %d warnings\n" % self.__warning_count)
@@ -309,37 +326,33 @@ class SvnDumpEolFix:
             self.__warning_file = None
             self.__warning_count = 0
 
-    def __process_rev(self, srcdmp, dstdmp):
+    def transform(self, dump):
         """
         Process one revision.
 
-        @type srcdmp: SvnDumpFile
-        @param srcdmp: The source dump file.
-        @type dstdmp: SvnDumpFile
-        @param dstdmp: The destination dump file.
+        @type dump: SvnDumpRevision
+        @param dump: The revision.
         """
 
-        # clear temp file nr (overwrite old files)
-        self.__temp_file_nr = 0
-
-        # add revision and revprops
-        if dstdmp is not None:
-            dstdmp.add_rev(srcdmp.get_rev_props())
+        print("\n\n*** r%d ***\n" % dump.get_rev_nr())
 
         # process nodes
         index = 0
-        nodeCount = srcdmp.get_node_count()
+        nodeCount = dump.get_node_count()
         while index < nodeCount:
-            node = srcdmp.get_node(index)
+            node = dump.get_node(index)
             print("  '%s'" % node.get_path())
             istextfile = False
             if node.get_kind() == 'dir':
                 print("    directory, ignored")
             else:
-                istextfile = self.__is_text_file(srcdmp, node,
+                istextfile = self.__is_text_file(dump, node,
                                                  self.__is_text_file_params)
                 if istextfile:
-                    node = self.__convert_eol(node, srcdmp.get_rev_nr())
+                    newnode = self.__convert_eol(node, dump.get_rev_nr())
+                    if newnode is not node:
+                        node = newnode
+                        dump.set_node(index, node)
                 else:
                     print("    unselected file, ignored")
             # +++ is node.has_properties a good enough test?
@@ -348,10 +361,21 @@ class SvnDumpEolFix:
             if self.__eol_style is not None and node.has_properties():
                 if istextfile:
                     node.set_property("svn:eol-style", self.__eol_style)
-            if dstdmp is not None:
-                dstdmp.add_node(node)
             index = index + 1
 
+    def __write_rev(self, dstdmp, revision):
+        """
+        Write one revision.
+
+        @type dstdmp: SvnDumpFile
+        @param dstdmp: The destination dump file or None for a dry-run.
+        @type revision: SvnDumpRevision
+        @param revision: The processed revision.
+        """
+
+        if dstdmp is not None:
+            dstdmp.add_rev_from_dump(revision)
+
     def __convert_eol(self, node, revnr):
         """
         Convert EOL of a node.
@@ -394,10 +418,9 @@ class SvnDumpEolFix:
         if need_conv:
             # do the conversion
             node.text_reopen(handle)
-            outfilename = self.__temp_file_name()
-            outfile = open(outfilename, "wb")
+            outfile, outfilename = self.__temp_file()
             outlen = 0
-            md = sdt_md5()
+            md = TextDigest()
             data = node.text_read(handle)
             carry = ""
             warning_printed = False
@@ -451,24 +474,28 @@ class SvnDumpEolFix:
                                       node.get_copy_from_rev())
             if node.has_properties():
                 newnode.set_properties(node.get_properties())
-            newnode.set_text_file(outfilename, outlen, md.hexdigest())
+            newnode.set_text_file(outfilename, outlen, md.get_md5(),
+                                  delete=True, sha1=md.get_sha1(),
+                                  sha256=md.get_sha256())
         else:
             newnode = node
 
         node.text_close(handle)
         return newnode
 
-    def __temp_file_name(self):
+    def __temp_file(self):
         """
-        Create temp file name.
+        Create a temp file.
+
+        Each converted text gets its own temp file because the text of
+        the previous revision may still be written while converting the
+        current one. It is removed when the node is released.
 
-        @rtype: string
-        @return: A temp file name.
+        @rtype: tuple( file object, string )
+        @return: The temp file opened for writing and its name.
         """
-        self.__temp_file_nr = self.__temp_file_nr + 1
-        if self.__temp_file_nr > self.__temp_file_max_nr:
-            self.__temp_file_max_nr = self.__temp_file_nr
-        return "%stmpnode%d" % (self.__temp_dir, self.__temp_file_nr)
+        fd, filename = tempfile.mkstemp(prefix="tmpnode", dir=self.__temp_dir)
+        return os.fdopen(fd, "wb"), filename
 
 
 def svndump_eol_fix_cmdline(appname, args):
@@ -534,6 +561,8 @@ def svndump_eol_fix_cmdline(appname, args):
         return 1
     eolfix.set_input_file(args[0])
     if len(args) == 2:
+        if args[1] == "-":
+            sdt_redirect_stdout()
         eolfix.set_output_file(args[1])
     if options.regexp is not None and len(options.regexp) > 0:
         eolfix.set_mode_regexp(options.regexp)
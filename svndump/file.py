@@ -22,11 +22,78 @@
 
 from __future__ import print_function
 
+from mmap import mmap, ACCESS_READ
+import os
+import sys
+import tempfile
+from collections import deque
+from cStringIO import StringIO
+
+try:
+    import multiprocessing
+except ImportError:
+    multiprocessing = None
+
 from common import *
-from node import SvnDumpNode
+from compress import DecompressingReader, create_dump_file, \
+    detect_compression, is_compressed_file, open_dump_file
+from index import get_copy_sources
+from tree import SvnDumpTree
+from node import SvnDumpNode, has_temp_files
 
 __doc__ = """SvnDumpFile class."""
 
+# default size of the write buffer
+_WRITE_BUFFER_SIZE = 1024 * 1024
+
+
+def _node_header(node, proplen):
+    """
+    Returns the header lines SvnDumpFile.add_node() writes for a node.
+
+    @type node: SvnDumpNode
+    @param node: The node.
+    @type proplen: integer
+    @param proplen: Length of the properties including PROPS-END or 0.
+    @rtype: list( string )
+    @return: The header lines as strings to be joined, without the empty
+        line ending the header.
+    """
+
+    header = ["Node-path: ", node.get_path(), "\n"]
+
+    # write kind if we know it (cvs2svn emits add's with copy-from
+    # without kind so we do this here independent of the action)
+    kind = node.get_kind()
+    if len(kind) > 0:
+        header.extend(("Node-kind: ", kind, "\n"))
+
+    action = node.get_action()
+    header.extend(("Node-action: ", action, "\n"))
+    if action == "delete":
+        return header
+
+    # copied ?
+    if node.get_copy_from_rev() != 0:
+        header.extend(("Node-copyfrom-rev: ",
+                       str(node.get_copy_from_rev()),
+                       "\nNode-copyfrom-path: ",
+                       node.get_copy_from_path(), "\n"))
+    if node.has_md5():
+        header.extend(("Text-content-md5: ", node.get_text_md5(), "\n"))
+    if node.has_sha1():
+        header.extend(("Text-content-sha1: ", node.get_text_sha1(), "\n"))
+    # write length's of properties text and total
+    if proplen > 0:
+        header.extend(("Prop-content-length: ", str(proplen), "\n"))
+    if node.has_text():
+        textlen = node.get_text_length()
+        header.extend(("Text-content-length: ", str(textlen),
+                       "\nContent-length: ", str(proplen + textlen), "\n"))
+    elif proplen > 0:
+        header.extend(("Content-length: ", str(proplen), "\n"))
+    return header
+
 
 class SvnDumpFile:
     """
@@ -47,13 +114,26 @@ class SvnDumpFile:
         self.__filename = ""
         # the file object to read from/write to
         self.__file = None
+        # close the file object in close()
+        self.__file_close = True
+        # the input file is seekable (not a pipe)
+        self.__seekable = True
+        # spool node texts of non-seekable input files
+        self.__spool_texts = True
+        # temp file containing the node texts of the current revision
+        self.__spool = None
+        # memory map the input file
+        self.__use_mmap = False
+        # size of the write buffer
+        self.__write_buffer_size = _WRITE_BUFFER_SIZE
         # end of file
         self.__file_eof = 0
         # UUID of the repository
         self.__uuid = None
         # curent revision number
         self.__rev_nr = 0
-        # date of the revision
+        # date of the revision, (0, 0) before the first revision and None
+        # after reading one until get_rev_date() parses svn:date
         self.__rev_date = (0, 0)
         # start offset of the next revision
         self.__rev_start_offset = 0
@@ -63,10 +143,25 @@ class SvnDumpFile:
         self.__nodes = ListDict()
         # offset of a tag list
         self.__tag_start_offset = 0
-        # count lines for debugging
-        self.__line__counting = 1
-        self.__line_nr = 0
-        self.__tag_start_line_nr = 0
+        # lines of the last tag list
+        self.__tag_block = ""
+        # current read offset, used for error messages instead of counting
+        # lines (line numbers are calculated only when an error occurs)
+        self.__offset = 0
+        # offset of the line read last
+        self.__line_offset = 0
+        # the line read last (including LF)
+        self.__line = ""
+        # a line which has been pushed back by __unread_line()
+        self.__unread = None
+        # tags of the next revision (already read by read_next_rev())
+        self.__next_rev_tags = None
+        # start offset of the first revision
+        self.__first_rev_offset = 0
+        # number of the revision preceding the read offset, -1 if unknown
+        self.__last_rev_nr = -1
+        # revision offset index, None = not loaded yet, False = no index
+        self.__index = None
 
     def __read_line(self, raiseEof):
         """
@@ -78,15 +173,29 @@ class SvnDumpFile:
         @return: (eof, line), line without LF.
         """
 
-        line = self.__file.readline()
-        if self.__line__counting != 0:
-            self.__line_nr = self.__line_nr + 1
+        if self.__unread is not None:
+            line = self.__unread
+            self.__unread = None
+        else:
+            line = self.__file.readline()
+        self.__line = line
+        self.__line_offset = self.__offset
+        self.__offset = self.__offset + len(line)
         if len(line) != 0:
             return False, line[:-1]
         self.__file_eof = 1
         if not raiseEof:
             return True, ""
-        raise SvnDumpException("unexpected end of file")
+        raise self.__error("unexpected end of file")
+
+    def __unread_line(self):
+        """
+        Push back the line read last, the next __read_line() returns it
+        again.
+        """
+
+        self.__unread = self.__line
+        self.__offset = self.__line_offset
 
     def __read_bin(self, length):
         """
@@ -99,28 +208,122 @@ class SvnDumpFile:
         """
 
         data = self.__file.read(length)
-        if self.__line__counting != 0:
-            self.__line_nr = self.__line_nr + data.count("\n")
+        self.__offset = self.__offset + len(data)
         return data
 
     def __skip_bin(self, length):
         """
         Skip some bytes.
 
+        If the file is seekable the bytes are not read, only the file
+        offset is moved.
+
         @type length: integer
         @param length: Count of bytes to skip.
         """
 
-        if self.__line__counting == 0:
-            self.__file.seek(self.__file.tell() + length)
+        self.__offset = self.__offset + length
+        if self.__seekable:
+            try:
+                self.__file.seek(self.__offset)
+            except ValueError:
+                # mmap objects cannot seek beyond the end
+                raise self.__error("unexpected end of file")
             return
-        nBytes = 4096
         while length > 0:
-            if length < 4096:
-                nBytes = length
-            data = self.__file.read(nBytes)
-            self.__line_nr = self.__line_nr + data.count("\n")
-            length = length - nBytes
+            data = self.__file.read(min(length, 65536))
+            if len(data) == 0:
+                break
+            length = length - len(data)
+
+    def __spool_text(self, length):
+        """
+        Copy a node text of a non-seekable input file into the spool file.
+
+        If spooling is disabled the text is skipped.
+
+        @type length: integer
+        @param length: Length of the text.
+        @rtype: file object, integer
+        @return: The spool file and offset of the text in it or (None, -1).
+        """
+
+        if not self.__spool_texts:
+            self.__skip_bin(length)
+            return None, -1
+        if self.__spool is None:
+            self.__spool = tempfile.TemporaryFile(prefix="svndumptool")
+        self.__spool.seek(0, 2)
+        offset = self.__spool.tell()
+        self.__offset = self.__offset + length
+        while length > 0:
+            data = self.__file.read(min(length, 65536))
+            if len(data) == 0:
+                break
+            self.__spool.write(data)
+            length = length - len(data)
+        self.__spool.flush()
+        return self.__spool, offset
+
+    def __seek(self, offset):
+        """
+        Set the read offset.
+
+        @type offset: integer
+        @param offset: New read offset.
+        """
+
+        self.__file.seek(offset)
+        self.__offset = offset
+        self.__unread = None
+
+    def __error(self, msg, offset=-1):
+        """
+        Create a SvnDumpException containing the position of the error.
+
+        @type msg: string
+        @param msg: Error message.
+        @type offset: integer, optional
+        @param offset: Offset of the error, default is the start of the
+            line read last.
+        @rtype: SvnDumpException
+        @return: The exception to raise.
+        """
+
+        if offset < 0:
+            offset = self.__line_offset
+        lineNr = self.__get_line_nr(offset)
+        if lineNr > 0:
+            return SvnDumpException("%s (offset %d, line %d)" %
+                                    (msg, offset, lineNr))
+        return SvnDumpException("%s (offset %d)" % (msg, offset))
+
+    def __get_line_nr(self, offset):
+        """
+        Calculate the line number for a file offset.
+
+        Reads the dump file from the start up to offset so this should be
+        used for error messages only.
+
+        @type offset: integer
+        @param offset: A file offset.
+        @rtype: integer
+        @return: The line number or 0 if it cannot be calculated.
+        """
+
+        try:
+            fileobj = open_dump_file(self.__filename)
+        except (IOError, TypeError, SvnDumpException):
+            return 0
+        lineNr = 1
+        while offset > 0:
+            data = fileobj.read(min(offset, 65536))
+            if len(data) == 0:
+                break
+            lineNr = lineNr + data.count("\n")
+            offset = offset - len(data)
+        fileobj.close()
+        return lineNr
 
     def __skip_empty_line(self):
         """
@@ -129,7 +332,7 @@ class SvnDumpFile:
 
         eof, line = self.__read_line(False)
         if eof or len(line) != 0:
-            raise SvnDumpException("expected empty line, found '%s'" % line)
+            raise self.__error("expected empty line, found '%s'" % line)
         return
 
     def __get_tag(self, raiseEof):
@@ -147,36 +350,146 @@ class SvnDumpFile:
             return []
         words = line.split(" ", 1)
         if len(words) != 2:
-            raise SvnDumpException("illegal Tag line '%s'" % line)
+            raise self.__error("illegal Tag line '%s'" % line)
         return words
 
     def __get_tag_list(self):
         """
         Get a list of tags, end is an empty line.
 
+        The lines of the tag block are collected first and then split in
+        one go.
+
         @rtype: dict( string -> string )
         @return: A dict containing the tags.
         """
 
-        tags = {}
-        self.__tag_start_offset = self.__file.tell()
-        self.__tag_start_line_nr = self.__line_nr
-        tag = self.__get_tag(False)
-        while len(tag) == 0:
-            if self.__file_eof:
-                return tags
-            self.__tag_start_offset = self.__file.tell()
-            self.__tag_start_line_nr = self.__line_nr
-            tag = self.__get_tag(False)
-        while len(tag) == 2:
-            tags[tag[0]] = tag[1]
-            tag = self.__get_tag(True)
-        return tags
+        readline = self.__file.readline
+        offset = self.__offset
+        if self.__unread is not None:
+            line = self.__unread
+            self.__unread = None
+        else:
+            line = readline()
+        # skip empty lines
+        while line == "\n":
+            offset += 1
+            line = readline()
+        self.__tag_start_offset = offset
+        if len(line) == 0:
+            self.__tag_block = ""
+            self.__offset = offset
+            self.__line_offset = offset
+            self.__file_eof = 1
+            return {}
+        lines = []
+        while len(line) > 1:
+            lines.append(line)
+            line = readline()
+        block = "".join(lines)
+        self.__tag_block = block
+        self.__line_offset = offset + len(block)
+        self.__offset = self.__line_offset + len(line)
+        if len(line) == 0:
+            self.__file_eof = 1
+            raise self.__error("unexpected end of file")
+        try:
+            return dict([tag.split(" ", 1) for tag in block[:-1].split("\n")])
+        except ValueError:
+            # find the illegal line for the error message
+            for tag in lines:
+                if tag.find(" ") < 0:
+                    raise self.__error("illegal Tag line '%s'" % tag[:-1],
+                                       offset)
+                offset += len(tag)
+            raise
+
+    def __is_node_header(self, node, tags):
+        """
+        Checks if add_node() writes the header of the last tag list.
+
+        @type node: SvnDumpNode
+        @param node: The node created from the tag list.
+        @type tags: dict( string -> string )
+        @param tags: The tag list.
+        @rtype: bool
+        @return: True if add_node() writes the same header lines, the order
+            doesn't matter.
+        """
+
+        proplen = 0
+        if tags.has_key("Prop-content-length:"):
+            proplen = int(tags["Prop-content-length:"])
+        header = "".join(_node_header(node, proplen))
+        if len(header) != len(self.__tag_block):
+            return False
+        lines = header.split("\n")
+        lines.sort()
+        taglines = self.__tag_block.split("\n")
+        taglines.sort()
+        return lines == taglines
 
-    def __get_prop_list(self):
+    def __get_prop_list(self, length=-1):
         """
         Get a list of properties.
 
+        If the length of the properties is known they are read at once and
+        parsed in memory.
+
+        @type length: integer, optional
+        @param length: Length of the properties (Prop-content-length) or -1.
+        @rtype: dict( string -> string )
+        @return: A dict containing the properties.
+        """
+
+        if length < 0:
+            return self.__read_prop_list()
+        offset = self.__offset
+        data = self.__read_bin(length)
+        props = parse_prop_block(data)
+        if props is not None:
+            return props
+        # Prop-content-length is wrong or the properties are broken,
+        # read them line by line to be tolerant or get a good error message
+        if not self.__seekable:
+            raise self.__error("illegal properties (Prop-content-length %d)"
+                               % length, offset)
+        self.__seek(offset)
+        return self.__read_prop_list()
+
+    def __skip_prop_list(self, length):
+        """
+        Skip a list of properties.
+
+        Only the PROPS-END line at the end is checked, decoding is done by
+        SvnDumpNode when the properties are needed.
+
+        @type length: integer
+        @param length: Length of the properties (Prop-content-length).
+        @rtype: tuple( file object, integer )
+        @return: The file object and offset of the properties or None if
+            they don't end with PROPS-END (use __get_prop_list() then).
+        """
+
+        offset = self.__offset
+        if length < 10:
+            return None
+        if self.__seekable:
+            self.__skip_bin(length - 10)
+            if self.__read_bin(10) == "PROPS-END\n":
+                return self.__file, offset
+            self.__seek(offset)
+            return None
+        data = self.__read_bin(length)
+        if not data.endswith("PROPS-END\n"):
+            raise self.__error("illegal properties (Prop-content-length %d)"
+                               % length, offset)
+        return StringIO(data), 0
+
+    def __read_prop_list(self):
+        """
+        Read a list of properties line by line.
+
         @rtype: dict( string -> string )
         @return: A dict containing the properties.
         """
@@ -187,7 +500,7 @@ class SvnDumpFile:
             # key
             words = line.split()
             if len(words) != 2 or (words[0] != "K" and words[0] != "D"):
-                raise SvnDumpException("illegal property key ???")
+                raise self.__error("illegal property key ???")
             key = self.__read_bin(int(words[1]))
             self.__skip_empty_line()
             # value
@@ -196,7 +509,7 @@ class SvnDumpFile:
                 eof, line = self.__read_line(True)
                 words = line.split()
                 if len(words) != 2 or words[0] != "V":
-                    raise SvnDumpException("illegal property value ???")
+                    raise self.__error("illegal property value ???")
                 value = self.__read_bin(int(words[1]))
                 self.__skip_empty_line()
             # set property
@@ -205,37 +518,25 @@ class SvnDumpFile:
             eof, line = self.__read_line(True)
         return props
 
-    def __create_prop_string(self, properties):
-        """
-        Create a string from a dict containing properties.
-
-        @type properties: dict( string -> string )
-        @param properties: A dict containing the properties.
-        @rtype: string
-        @return: A string containing the properties.
-        """
-
-        propStr = ""
-        if properties is not None:
-            for key, val in properties.items():
-                if val is not None:
-                    # add/change property
-                    propStr = propStr + ("K %d" % len(key)) + "\n" + key + "\n"
-                    propStr = propStr + ("V %d" % len(val)) + "\n" + val + "\n"
-                else:
-                    # delete property
-                    propStr = propStr + ("D %d" % len(key)) + "\n" + key + "\n"
-            propStr = propStr + "PROPS-END\n"
-        return propStr
-
     # ------------------------------------------------------------
     #  open / create / close
 
     def open(self, filename):
         """
         Open a dump file for reading and read the header.
-        @type filename: string
-        @param filename: Name of an existing dump file.
+
+        Instead of a filename a file object opened for reading can be
+        specified, '-' means stdin. If the file object is not seekable (a
+        pipe for example) the dump file is read forward only and the node
+        texts of the current revision are spooled into a temp file, see
+        set_text_spooling().
+
+        Seekable dump files compressed with gzip, bzip2, xz or zstd are
+        detected by their magic bytes and decompressed while reading (xz
+        and zstd need the python modules lzma and zstandard).
+
+        @type filename: string or file object
+        @param filename: Name of an existing dump file or a file object.
         """
 
         # check state
@@ -243,26 +544,49 @@ class SvnDumpFile:
             raise SvnDumpException("invalid state %d (should be %d)" % \
                                    (self.__state, self.ST_NONE))
 
-        # set parameters
-        self.__filename = filename
-
         # open the file for reading
-        self.__file = open(filename, "rb")
+        if filename == "-":
+            filename = sys.stdin
+        if hasattr(filename, "read"):
+            self.__file = filename
+            self.__file_close = False
+            self.__filename = getattr(filename, "name", "")
+        else:
+            self.__file = open(filename, "rb")
+            self.__file_close = True
+            self.__filename = filename
+        try:
+            self.__offset = self.__file.tell()
+            self.__file.seek(self.__offset)
+            self.__seekable = True
+        except (IOError, OSError, AttributeError):
+            self.__offset = 0
+            self.__seekable = False
+        if self.__seekable:
+            compression = detect_compression(self.__file)
+            if compression is not None:
+                self.__file = DecompressingReader(self.__file, compression,
+                                                  self.__file_close)
+                self.__file_close = True
+                self.__offset = 0
+        if self.__use_mmap and self.__seekable:
+            self.__map_file()
+        self.__unread = None
+        self.__next_rev_tags = None
 
         # check that it is a svn dump file
         tag = self.__get_tag(True)
         if tag[0] != "SVN-fs-dump-format-version:":
-            raise SvnDumpException("not a svn dump file ???")
+            raise self.__error("not a svn dump file ???")
         if tag[1] != "2":
-            raise SvnDumpException("wrong svn dump file version (expected 2 found %s)" % (tag[1]))
+            raise self.__error("wrong svn dump file version (expected 2 found %s)" % (tag[1]))
         self.__skip_empty_line()
 
         # get UUID
-        fileoffset = self.__file.tell()
         tag = self.__get_tag(True)
         if len(tag) < 1 or tag[0] != "UUID:":
             # back to start of revision
-            self.__file.seek(fileoffset)
+            self.__unread_line()
             self.__uuid = None
         else:
             # set UUID
@@ -270,15 +594,100 @@ class SvnDumpFile:
             self.__skip_empty_line()
 
         # done initializing
-        self.__rev_start_offset = self.__file.tell()
+        self.__rev_start_offset = self.__offset
+        self.__first_rev_offset = self.__offset
+        self.__last_rev_nr = -1
+        self.__index = None
         self.__state = self.ST_READ
 
+    def __map_file(self):
+        """
+        Replaces the input file object by a read-only memory map of it.
+
+        If the file cannot be mapped (empty file, no fileno(), address
+        space too small) the file object is used as is.
+        """
+
+        try:
+            filemap = mmap(self.__file.fileno(), 0,
+                           access=ACCESS_READ)
+        except (EnvironmentError, AttributeError, ValueError, OverflowError):
+            return
+        filemap.seek(self.__offset)
+        if self.__file_close:
+            self.__file.close()
+        self.__file = filemap
+        self.__file_close = True
+
+    def set_use_mmap(self, usemmap):
+        """
+        Enable/disable memory mapping of the input file.
+
+        Has to be called before open(). When the dump file is mapped the
+        nodes hand out zero-copy buffers of their texts, see
+        SvnDumpNode.get_text_buffer(). Non-seekable input files are never
+        mapped.
+
+        @type usemmap: bool
+        @param usemmap: True to memory map the input file.
+        """
+
+        self.__use_mmap = usemmap
+
+    def set_write_buffer_size(self, size):
+        """
+        Sets the size of the write buffer.
+
+        Has to be called before creating the dump file. The records of the
+        nodes and revisions are written into this buffer, the file is
+        written when it is full. It's not used for file objects and
+        compressed files (which are buffered in blocks anyway).
+
+        @type size: integer
+        @param size: Size of the buffer in bytes, negative for the system
+            default.
+        """
+
+        self.__write_buffer_size = size
+
+    def is_mmapped(self):
+        """
+        Returns True if the input file is memory mapped.
+
+        The texts and raw records of the nodes of a memory mapped dump file
+        are read without changing the read position of the dump file, so
+        they can be used in other threads while reading the next revision.
+
+        @rtype: bool
+        @return: True if the input file is memory mapped.
+        """
+
+        return isinstance(self.__file, mmap)
+
+    def is_seekable(self):
+        """
+        Returns True if the input file is seekable.
+
+        The texts of the nodes of a non-seekable dump file (stdin, pipes)
+        are only available until the next revision is read.
+
+        @rtype: bool
+        @return: True if the input file is seekable.
+        """
+
+        return self.__seekable
+
     def create_with_rev_0(self, filename, uuid, rev0date):
         """
         Create a new dump file starting with revision 0.
 
-        @type filename: string
-        @param filename: Name of the new dump file.
+        The file is compressed if filename ends with .gz, .bz2, .xz or
+        .zst. Instead of a filename a file object opened for writing can be
+        specified, '-' means stdout (see sdt_dump_stdout()). The file
+        object is written sequentially, it doesn't need to be seekable.
+
+        @type filename: string or file object
+        @param filename: Name of the new dump file or a file object.
         @type uuid: string
         @param uuid: UUID of the new dump file or None.
         @type rev0date: string
@@ -291,14 +700,13 @@ class SvnDumpFile:
                                    (self.__state, self.ST_NONE))
 
         # set parameters
-        self.__filename = filename
         self.__uuid = uuid
 
         # check rev0date
         rev0date = self.set_rev_date(rev0date)
 
         # open file for writing
-        self.__file = open(filename, "wb")
+        self.__create_file(filename)
 
         # write header and uuid
         self.__file.writelines(["SVN-fs-dump-format-version: 2\n", "\n"])
@@ -324,8 +732,12 @@ class SvnDumpFile:
         """
         Create a new dump file.
 
-        @type filename: string
-        @param filename: Name of the new dump file.
+        The file is compressed if filename ends with .gz, .bz2, .xz or
+        .zst. Instead of a filename a file object or '-' can be specified,
+        see create_with_rev_0().
+
+        @type filename: string or file object
+        @param filename: Name of the new dump file or a file object.
         @type uuid: string
         @param uuid: UUID of the new dump file or None.
         @type firstRevNr: integer
@@ -342,12 +754,11 @@ class SvnDumpFile:
             raise SvnDumpException("invalid firstRevNr %d (should be >= 1)" % firstRevNr)
 
         # set parameters
-        self.__filename = filename
         self.__uuid = uuid
         self.__rev_nr = firstRevNr - 1
 
         # open file for writing
-        self.__file = open(filename, "wb")
+        self.__create_file(filename)
 
         # write header and uuid
         self.__file.writelines(["SVN-fs-dump-format-version: 2\n", "\n"])
@@ -357,6 +768,26 @@ class SvnDumpFile:
         # done initializing
         self.__state = self.ST_CREATE
 
+    def __create_file(self, filename):
+        """
+        Opens the file for writing.
+
+        @type filename: string or file object
+        @param filename: Name of the new dump file, '-' or a file object.
+        """
+
+        if filename == "-":
+            filename = sdt_dump_stdout()
+        if hasattr(filename, "write"):
+            self.__file = filename
+            self.__file_close = False
+            self.__filename = getattr(filename, "name", "")
+        else:
+            self.__file = create_dump_file(filename,
+                                           self.__write_buffer_size)
+            self.__file_close = True
+            self.__filename = filename
+
     def create_like(self, filename, srcfile):
         """
         Creates this dump file like srcfile.
@@ -370,8 +801,8 @@ class SvnDumpFile:
         In both cases True is returned if srcdump contains a revision and
         False if srcdump reached EOF.
 
-        @type filename: string
-        @param filename: Name of the new dump file.
+        @type filename: string or file object
+        @param filename: Name of the new dump file or a file object.
         @type srcfile: SvnDumpFile
         @param srcfile: A dump file.
         @rtype: bool
@@ -397,16 +828,35 @@ class SvnDumpFile:
 
         # close only if state != ST_NONE
         if self.__state != self.ST_NONE:
-            self.__file.close()
-            self.__line_nr = 0
+            if self.__file_close:
+                self.__file.close()
+            elif self.__state != self.ST_READ and \
+                    self.__state != self.ST_EOF:
+                self.__file.flush()
+            if self.__spool is not None:
+                self.__spool.close()
+                self.__spool = None
+            self.__next_rev_tags = None
+            self.__index = None
+            self.__offset = 0
             self.__file_eof = 0
             self.__filename = None
             self.__uuid = None
             self.__file = None
             self.__rev_props = None
-            self.__nodes.clear()
+            self.__release_nodes()
             self.__state = self.ST_NONE
 
+    def __release_nodes(self):
+        """
+        Releases the temp files of the nodes and removes the nodes.
+        """
+
+        if has_temp_files():
+            for node in self.__nodes.itervalues():
+                node.release()
+        self.__nodes.clear()
+
     # ------------------------------------------------------------
     #  read methods
 
@@ -428,16 +878,31 @@ class SvnDumpFile:
             self.__state = self.ST_EOF
             return False
 
-        # go to start of revision
-        if self.__rev_start_offset != self.__file.tell():
-            self.__file.seek(self.__rev_start_offset)
-
-        # get rev tags
-        tags = self.__get_tag_list()
+        # go to start of revision (node text functions may have moved
+        # the file offset)
+        if self.__seekable:
+            if self.__rev_start_offset != self.__file.tell():
+                self.__seek(self.__rev_start_offset)
+        elif self.__spool is not None:
+            # the texts of the previous revision are not needed anymore
+            self.__spool.seek(0)
+            self.__spool.truncate()
+
+        # get rev tags, they may have been read already
+        if self.__next_rev_tags is not None:
+            tags = self.__next_rev_tags
+            self.__next_rev_tags = None
+        else:
+            tags = self.__get_tag_list()
         self.__rev_nr = int(tags["Revision-number:"])
+        self.__last_rev_nr = self.__rev_nr
 
         # read revision properties
-        self.__rev_props = self.__get_prop_list()
+        if tags.has_key("Prop-content-length:"):
+            self.__rev_props = self.__get_prop_list(
+                int(tags["Prop-content-length:"]))
+        else:
+            self.__rev_props = self.__get_prop_list()
         self.__skip_empty_line()
         if not self.__rev_props.has_key("svn:log"):
             self.__rev_props["svn:log"] = ""
@@ -449,29 +914,40 @@ class SvnDumpFile:
             self.set_rev_date("")
 
         # read nodes (files, dirs)
-        self.__nodes.clear()
+        self.__release_nodes()
         # self.nodeList = []
         tags = self.__get_tag_list()
         while len(tags) != 0:
             # check that it's not the next revision
             if tags.has_key("Revision-number:"):
-                # go back to start of tag list
-                self.__file.seek(self.__tag_start_offset)
-                self.__line_nr = self.__tag_start_line_nr
+                # keep the tags for the next call
+                self.__next_rev_tags = tags
                 break
-            # get node properties
+            # start of the raw node record
+            rawoffset = self.__tag_start_offset
+            # get node properties, they are decoded later if needed
+            properties = None
+            propraw = None
             if tags.has_key("Prop-content-length:"):
-                properties = self.__get_prop_list()
-            else:
-                properties = None
+                proplength = int(tags["Prop-content-length:"])
+                propraw = self.__skip_prop_list(proplength)
+                if propraw is None:
+                    properties = self.__get_prop_list(proplength)
             # skip node data
+            textfile = self.__file
             if tags.has_key("Text-content-length:"):
                 tags["Text-content-length:"] = int(tags["Text-content-length:"])
-                offset = self.__file.tell()
-                self.__skip_bin(tags["Text-content-length:"])
+                if self.__seekable:
+                    offset = self.__offset
+                    self.__skip_bin(tags["Text-content-length:"])
+                else:
+                    textfile, offset = self.__spool_text(
+                        tags["Text-content-length:"])
+                rawlen = self.__offset - rawoffset
                 self.__skip_empty_line()
             else:
                 offset = 0
+                rawlen = self.__offset - rawoffset
             # add node
             path = tags["Node-path:"].lstrip('/')
             action = tags["Node-action:"]
@@ -479,7 +955,9 @@ class SvnDumpFile:
             if tags.has_key("Node-kind:"):
                 kind = tags["Node-kind:"]
             node = SvnDumpNode(path, action, kind)
-            if properties is not None:
+            if propraw is not None:
+                node.set_properties_raw(propraw[0], propraw[1], proplength)
+            elif properties is not None:
                 node.set_properties(properties)
             if tags.has_key("Node-copyfrom-path:"):
                 node.set_copy_from(tags["Node-copyfrom-path:"].lstrip('/'),
@@ -493,18 +971,197 @@ class SvnDumpFile:
             else:
                 sha1 = ""
             if tags.has_key("Text-content-length:"):
-                node.set_text_fileobj(self.__file, offset,
+                node.set_text_fileobj(textfile, offset,
                                       int(tags["Text-content-length:"]),
                                       md5,
                                       sha1)
+            # the node is copied as is only if add_node() would write the
+            # same headers (in any order), headers add_node() drops like
+            # Prop-delta or Text-copy-source-md5 (which becomes wrong if
+            # a node processed earlier changes the text of the copy
+            # source) or a leading '/' of a path make it rewritten
+            if self.__seekable and properties is None and \
+                    self.__is_node_header(node, tags):
+                node.set_raw_fileobj(self.__file, rawoffset, rawlen)
             upath = (action[0].upper(), path)
             self.__nodes[upath] = node
             # next one...
             tags = self.__get_tag_list()
 
-        self.__rev_start_offset = self.__file.tell()
+        self.__rev_start_offset = self.__offset
         return True
 
+    def seek_rev(self, revnr):
+        """
+        Set the read position to the start of the specified revision.
+
+        The next call to read_next_rev() reads that revision or, if it
+        doesn't exist, the first revision following it. If an index file
+        exists for the dump file (see svndump.index) the revision is looked
+        up in it, else the revision headers are scanned (without parsing
+        properties and texts) starting at the current position or at the
+        first revision if revnr is not ahead of the current position.
+        Seeking backwards is not possible if the dump file is not seekable.
+
+        @type revnr: integer
+        @param revnr: Revision number.
+        @rtype: bool
+        @return: False if the revision doesn't exist.
+        """
+
+        # check state
+        if self.__state != self.ST_READ and self.__state != self.ST_EOF:
+            raise SvnDumpException("invalid state %d (should be %d or %d)" % \
+                                   (self.__state, self.ST_READ, self.ST_EOF))
+
+        index = self.__get_index()
+        if index is not None:
+            nr, offset = index.find_rev(revnr)
+            if offset < 0:
+                # behind the last revision
+                self.__next_rev_tags = None
+                self.__state = self.ST_READ
+                self.__last_rev_nr = index.get_last_rev_nr()
+                self.__file_eof = 1
+                return False
+            self.seek_rev_offset(nr, offset)
+            self.__last_rev_nr = revnr - 1
+            return nr == revnr
+
+        if revnr <= self.__last_rev_nr:
+            if not self.__seekable:
+                raise SvnDumpException("cannot seek back to r%d, the dump "
+                                       "file is not seekable" % revnr)
+            # start scanning at the first revision
+            self.__seek(self.__first_rev_offset)
+            self.__rev_start_offset = self.__first_rev_offset
+            self.__next_rev_tags = None
+            self.__last_rev_nr = -1
+            self.__file_eof = 0
+            self.__state = self.ST_READ
+        elif self.__file_eof:
+            return False
+        return self.__scan_to_rev(revnr)
+
+    def seek_rev_offset(self, revnr, offset):
+        """
+        Set the read position to a revision record at a known offset.
+
+        Like seek_rev() but the offset of the revision is already known,
+        from an index for example. Nothing is checked, the next call to
+        read_next_rev() fails if there's no revision record at offset.
+
+        @type revnr: integer
+        @param revnr: Revision number of the revision at offset.
+        @type offset: integer
+        @param offset: Offset of the revision record.
+        """
+
+        # check state
+        if self.__state != self.ST_READ and self.__state != self.ST_EOF:
+            raise SvnDumpException("invalid state %d (should be %d or %d)" % \
+                                   (self.__state, self.ST_READ, self.ST_EOF))
+        if not self.__seekable:
+            raise SvnDumpException("cannot seek to r%d, the dump file is "
+                                   "not seekable" % revnr)
+
+        self.__seek(offset)
+        self.__rev_start_offset = offset
+        self.__next_rev_tags = None
+        self.__last_rev_nr = revnr - 1
+        self.__file_eof = 0
+        self.__state = self.ST_READ
+
+    def read_rev(self, revnr):
+        """
+        Read the specified revision.
+
+        Calls seek_rev() and read_next_rev() if the revision exists.
+
+        @type revnr: integer
+        @param revnr: Revision number.
+        @rtype: bool
+        @return: False if the revision doesn't exist.
+        """
+
+        if not self.seek_rev(revnr):
+            return False
+        return self.read_next_rev()
+
+    def __get_index(self):
+        """
+        Returns the revision offset index of the dump file.
+
+        The index is loaded on the first call.
+
+        @rtype: SvnDumpIndex
+        @return: The index or None if there's no (valid) index file.
+        """
+
+        if self.__index is None:
+            self.__index = False
+            if self.__seekable and isinstance(self.__filename, str):
+                # imported here, svndump.index is only needed for seeking
+                from index import SvnDumpIndex
+                index = SvnDumpIndex()
+                if index.load(self.__filename):
+                    self.__index = index
+        if self.__index is False:
+            return None
+        return self.__index
+
+    def __scan_to_rev(self, revnr):
+        """
+        Scan forward to the start of the specified revision.
+
+        Only the tags are parsed, properties and node texts are skipped.
+        Stops at the first revision with a number >= revnr or at EOF.
+
+        @type revnr: integer
+        @param revnr: Revision number.
+        @rtype: bool
+        @return: False if the revision doesn't exist.
+        """
+
+        if self.__next_rev_tags is not None:
+            tags = self.__next_rev_tags
+            self.__next_rev_tags = None
+        else:
+            if self.__seekable and \
+                    self.__rev_start_offset != self.__file.tell():
+                self.__seek(self.__rev_start_offset)
+            tags = self.__get_tag_list()
+        while len(tags) != 0:
+            if tags.has_key("Revision-number:"):
+                nr = int(tags["Revision-number:"])
+                if nr >= revnr:
+                    # keep the tags for read_next_rev()
+                    self.__next_rev_tags = tags
+                    self.__rev_start_offset = self.__offset
+                    return nr == revnr
+                self.__last_rev_nr = nr
+            # skip properties and text
+            length = get_content_length(tags)
+            if length > 0:
+                self.__skip_bin(length)
+            tags = self.__get_tag_list()
+        self.__rev_start_offset = self.__offset
+        return False
+
+    def set_text_spooling(self, spool):
+        """
+        Enable/disable spooling of node texts.
+
+        Only used for non-seekable input files. When disabled the texts are
+        skipped and cannot be read, which is what metadata-only readers
+        want. The default is enabled.
+
+        @type spool: bool
+        @param spool: False to skip node texts.
+        """
+
+        self.__spool_texts = spool
+
     def has_revision(self):
         """
         Returns false when EOF occured.
@@ -539,6 +1196,8 @@ class SvnDumpFile:
         @rtype: list( integer )
         @return: The revision date.
         """
+        if self.__rev_date is None:
+            self.__rev_date = parse_svn_date_str(self.__rev_props["svn:date"])
         return self.__rev_date
 
     def get_rev_date_str(self):
@@ -654,6 +1313,22 @@ class SvnDumpFile:
 
         return self.__nodes.values()
 
+    def detach_nodes(self):
+        """
+        Removes the nodes from the current revision and returns them.
+
+        The temp files of detached nodes are not released by the next
+        read_next_rev(), the caller has to call SvnDumpNode.release() on
+        them when they are not needed anymore.
+
+        @rtype: ListDict
+        @return: The nodes of the current revision.
+        """
+
+        nodes = self.__nodes
+        self.__nodes = ListDict()
+        return nodes
+
     # ------------------------------------------------------------
     #  write methods
 
@@ -661,13 +1336,20 @@ class SvnDumpFile:
         """
         Check a date string, set and return a valid one.
 
+        A canonical date string is used as is and parsed only when
+        get_rev_date() is called.
+
         @type dateStr: string
         @param dateStr: A svn date string.
         @rtype: string
         @return: A svn date string.
         """
-        self.__rev_date = parse_svn_date_str(dateStr)
-        self.__rev_props["svn:date"] = create_svn_date_str(self.__rev_date)
+        if is_canonical_svn_date_str(dateStr):
+            self.__rev_date = None
+            self.__rev_props["svn:date"] = dateStr
+        else:
+            self.__rev_date = parse_svn_date_str(dateStr)
+            self.__rev_props["svn:date"] = create_svn_date_str(self.__rev_date)
         return self.__rev_props["svn:date"]
 
     def set_rev_author(self, author):
@@ -755,23 +1437,74 @@ class SvnDumpFile:
             revProps["svn:log"] = ""
         self.__rev_props = revProps
 
-        propStr = self.__create_prop_string(revProps)
+        propStr = create_prop_string(revProps)
+        proplen = str(len(propStr))
         # write revision
-        self.__file.writelines(["Revision-number: %d\n" % self.__rev_nr,
-                                "Prop-content-length: %d\n" % len(propStr),
-                                "Content-length: %d\n" % len(propStr),
-                                "\n",
-                                propStr,
-                                "\n"])
+        self.__file.write("".join(("Revision-number: ", str(self.__rev_nr),
+                                   "\nProp-content-length: ", proplen,
+                                   "\nContent-length: ", proplen,
+                                   "\n\n", propStr, "\n")))
 
         # we have a revision now
         self.__state = self.ST_WRITE
 
+    def add_raw_revs(self, fileobj, offset, length, lastRevNr):
+        """
+        Appends revision records copied as is from a file.
+
+        The data must contain complete revisions numbered from
+        get_rev_nr() + 1 up to lastRevNr as written by this class, they
+        are neither parsed nor checked.
+
+        @type fileobj: file object
+        @param fileobj: A file object opened for reading.
+        @type offset: integer
+        @param offset: Offset of the first revision record in fileobj.
+        @type length: integer
+        @param length: Length of the revision records.
+        @type lastRevNr: integer
+        @param lastRevNr: Number of the last revision in the data.
+        """
+
+        # check state
+        if self.__state != self.ST_WRITE and self.__state != self.ST_CREATE:
+            raise SvnDumpException("invalid state %d (should be %d or %d)" % (
+                self.__state, self.ST_CREATE, self.ST_WRITE))
+
+        sdt_copy_file_range(fileobj, offset, length, self.__file)
+        self.__rev_nr = lastRevNr
+        self.__state = self.ST_WRITE
+
+    def add_raw_data(self, data, lastRevNr):
+        """
+        Appends revision records given as a string.
+
+        Like add_raw_revs() but the records may be passed in several
+        parts, each call appends the next part.
+
+        @type data: string
+        @param data: The records or a part of them.
+        @type lastRevNr: integer
+        @param lastRevNr: Number of the last revision in the records.
+        """
+
+        # check state
+        if self.__state != self.ST_WRITE and self.__state != self.ST_CREATE:
+            raise SvnDumpException("invalid state %d (should be %d or %d)" % (
+                self.__state, self.ST_CREATE, self.ST_WRITE))
+
+        self.__file.write(data)
+        self.__rev_nr = lastRevNr
+        self.__state = self.ST_WRITE
+
     def add_node(self, node):
         """
         Add a node to the current revision.
 
-        This method uses SvnDumpNode.write_text_to_file().
+        Unmodified nodes read from a seekable dump file are copied as is
+        using SvnDumpNode.write_raw_to_file() if their headers are the ones
+        this method writes, all others are created from the node using
+        SvnDumpNode.write_text_to_file().
 
         @type node: SvnDumpNode
         @param node: The node to add.
@@ -782,53 +1515,40 @@ class SvnDumpFile:
             raise SvnDumpException("invalid state %d (should be %d)" % \
                                    (self.__state, self.ST_WRITE))
 
-        # write the node
-        self.__file.write("Node-path: " + node.get_path() + "\n")
+        if not node.is_dirty():
+            # unmodified node read from a dump file, copy it as is
+            node.write_raw_to_file(self.__file)
+            if node.get_action() != "delete":
+                if node.has_properties() or node.has_text():
+                    self.__file.write("\n\n")
+                else:
+                    self.__file.write("\n")
+            return
 
-        # write kind if we know it (cvs2svn emits add's with copy-from
-        # without kind so we do this here independent of the action)
-        kind = node.get_kind()
-        if len(kind) > 0:
-            self.__file.write("Node-kind: %s\n" % kind)
+        # the node record is collected and written at once
+        if node.get_action() == "delete":
+            record = _node_header(node, 0)
+            # CR after each node
+            record.append("\n")
+            self.__file.write("".join(record))
+            return
 
-        action = node.get_action()
-        self.__file.write("Node-action: " + action + "\n")
-        if action != "delete":
-            # copied ?
-            if node.get_copy_from_rev() != 0:
-                self.__file.write("Node-copyfrom-rev: %d\n" % \
-                                  node.get_copy_from_rev())
-                self.__file.write("Node-copyfrom-path: " + \
-                                  node.get_copy_from_path() + "\n")
-            # calculate length's of properties text and total
-            propstr = self.__create_prop_string(node.get_properties())
-            proplen = len(propstr)
-            textlen = node.get_text_length()
-            if node.has_text():
-                totlen = proplen + textlen
-            else:
-                totlen = proplen
-            if node.has_md5():
-                self.__file.write("Text-content-md5: %s\n" % node.get_text_md5())
-            if node.has_sha1():
-                self.__file.write("Text-content-sha1: %s\n" % node.get_text_sha1())
-            # write length's of properties text and total
-            if proplen > 0:
-                self.__file.write("Prop-content-length: %d\n" % proplen)
-            if node.has_text():
-                self.__file.write("Text-content-length: %d\n" % textlen)
-            if proplen > 0 or node.has_text():
-                self.__file.write("Content-length: %d\n" % totlen)
-                self.__file.write("\n")
+        propstr = node.get_properties_string()
+        proplen = len(propstr)
+        hastext = node.has_text()
+        record = _node_header(node, proplen)
+        if hastext or proplen > 0:
             # write properties
-            if proplen > 0:
-                self.__file.write(propstr)
+            record.extend(("\n", propstr))
+        if hastext:
             # write text
-            if node.has_text():
-                node.write_text_to_file(self.__file)
-            self.__file.write("\n")
-        # CR after each node
-        self.__file.write("\n")
+            self.__file.write("".join(record))
+            node.write_text_to_file(self.__file)
+            self.__file.write("\n\n")
+        else:
+            # CR after each node
+            record.append("\n\n")
+            self.__file.write("".join(record))
 
 
 class SvnDumpFileWithHistory(SvnDumpFile):
@@ -842,9 +1562,12 @@ class SvnDumpFileWithHistory(SvnDumpFile):
         self.ERR_NODE_PARENT_NOT_DIR = 5
         self.ERR_NODE_NO_COPY_SRC = 6
         self.ERR_NODE_GONE = 7
+        self.ERR_NODE_SHA1_FAIL = 8
         # node history for this
         self.__enable_nodehist = False
-        self.__nodehist = {}
+        self.__nodehist = SvnDumpTree()
+        # True if this dump file has been created (and not read)
+        self.__writing = False
         # check actions
         self.__enable_check_node_actions = False
         # check dates
@@ -852,6 +1575,20 @@ class SvnDumpFileWithHistory(SvnDumpFile):
         self.__prev_date = (0, 0)
         # check md5 sums
         self.__enable_check_node_md5 = False
+        # check sha1 sums
+        self.__enable_check_node_sha1 = False
+        # worker processes for md5/sha1 checks
+        self.__digest_workers = 1
+        self.__digest_pool = None
+        self.__digest_filename = ""
+        # digests to calculate, [ (revnr, errpos, path, offset, length,
+        #   md5, sha1) ], and their size in bytes
+        self.__digest_batch = []
+        self.__digest_batch_size = 0
+        # submitted batches, ( firstrevnr, batch, async result )
+        self.__digest_jobs = deque()
+        # failed digests of incomplete revisions, { revnr -> [ errpos, err ] }
+        self.__digest_failures = {}
         # revision errors
         self.__rev_errors = {}
 
@@ -900,6 +1637,50 @@ class SvnDumpFileWithHistory(SvnDumpFile):
 
         self.__enable_check_node_md5 = docheck
 
+    def set_check_sha1(self, docheck):
+        """
+        Set the check sha1 sums flag to the given value.
+
+        Only nodes having a sha1 sum are checked.
+
+        @type docheck: bool
+        @param docheck: New value for the flag.
+        """
+
+        self.__enable_check_node_sha1 = docheck
+
+    def set_check_workers(self, count):
+        """
+        Sets the number of worker processes calculating md5/sha1 sums.
+
+        With more than one worker the texts are read by the workers from
+        the dump file, so this works only for dump files opened by name.
+        The digest errors of a revision are available as soon as all its
+        digests are calculated, see is_rev_checked() and get_rev_errors().
+
+        Must be called before open().
+
+        @type count: int
+        @param count: Number of worker processes, 1 checks in this process.
+        """
+
+        self.__digest_workers = count
+
+    def is_rev_checked(self, revnr):
+        """
+        Returns True if all checks of the given revision are done.
+
+        This is always the case for revisions which have been read, except
+        when using worker processes (see set_check_workers()).
+
+        @type revnr: int
+        @param revnr: Revision number.
+        @rtype: bool
+        @return: True if get_rev_errors() won't wait for workers.
+        """
+
+        return self.__collect_digests(revnr, False)
+
     def get_rev_errors(self, revnr=None):
         """
         Returns a list of the dump errors for the given revision. (Obviously)
@@ -926,6 +1707,7 @@ class SvnDumpFileWithHistory(SvnDumpFile):
         # use the current rev number if not gien
         if revnr is None:
             revnr = self.get_rev_nr()
+        self.__collect_digests(revnr, True)
         if self.__rev_errors.has_key(revnr):
             return self.__rev_errors[revnr]
         else:
@@ -960,50 +1742,211 @@ class SvnDumpFileWithHistory(SvnDumpFile):
 
     def __check_node_md5(self, node):
         """
-        Check the md5sum for the current node
+        Check the md5sum and sha1sum for the current node
 
         @type node: SvnDumpNode
         @param node: Current node
         """
-        if self.__enable_check_node_md5 and node.has_text():
-            md = sdt_md5()
+        if not node.has_text():
+            return
+        domd5 = self.__enable_check_node_md5
+        dosha1 = self.__enable_check_node_sha1 and node.has_sha1()
+        if not domd5 and not dosha1:
+            return
+        if self.__digest_pool is not None:
+            self.__submit_digests(node, domd5, dosha1)
+            return
+        mds = []
+        if domd5:
+            md5 = sdt_md5()
+            mds.append(md5)
+        if dosha1:
+            sha1 = hashlib.sha1()
+            mds.append(sha1)
+        textbuf = node.get_text_buffer()
+        if textbuf is not None:
+            # memory mapped, no need to copy the text
+            for md in mds:
+                md.update(textbuf)
+        else:
             handle = node.text_open()
             data = node.text_read(handle)
-            n = 0
             while len(data) > 0:
-                n = n + len(data)
-                md.update(data)
+                for md in mds:
+                    md.update(data)
                 data = node.text_read(handle)
             node.text_close(handle)
-            md5sum = md.hexdigest()
-            if node.get_text_md5() != md5sum:
-                self.__add_rev_error(self.get_rev_nr(),
-                                     [self.ERR_NODE_MD5_FAIL,
-                                      [node.get_path(), md5sum, node.get_text_md5()]], )
+        if domd5:
+            self.__check_digest(self.get_rev_nr(), node.get_path(),
+                                self.ERR_NODE_MD5_FAIL, md5.hexdigest(),
+                                node.get_text_md5())
+        if dosha1:
+            self.__check_digest(self.get_rev_nr(), node.get_path(),
+                                self.ERR_NODE_SHA1_FAIL, sha1.hexdigest(),
+                                node.get_text_sha1())
 
-    def __nodehist_init(self):
+    def __check_digest(self, revnr, path, err, digest, expected, errpos=-1):
         """
-        Initialize the node history
+        Adds an error if a calculated digest doesn't match.
+
+        @type revnr: int
+        @param revnr: Revision number of the node.
+        @type path: string
+        @param path: Path of the node.
+        @type err: int
+        @param err: ERR_NODE_MD5_FAIL or ERR_NODE_SHA1_FAIL.
+        @type digest: string
+        @param digest: The calculated digest.
+        @type expected: string
+        @param expected: The digest of the node.
+        @type errpos: int
+        @param errpos: Position in the error list of the revision at the
+            time the node has been checked, -1 to append the error now.
+        """
+        if digest == expected:
+            return
+        errinfo = [err, [path, digest, expected]]
+        if errpos < 0:
+            self.__add_rev_error(revnr, errinfo)
+        elif self.__digest_failures.has_key(revnr):
+            self.__digest_failures[revnr].append((errpos, errinfo))
+        else:
+            self.__digest_failures[revnr] = [(errpos, errinfo)]
+
+    def __submit_digests(self, node, domd5, dosha1):
         """
+        Adds a node to the digests to calculate by the worker processes.
 
-        # the root always exists and is a directory
-        self.__nodehist = {"": ["D", [0, 999999999]]}
-        self.__rev_errors.clear()
+        @type node: SvnDumpNode
+        @param node: Current node.
+        @type domd5: bool
+        @param domd5: Check the md5 sum.
+        @type dosha1: bool
+        @param dosha1: Check the sha1 sum.
+        """
+        revnr = self.get_rev_nr()
+        errpos = 0
+        if self.__rev_errors.has_key(revnr):
+            errpos = len(self.__rev_errors[revnr])
+        md5 = None
+        if domd5:
+            md5 = node.get_text_md5()
+        sha1 = None
+        if dosha1:
+            sha1 = node.get_text_sha1()
+        self.__digest_batch.append((revnr, errpos, node.get_path(),
+                                    node.get_text_offset(),
+                                    node.get_text_length(), md5, sha1))
+        self.__digest_batch_size += node.get_text_length()
+        if self.__digest_batch_size >= 4194304 or \
+                len(self.__digest_batch) >= 256:
+            self.__flush_digests()
+
+    def __flush_digests(self):
+        """
+        Sends the collected digests to the worker processes.
+        """
+        batch = self.__digest_batch
+        if len(batch) == 0:
+            return
+        ranges = [(offset, length, md5 is not None, sha1 is not None)
+                  for revnr, errpos, path, offset, length, md5, sha1 in batch]
+        result = self.__digest_pool.apply_async(sdt_digest_file_ranges,
+                                                (self.__digest_filename,
+                                                 ranges))
+        self.__digest_jobs.append((batch[0][0], batch, result))
+        self.__digest_batch = []
+        self.__digest_batch_size = 0
 
-    def nodehist_get_kind(self, revnr, path):
+    def __collect_digests(self, revnr, wait):
         """
-        Returns the kind of a node if it exists, else None.
+        Collects the digests calculated by the workers up to a revision.
+
+        The errors are inserted into the error lists at the positions they
+        would have if the digests were calculated in this process.
 
         @type revnr: int
-        @param revnr: Current revision number.
-        @type path: string
-        @param path: Path of a node.
-        @rtype: string
-        @return: "D" for dirs, "F" for files or None.
+        @param revnr: Revision number.
+        @type wait: bool
+        @param wait: Wait for the workers.
+        @rtype: bool
+        @return: False if not waiting and digests are still outstanding.
+        """
+        if self.__digest_pool is None:
+            return True
+        if len(self.__digest_batch) > 0 and \
+                self.__digest_batch[0][0] <= revnr:
+            self.__flush_digests()
+        jobs = self.__digest_jobs
+        while len(jobs) > 0 and jobs[0][0] <= revnr:
+            if not wait and not jobs[0][2].ready():
+                return False
+            firstrevnr, batch, result = jobs.popleft()
+            digests = result.get()
+            for i in range(len(batch)):
+                nrevnr, errpos, path, offset, length, md5, sha1 = batch[i]
+                if md5 is not None:
+                    self.__check_digest(nrevnr, path, self.ERR_NODE_MD5_FAIL,
+                                        digests[i][0], md5, errpos)
+                if sha1 is not None:
+                    self.__check_digest(nrevnr, path,
+                                        self.ERR_NODE_SHA1_FAIL,
+                                        digests[i][1], sha1, errpos)
+        for nrevnr in self.__digest_failures.keys():
+            if nrevnr > revnr:
+                continue
+            if not self.__rev_errors.has_key(nrevnr):
+                self.__rev_errors[nrevnr] = []
+            errlist = self.__rev_errors[nrevnr]
+            failures = self.__digest_failures.pop(nrevnr)
+            failures.reverse()
+            for errpos, errinfo in failures:
+                errlist.insert(errpos, errinfo)
+        return True
+
+    def __start_digest_pool(self, filename):
         """
-        return self.__nodehist_get_kind(revnr, path)
+        Starts the worker processes if needed.
 
-    def __nodehist_get_kind(self, revnr, path):
+        @type filename: string or file object
+        @param filename: The filename given to open().
+        """
+        if self.__digest_workers < 2 or multiprocessing is None or \
+                not isinstance(filename, str) or filename == "-":
+            return
+        if not self.__enable_check_node_md5 and \
+                not self.__enable_check_node_sha1:
+            return
+        if not os.path.isfile(filename) or is_compressed_file(filename):
+            # the workers read the file by name, so it must be a regular
+            # file which isn't compressed (each process would have to
+            # decompress the whole file)
+            return
+        self.__digest_filename = filename
+        self.__digest_pool = multiprocessing.Pool(self.__digest_workers)
+
+    def __stop_digest_pool(self):
+        """
+        Stops the worker processes.
+        """
+        if self.__digest_pool is not None:
+            self.__digest_pool.terminate()
+            self.__digest_pool.join()
+            self.__digest_pool = None
+        self.__digest_batch = []
+        self.__digest_batch_size = 0
+        self.__digest_jobs.clear()
+        self.__digest_failures.clear()
+
+    def __nodehist_init(self):
+        """
+        Initialize the node history
+        """
+
+        self.__nodehist.clear()
+        self.__rev_errors.clear()
+
+    def nodehist_get_kind(self, revnr, path):
         """
         Returns the kind of a node if it exists, else None.
 
@@ -1014,31 +1957,7 @@ class SvnDumpFileWithHistory(SvnDumpFile):
         @rtype: string
         @return: "D" for dirs, "F" for files or None.
         """
-        if not self.__nodehist.has_key(path):
-            return None
-        nodehist = self.__nodehist[path]
-        i = self.__nodehist_get_rev_index(nodehist, revnr)
-        if i is None:
-            return None
-        return nodehist[0][0]
-
-    def __nodehist_get_rev_index(self, nodehist, revnr):
-        """
-        Returns the index into the node history or None.
-
-        @type nodehist: list
-        @param nodehist: History of a node.
-        @type revnr: int
-        @param revnr: Current revision number.
-        """
-        i = len(nodehist) - 1
-        while i > 0 and revnr < nodehist[i][0]:
-            i -= 1
-        if i == 0:
-            return None
-        if revnr > nodehist[i][1] >= 0:
-            return None
-        return i
+        return self.__nodehist.get_kind(revnr, path)
 
     def __nodehist_add_node(self, revnr, node):
         """
@@ -1049,39 +1968,15 @@ class SvnDumpFileWithHistory(SvnDumpFile):
         @type node: SvnDumpNode
         @param node: Node to add.
         """
-        path = node.get_path()
-        if not self.__nodehist.has_key(path):
-            # create revision list for path
-            kind = "D"
-            if node.get_kind() == "file":
-                kind = "F"
-            self.__nodehist[path] = [kind]
-        # add revision range
-        self.__nodehist[path].append([revnr, -1])
-        kind = self.__nodehist[path][0][0]
-        # continue only if it's a dir with copy-from
-        if kind == "F" or not node.has_copy_from():
-            return
-        # recursive copy
-        cfpath = node.get_copy_from_path() + "/"
-        cfpathlen = len(cfpath)
-        cfrev = node.get_copy_from_rev()
-        path += "/"
-        for cfnodepath in self.__nodehist.keys()[:]:
-            if cfnodepath.startswith(cfpath):
-                cfnodehist = self.__nodehist[cfnodepath]
-                i = self.__nodehist_get_rev_index(cfnodehist, cfrev)
-                if i is not None:
-                    npath = path + cfnodepath[cfpathlen:]
-                    # add new path
-                    if not self.__nodehist.has_key(npath):
-                        # create revision list for npath
-                        kind = "D"
-                        if node.get_kind() == "file":
-                            kind = "F"
-                        self.__nodehist[npath] = [cfnodehist[0]]
-                    # add revision range
-                    self.__nodehist[npath].append([revnr, -1])
+        kind = "D"
+        if node.get_kind() == "file":
+            kind = "F"
+        if node.has_copy_from():
+            self.__nodehist.add(revnr, node.get_path(), kind,
+                                node.get_copy_from_path(),
+                                node.get_copy_from_rev())
+        else:
+            self.__nodehist.add(revnr, node.get_path(), kind)
 
     def __nodehist_delete_node(self, revnr, node):
         """
@@ -1092,20 +1987,7 @@ class SvnDumpFileWithHistory(SvnDumpFile):
         @type node: SvnDumpNode
         @param node: Node to add.
         """
-        # set end revision
-        path = node.get_path()
-        self.__nodehist[path][-1][1] = revnr - 1
-        kind = self.__nodehist[path][0][0]
-        # continue only if it's a dir
-        if kind == "F":
-            return
-        # recursive delete
-        path += "/"
-        for nodepath in self.__nodehist.keys()[:]:
-            if nodepath.startswith(path):
-                nodehist = self.__nodehist[nodepath]
-                if nodehist[-1][1] == -1:
-                    nodehist[-1][1] = revnr - 1
+        self.__nodehist.delete(revnr, node.get_path())
 
     def __nodehist_process_node(self, node):
         """
@@ -1119,7 +2001,7 @@ class SvnDumpFileWithHistory(SvnDumpFile):
         revnr = self.get_rev_nr()
         path = node.get_path()
         action = node.get_action()
-        kind = self.__nodehist_get_kind(revnr, path)
+        kind = self.__nodehist.get_kind(revnr, path)
         err = False
         if action == "add":
             if self.__enable_check_node_actions:
@@ -1133,7 +2015,7 @@ class SvnDumpFileWithHistory(SvnDumpFile):
                     slash = path.rfind("/")
                     if slash > 0:
                         ppath = path[:slash]
-                        pkind = self.__nodehist_get_kind(revnr, ppath)
+                        pkind = self.__nodehist.get_kind(revnr, ppath)
                         if pkind is None:
                             self.__add_rev_error(revnr,
                                                  [self.ERR_NODE_NO_PARENT,
@@ -1148,12 +2030,12 @@ class SvnDumpFileWithHistory(SvnDumpFile):
                     if node.has_copy_from():
                         cfrev = node.get_copy_from_rev()
                         cfpath = node.get_copy_from_path()
-                        if self.__nodehist_get_kind(cfrev, cfpath) is None:
+                        if self.__nodehist.get_kind(cfrev, cfpath) is None:
                             self.__add_rev_error(revnr,
                                                  [self.ERR_NODE_NO_COPY_SRC,
                                                   [path, action, cfrev, cfpath]], )
                             err = True
-            if not err or self.__state == self.ST_WRITE:
+            if not err or self.__writing:
                 self.__nodehist_add_node(revnr, node)
         elif action == "delete":
             if self.__enable_check_node_actions:
@@ -1162,7 +2044,7 @@ class SvnDumpFileWithHistory(SvnDumpFile):
                     self.__add_rev_error(revnr,
                                          [self.ERR_NODE_GONE, [path, action]], )
                     err = True
-            if not err or self.__state == self.ST_WRITE:
+            if not err or self.__writing:
                 self.__nodehist_delete_node(revnr, node)
         else:
             if self.__enable_check_node_actions:
@@ -1173,7 +2055,7 @@ class SvnDumpFileWithHistory(SvnDumpFile):
                     err = True
             # replace = delete & add; changes can be ignored
             if action == "replace" and node.has_copy_from():
-                if not err or self.__state == self.ST_WRITE:
+                if not err or self.__writing:
                     self.__nodehist_delete_node(revnr, node)
                     self.__nodehist_add_node(revnr, node)
 
@@ -1185,7 +2067,13 @@ class SvnDumpFileWithHistory(SvnDumpFile):
         """
 
         SvnDumpFile.open(self, filename)
+        self.__writing = False
+        sources = None
+        if self.__enable_nodehist:
+            sources = get_copy_sources(filename)
+        self.__nodehist.set_kept_revs(sources)
         self.__nodehist_init()
+        self.__start_digest_pool(filename)
 
     def create_with_rev_0(self, filename, uuid, rev0date):
         """
@@ -1200,6 +2088,8 @@ class SvnDumpFileWithHistory(SvnDumpFile):
         """
 
         SvnDumpFile.create_with_rev_0(self, filename, uuid, rev0date)
+        self.__writing = True
+        self.__nodehist.set_kept_revs(None)
         self.__nodehist_init()
 
     def create_with_rev_n(self, filename, uuid, firstRevNr):
@@ -1215,6 +2105,8 @@ class SvnDumpFileWithHistory(SvnDumpFile):
         """
 
         SvnDumpFile.create_with_rev_n(self, filename, uuid, firstRevNr)
+        self.__writing = True
+        self.__nodehist.set_kept_revs(None)
         self.__nodehist_init()
 
     def close(self):
@@ -1223,9 +2115,11 @@ class SvnDumpFileWithHistory(SvnDumpFile):
         """
 
         SvnDumpFile.close(self)
+        self.__stop_digest_pool()
         # +++ maybe close should call a protected _close() function which
         # does this here? (clearing things too often doesn't hurt too much)
-        self.__nodehist = {}
+        self.__nodehist.clear()
+        self.__writing = False
         self.__rev_errors.clear()
         self.__prev_date = (0, 0)
 
@@ -1237,11 +2131,13 @@ class SvnDumpFileWithHistory(SvnDumpFile):
         @return: False if EOF occured.
         """
 
-        SvnDumpFile.read_next_rev(self)
+        if not SvnDumpFile.read_next_rev(self):
+            return False
         self.__check_rev_dates()
         for node in self.get_nodes_iter():
             self.__check_node_md5(node)
             self.__nodehist_process_node(node)
+        return True
 
     def add_rev(self, revProps):
         """
@@ -1254,6 +2150,22 @@ class SvnDumpFileWithHistory(SvnDumpFile):
         SvnDumpFile.add_rev(self, revProps)
         self.__check_rev_dates()
 
+    def add_raw_revs(self, fileobj, offset, length, lastRevNr):
+        """
+        Not supported, the node history would miss these revisions.
+        """
+
+        raise SvnDumpException("cannot add raw revisions to a dump file "
+                               "with node history")
+
+    def add_raw_data(self, data, lastRevNr):
+        """
+        Not supported, the node history would miss these revisions.
+        """
+
+        raise SvnDumpException("cannot add raw revisions to a dump file "
+                               "with node history")
+
     def add_node(self, node):
         """
         Add a node to the current revision.
@@ -0,0 +1,497 @@
+# ===============================================================================
+#
+# Copyright (C) 2003 Martin Furter <mf@rola.ch>
+#
+# This file is part of SvnDumpTool
+#
+# SvnDumpTool is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# SvnDumpTool is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with SvnDumpTool; see the file COPYING.  If not, write to
+# the Free Software Foundation, 675 Mass Ave, Cambridge, MA 02139, USA.
+#
+# ===============================================================================
+
+from __future__ import print_function
+
+import bisect
+import os
+import struct
+import sys
+from optparse import OptionParser
+
+from common import SvnDumpException, get_content_length
+from compress import open_dump_file
+
+__doc__ = """Revision offset index of dump files."""
+
+# magic, dump file size, dump file mtime, revision count, copy source count
+_HEADER = struct.Struct("<8sQdQQ")
+_MAGIC = "SDTIDX2\n"
+# revision number, offset, node count, revision properties offset
+_ENTRY_FIELDS = 4
+# copy-from revision number, last revision copying from it
+_SOURCE_FIELDS = 2
+
+
+def index_filename(dumpfilename):
+    """
+    Returns the name of the index file of a dump file.
+
+    @type dumpfilename: string
+    @param dumpfilename: Name of the dump file.
+    @rtype: string
+    @return: Name of the index file.
+    """
+    return dumpfilename + ".sdtidx"
+
+
+def iter_records(dumpfile):
+    """
+    Iterates over the record headers of a dump file.
+
+    Only the tags are parsed, properties and texts are skipped.
+
+    @type dumpfile: file object
+    @param dumpfile: A dump file opened with open_dump_file().
+    @rtype: generator
+    @return: Yields ( offset, content offset, tags ) tuples containing the
+        offset of the record, the offset of its content and its tags.
+    """
+
+    offset = 0
+    while True:
+        # read tag list, skip empty lines before it
+        line = dumpfile.readline()
+        while line == "\n":
+            offset += 1
+            line = dumpfile.readline()
+        if len(line) == 0:
+            return
+        start = offset
+        tags = {}
+        while len(line) > 1:
+            words = line[:-1].split(" ", 1)
+            if len(words) != 2:
+                raise SvnDumpException("illegal Tag line '%s' (offset %d)"
+                                       % (line[:-1], offset))
+            tags[words[0]] = words[1]
+            offset += len(line)
+            line = dumpfile.readline()
+        offset += len(line)
+        yield start, offset, tags
+        # skip properties and text
+        length = get_content_length(tags)
+        if length > 0:
+            offset += length
+            dumpfile.seek(offset)
+
+
+def get_copy_sources(dumpfilename):
+    """
+    Returns the copy sources of a dump file for SvnDumpTree.set_kept_revs().
+
+    The copy sources are read from the index file, the dump file itself
+    isn't read.
+
+    @type dumpfilename: string
+    @param dumpfilename: Name of the dump file.
+    @rtype: dict( integer -> integer )
+    @return: Maps the copy-from revisions to the last revision copying
+        from them, None if the dump file has no (valid) index file.
+    """
+
+    index = SvnDumpIndex()
+    if not index.load(dumpfilename):
+        return None
+    return index.get_copy_sources()
+
+
+class SvnDumpIndex:
+    """
+    An index mapping revision numbers to offsets in a dump file.
+
+    The index is stored in a sidecar file next to the dump file (see
+    index_filename()) and contains the size and mtime of the dump file
+    so that a stale index is detected and ignored.
+    """
+
+    def __init__(self):
+        """
+        Initialize.
+        """
+
+        # size and mtime of the dump file
+        self.__size = 0
+        self.__mtime = 0.0
+        # sorted list of revision numbers
+        self.__revnrs = []
+        # offsets of the revision records
+        self.__offsets = []
+        # node counts of the revisions
+        self.__nodecounts = []
+        # offsets of the revision properties
+        self.__propoffsets = []
+        # copy sources, { copy-from revnr -> last revnr copying from it }
+        self.__sources = {}
+
+    def create(self, dumpfilename):
+        """
+        Creates the index by scanning a dump file.
+
+        Only the record headers are parsed, properties and texts are
+        skipped.
+
+        @type dumpfilename: string
+        @param dumpfilename: Name of the dump file.
+        """
+
+        st = os.stat(dumpfilename)
+        dumpfile = open_dump_file(dumpfilename)
+        revnrs = []
+        offsets = []
+        nodecounts = []
+        propoffsets = []
+        sources = {}
+        try:
+            for start, offset, tags in iter_records(dumpfile):
+                if tags.has_key("Revision-number:"):
+                    revnr = int(tags["Revision-number:"])
+                    if len(revnrs) > 0 and revnr <= revnrs[-1]:
+                        raise SvnDumpException(
+                            "revision numbers not ascending (r%d after r%d)"
+                            % (revnr, revnrs[-1]))
+                    revnrs.append(revnr)
+                    offsets.append(start)
+                    nodecounts.append(0)
+                    propoffsets.append(offset)
+                elif tags.has_key("Node-path:") and len(nodecounts) > 0:
+                    nodecounts[-1] += 1
+                    if tags.has_key("Node-copyfrom-rev:"):
+                        sources[int(tags["Node-copyfrom-rev:"])] = revnrs[-1]
+        finally:
+            dumpfile.close()
+        self.__size = st.st_size
+        self.__mtime = st.st_mtime
+        self.__revnrs = revnrs
+        self.__offsets = offsets
+        self.__nodecounts = nodecounts
+        self.__propoffsets = propoffsets
+        self.__sources = sources
+
+    def save(self, indexfilename):
+        """
+        Writes the index to a file.
+
+        @type indexfilename: string
+        @param indexfilename: Name of the index file.
+        """
+
+        count = len(self.__revnrs)
+        entries = [0] * (count * _ENTRY_FIELDS)
+        entries[0::_ENTRY_FIELDS] = self.__revnrs
+        entries[1::_ENTRY_FIELDS] = self.__offsets
+        entries[2::_ENTRY_FIELDS] = self.__nodecounts
+        entries[3::_ENTRY_FIELDS] = self.__propoffsets
+        sources = []
+        for item in sorted(self.__sources.items()):
+            sources.extend(item)
+        # write to a temp file first, a half written index must not exist
+        tmpname = indexfilename + ".tmp"
+        indexfile = open(tmpname, "wb")
+        indexfile.write(_HEADER.pack(_MAGIC, self.__size, self.__mtime,
+                                     count, len(self.__sources)))
+        indexfile.write(struct.pack("<%dQ" % len(entries), *entries))
+        indexfile.write(struct.pack("<%dQ" % len(sources), *sources))
+        indexfile.close()
+        if os.path.exists(indexfilename):
+            # os.rename doesn't replace files on windows
+            os.remove(indexfilename)
+        os.rename(tmpname, indexfilename)
+
+    def load(self, dumpfilename):
+        """
+        Loads the index of a dump file.
+
+        @type dumpfilename: string
+        @param dumpfilename: Name of the dump file.
+        @rtype: bool
+        @return: False if there's no index or it doesn't match the dump
+            file (size or mtime changed).
+        """
+
+        try:
+            st = os.stat(dumpfilename)
+            indexfile = open(index_filename(dumpfilename), "rb")
+        except (EnvironmentError, TypeError):
+            return False
+        try:
+            data = indexfile.read(_HEADER.size)
+            if len(data) != _HEADER.size:
+                return False
+            magic, size, mtime, count, sourcecount = _HEADER.unpack(data)
+            if magic != _MAGIC or size != st.st_size or \
+                    mtime != st.st_mtime:
+                return False
+            n = count * _ENTRY_FIELDS
+            m = sourcecount * _SOURCE_FIELDS
+            data = indexfile.read((n + m) * 8)
+            if len(data) != (n + m) * 8:
+                return False
+            entries = struct.unpack("<%dQ" % n, data[:n * 8])
+            sources = struct.unpack("<%dQ" % m, data[n * 8:])
+        finally:
+            indexfile.close()
+        self.__size = size
+        self.__mtime = mtime
+        self.__revnrs = list(entries[0::_ENTRY_FIELDS])
+        self.__offsets = entries[1::_ENTRY_FIELDS]
+        self.__nodecounts = entries[2::_ENTRY_FIELDS]
+        self.__propoffsets = entries[3::_ENTRY_FIELDS]
+        self.__sources = dict(zip(sources[0::_SOURCE_FIELDS],
+                                  sources[1::_SOURCE_FIELDS]))
+        return True
+
+    def __find(self, revnr):
+        """
+        Returns the position of a revision in the index.
+
+        @type revnr: integer
+        @param revnr: Revision number.
+        @rtype: integer
+        @return: The position or -1 if the revision isn't in the index.
+        """
+
+        i = self.__find_next(revnr)
+        if i < len(self.__revnrs) and self.__revnrs[i] == revnr:
+            return i
+        return -1
+
+    def __find_next(self, revnr):
+        """
+        Returns the position of the first revision >= revnr in the index.
+
+        @type revnr: integer
+        @param revnr: Revision number.
+        @rtype: integer
+        @return: The position, equal to the revision count if there's no
+            such revision.
+        """
+
+        revnrs = self.__revnrs
+        if len(revnrs) == 0:
+            return 0
+        # revision numbers are normally contiguous
+        i = revnr - revnrs[0]
+        if 0 <= i < len(revnrs) and revnrs[i] == revnr:
+            return i
+        return bisect.bisect_left(revnrs, revnr)
+
+    def find_rev(self, revnr):
+        """
+        Returns number and offset of the first revision >= revnr.
+
+        @type revnr: integer
+        @param revnr: Revision number.
+        @rtype: tuple( integer, integer )
+        @return: Revision number and offset or (-1, -1) if there's no
+            such revision.
+        """
+
+        i = self.__find_next(revnr)
+        if i >= len(self.__revnrs):
+            return -1, -1
+        return self.__revnrs[i], self.__offsets[i]
+
+    def get_rev_count(self):
+        """
+        Returns the count of revisions in the index.
+
+        @rtype: integer
+        @return: Count of revisions.
+        """
+        return len(self.__revnrs)
+
+    def get_rev_nrs(self):
+        """
+        Returns the numbers of the revisions in the index.
+
+        @rtype: list( integer )
+        @return: Ascending revision numbers.
+        """
+        return self.__revnrs
+
+    def is_contiguous(self):
+        """
+        Returns True if the revision numbers have no gaps.
+
+        @rtype: bool
+        @return: True if the revisions are numbered contiguously.
+        """
+
+        revnrs = self.__revnrs
+        return len(revnrs) == 0 or revnrs[-1] - revnrs[0] == len(revnrs) - 1
+
+    def get_rev_range(self, startrev, endrev):
+        """
+        Returns the revisions of a revision range and the location of their
+        records in the dump file.
+
+        The records of a revision end where the next revision starts, the
+        records of the last revision at the end of the dump file.
+
+        @type startrev: integer
+        @param startrev: First revision number of the range.
+        @type endrev: integer
+        @param endrev: Last revision number of the range.
+        @rtype: tuple( integer, integer, integer, integer )
+        @return: Number of the first and the last revision in the range,
+            offset and length of their records or None if the range
+            contains no revisions.
+        """
+
+        i = self.__find_next(startrev)
+        j = self.__find_next(endrev + 1)
+        if i >= j:
+            return None
+        if j < len(self.__offsets):
+            end = self.__offsets[j]
+        else:
+            end = self.__size
+        offset = self.__offsets[i]
+        return self.__revnrs[i], self.__revnrs[j - 1], offset, end - offset
+
+    def get_last_rev_nr(self):
+        """
+        Returns the number of the last revision in the index.
+
+        @rtype: integer
+        @return: Revision number or -1 if the index is empty.
+        """
+
+        if len(self.__revnrs) == 0:
+            return -1
+        return self.__revnrs[-1]
+
+    def get_rev_offset(self, revnr):
+        """
+        Returns the offset of a revision record in the dump file.
+
+        @type revnr: integer
+        @param revnr: Revision number.
+        @rtype: integer
+        @return: The offset or -1 if the revision isn't in the index.
+        """
+
+        i = self.__find(revnr)
+        if i < 0:
+            return -1
+        return self.__offsets[i]
+
+    def get_rev_node_count(self, revnr):
+        """
+        Returns the count of nodes of a revision.
+
+        @type revnr: integer
+        @param revnr: Revision number.
+        @rtype: integer
+        @return: The node count or -1 if the revision isn't in the index.
+        """
+
+        i = self.__find(revnr)
+        if i < 0:
+            return -1
+        return self.__nodecounts[i]
+
+    def get_rev_props_offset(self, revnr):
+        """
+        Returns the offset of the revision properties in the dump file.
+
+        @type revnr: integer
+        @param revnr: Revision number.
+        @rtype: integer
+        @return: The offset or -1 if the revision isn't in the index.
+        """
+
+        i = self.__find(revnr)
+        if i < 0:
+            return -1
+        return self.__propoffsets[i]
+
+    def get_copy_sources(self):
+        """
+        Returns the copy sources of the dump file.
+
+        @rtype: dict( integer -> integer )
+        @return: Maps the copy-from revisions to the last revision copying
+            from them.
+        """
+        return self.__sources
+
+
+def create_index(dumpfilename):
+    """
+    Creates the index file of a dump file.
+
+    @type dumpfilename: string
+    @param dumpfilename: Name of the dump file.
+    @rtype: SvnDumpIndex
+    @return: The index.
+    """
+
+    index = SvnDumpIndex()
+    index.create(dumpfilename)
+    index.save(index_filename(dumpfilename))
+    return index
+
+
+def svndump_index_cmdline(appname, args):
+    """
+    Parses the commandline and creates the index files.
+
+    Usage:
+
+        >>> svndump_index_cmdline( sys.argv[0], sys.argv[1:] )
+
+    @type appname: string
+    @param appname: Name of the application (used in help text).
+    @type args: list( string )
+    @param args: Commandline arguments.
+    @rtype: integer
+    @return: Return code (0 = OK).
+    """
+
+    from svndump import __version
+
+    usage = "usage: %s dumpfiles..." % appname
+    parser = OptionParser(usage=usage, version="%prog " + __version)
+    (options, args) = parser.parse_args(args)
+
+    if len(args) == 0:
+        print("please specify at least one dump file.")
+        return 1
+
+    rc = 0
+    for filename in args:
+        if filename == "-":
+            print("cannot index stdin.", file=sys.stderr)
+            rc = 1
+            continue
+        print("indexing %s ..." % filename)
+        try:
+            index = create_index(filename)
+        except (SvnDumpException, EnvironmentError) as ex:
+            print("  error: %s" % ex, file=sys.stderr)
+            rc = 1
+            continue
+        print("  wrote %s (%d revisions)." % (index_filename(filename),
+                                             index.get_rev_count()))
+    return rc
@@ -45,6 +45,7 @@ def list_authors(srcfile, git_fmt):
     srcdmp = SvnDumpFile()
     # open source file
     authors = []
+    srcdmp.set_text_spooling(False)
     srcdmp.open(srcfile)
     hasrev = srcdmp.read_next_rev()
     if hasrev:
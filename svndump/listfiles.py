@@ -84,6 +84,7 @@ def list_files(srcfile, lister):
     # SvnDumpFile classes for reading/writing dumps
     srcdmp = SvnDumpFile()
     # open source file
+    srcdmp.set_text_spooling(False)
     srcdmp.open(srcfile)
     hasrev = srcdmp.read_next_rev()
     if hasrev:
@@ -27,6 +27,7 @@ import re
 from optparse import OptionParser
 
 from svndump import __version
+from common import sdt_redirect_stdout
 from file import SvnDumpFile
 from node import SvnDumpNode
 
@@ -76,8 +77,11 @@ class SvnDumpMerge:
         """
         Sets the output file name and optional start revision.
 
-        @type filename: string
-        @param filename: Name of the output dump file.
+        Instead of a filename a file object or '-' for stdout can be
+        specified, see SvnDumpFile.create_with_rev_0().
+
+        @type filename: string or file object
+        @param filename: Name of the output dump file or a file object.
         @type startRev: integer
         @param startRev: Start revision number, default is 0.
         """
@@ -190,7 +194,7 @@ class SvnDumpMerge:
         if len(self.__in_files) == 0:
             print("merge: no input files specified")
             return
-        if len(self.__out_file) == 0:
+        if self.__out_file == "":
             print("merge: no output file specified")
             return
 
@@ -477,6 +481,8 @@ def __svndump_merge_opt_o(option, opt, value, parser, *args):
     """
     merge = args[0]
     vars = args[1]
+    if value == "-":
+        sdt_redirect_stdout()
     merge.set_output_file(value)
     vars["outFileSet"] = 1
 
@@ -580,7 +586,7 @@ def svndump_merge_cmdline(appname, args):
                       callback_args=cbargs,
                       nargs=1, type="string",
                       dest="outfile",
-                      help="sets the output filename.")
+                      help="sets the output filename ('-' for stdout).")
     parser.add_option("-d", "--mkdir",
                       action="callback", callback=__svndump_merge_opt_d,
                       callback_args=cbargs,
@@ -22,19 +22,118 @@
 
 from __future__ import print_function
 
+import atexit
+from mmap import mmap
 from os import stat, remove
 from stat import ST_SIZE
+import threading
 
 from common import *
 
+try:
+    intern
+except NameError:
+    from sys import intern
+
 __doc__ = """SvnDumpNode class."""
 
+# action codes
+ACTION_ADD = 0
+ACTION_CHANGE = 1
+ACTION_DELETE = 2
+ACTION_REPLACE = 3
+_action_names = ("add", "change", "delete", "replace")
+_action_codes = {"add": ACTION_ADD, "change": ACTION_CHANGE,
+                 "delete": ACTION_DELETE, "replace": ACTION_REPLACE}
+
+# kind codes
+KIND_NONE = 0
+KIND_FILE = 1
+KIND_DIR = 2
+_kind_names = ("", "file", "dir")
+_kind_codes = {"": KIND_NONE, "file": KIND_FILE, "dir": KIND_DIR}
+
+# temp files used as node texts, { filename -> reference count }
+_temp_files = {}
+# nodes are released by the pipeline threads too
+_temp_files_lock = threading.Lock()
+
+
+def _temp_file_acquire(filename):
+    """
+    Adds a reference to a temp file.
+
+    @type filename: string
+    @param filename: Name of the temp file.
+    """
+    with _temp_files_lock:
+        _temp_files[filename] = _temp_files.get(filename, 0) + 1
+
+
+def _temp_file_release(filename):
+    """
+    Removes a reference to a temp file, deletes it if it was the last one.
+
+    @type filename: string
+    @param filename: Name of the temp file.
+    """
+    with _temp_files_lock:
+        count = _temp_files.get(filename, 0) - 1
+        if count > 0:
+            _temp_files[filename] = count
+            return
+        if _temp_files.has_key(filename):
+            del _temp_files[filename]
+    try:
+        remove(filename)
+    except OSError:
+        pass
+
+
+def has_temp_files():
+    """
+    Returns True if nodes are using temp files as text.
+
+    @rtype: bool
+    @return: True if there are temp files to release.
+    """
+    return len(_temp_files) > 0
 
-class SvnDumpNode:
+
+def _temp_files_cleanup():
+    """
+    Deletes the temp files of nodes which haven't been released.
+    """
+    with _temp_files_lock:
+        for filename in _temp_files.keys():
+            try:
+                remove(filename)
+            except OSError:
+                pass
+        _temp_files.clear()
+
+
+atexit.register(_temp_files_cleanup)
+
+
+class SvnDumpNode(object):
     """
     A node of a svn dump file.
+
+    Action and kind are stored as small ints and paths are interned to keep
+    the memory footprint of big revisions low.
+
+    Temp files set with set_text_file(..., delete=True) are reference
+    counted, they are deleted when release() has been called for all nodes
+    using them or at exit.
     """
 
+    __slots__ = ("__path", "__action", "__kind", "__properties",
+                 "__properties_raw", "__text_len", "__text_md5",
+                 "__text_sha1", "__text_sha256", "__copy_from_path", "__copy_from_rev",
+                 "__file_offset", "__file_name", "__file_delete",
+                 "__file_obj", "__raw_file_obj", "__raw_offset", "__raw_len")
+
     def __init__(self, path, action, kind):
         """
         Initializes a new SvnDumpNode.
@@ -54,32 +153,32 @@ class SvnDumpNode:
         """
 
         # check action
-        if action != "add" and action != "delete" and \
-                        action != "change" and action != "replace":
+        if not _action_codes.has_key(action):
             raise SvnDumpException("Unknown action '%s'." % action)
         # check kind
-        if action != "change":
-            if kind != "" and kind != "file" and kind != "dir":
-                raise SvnDumpException("Unknown kind '%s'" % kind)
-        else:
-            if kind != "file" and kind != "dir":
-                raise SvnDumpException("Unknown kind '%s'" % kind)
+        if not _kind_codes.has_key(kind) or \
+                (kind == "" and action == "change"):
+            raise SvnDumpException("Unknown kind '%s'" % kind)
         # check path +++
 
         # path of this node relative to the repository root
-        self.__path = path
-        # action: 'add', 'change', 'delete' or 'replace'
-        self.__action = action
-        # kind: 'file', 'dir' or 'node' if not known
-        self.__kind = kind
+        self.__path = intern(path)
+        # action: ACTION_ADD, ACTION_CHANGE, ACTION_DELETE or ACTION_REPLACE
+        self.__action = _action_codes[action]
+        # kind: KIND_FILE, KIND_DIR or KIND_NONE if not known
+        self.__kind = _kind_codes[kind]
         # list of properties name=>value pairs
         self.__properties = None
+        # undecoded properties (file object, offset, length) or None
+        self.__properties_raw = None
         # length of the text (file data)
         self.__text_len = -1
         # md5 hash of the text
         self.__text_md5 = ""
         # sha1 hash of the text
         self.__text_sha1 = ""
+        # sha256 hash of the text, see sdt_set_sha256()
+        self.__text_sha256 = ""
         # the from path if copied else ""
         self.__copy_from_path = ""
         # the from revision if copied else 0
@@ -88,18 +187,36 @@ class SvnDumpNode:
         self.__file_offset = -1
         # name of the (temp) file
         self.__file_name = ""
-        # delete the temp file
+        # the file is a temp file (see _temp_file_acquire())
         self.__file_delete = False
         # the file object to read from
         self.__file_obj = None
+        # the raw node record in the dump file it has been read from,
+        # length -1 means not available or modified (dirty)
+        self.__raw_file_obj = None
+        self.__raw_offset = 0
+        self.__raw_len = -1
 
-    def __del__(self):
+    def release(self):
         """
-        Delete method, cleanup temp file if needed.
+        Releases the temp file used as text, if any.
+
+        The temp file is deleted when no other node uses it anymore. The
+        text of this node is not available afterwards.
+        """
+        if self.__file_delete:
+            self.__file_delete = False
+            _temp_file_release(self.__file_name)
+            self.__file_name = ""
+            self.__text_len = -1
+
+    def __release_text(self):
+        """
+        Releases the temp file before setting a new text.
         """
-        if self.__file_delete and self.__file_name != "":
-            # delete temp file
-            remove(self.__file_name)
+        if self.__file_delete:
+            self.__file_delete = False
+            _temp_file_release(self.__file_name)
 
     def get_path(self):
         """
@@ -116,7 +233,9 @@ class SvnDumpNode:
 
         @type path: string
         @param path: New path of this node."""
-        self.__path = path
+        if path != self.__path:
+            self.__raw_len = -1
+        self.__path = intern(path)
 
     def get_name(self):
         """
@@ -134,7 +253,7 @@ class SvnDumpNode:
         @rtype:  string
         @return: Either 'add', 'change', 'delete' or 'replace'.
         """
-        return self.__action
+        return _action_names[self.__action]
 
     def get_kind(self):
         """
@@ -143,7 +262,7 @@ class SvnDumpNode:
         @rtype: string
         @return: Either 'file', 'dir' or ''.
         """
-        return self.__kind
+        return _kind_names[self.__kind]
 
     def get_property(self, name):
         """
@@ -156,6 +275,8 @@ class SvnDumpNode:
         @rtype: string
         @return: Value of the property.
         """
+        if self.__properties_raw is not None:
+            self.__decode_properties()
         if self.__properties is not None and self.__properties.has_key(name):
             return self.__properties[name]
         else:
@@ -168,17 +289,68 @@ class SvnDumpNode:
         @rtype: bool
         @return: True if this node has properties.
         """
-        return self.__properties is not None
+        return self.__properties is not None or \
+               self.__properties_raw is not None
 
     def get_properties(self):
         """
         Returns the properties as a dict.
 
+        The returned dict may be modified by the caller, so the node is
+        no longer written out verbatim after calling this method.
+
         @rtype: dict( string -> string )
         @return: The properties of this node.
         """
+        if self.__properties_raw is not None:
+            self.__decode_properties()
+        self.__raw_len = -1
         return self.__properties
 
+    def get_properties_string(self):
+        """
+        Returns the properties in dump file format.
+
+        Properties which haven't been decoded yet are returned unchanged.
+
+        @rtype: string
+        @return: The properties including PROPS-END or an empty string if
+            this node has no properties.
+        """
+        if self.__properties_raw is not None:
+            return self.__read_properties_raw()
+        return create_prop_string(self.__properties)
+
+    def __read_properties_raw(self):
+        """
+        Reads the undecoded properties.
+
+        @rtype: string
+        @return: The properties including PROPS-END.
+        """
+
+        fileobj, offset, length = self.__properties_raw
+        if isinstance(fileobj, mmap):
+            return fileobj[offset:offset + length]
+        fileobj.seek(offset)
+        data = fileobj.read(length)
+        if len(data) != length:
+            raise SvnDumpException("Unexpected end of file in properties "
+                                   "of node %s" % self.__path)
+        return data
+
+    def __decode_properties(self):
+        """
+        Decodes the properties set by set_properties_raw().
+        """
+
+        properties = parse_prop_block(self.__read_properties_raw())
+        if properties is None:
+            raise SvnDumpException("Illegal properties of node %s" %
+                                   self.__path)
+        self.__properties = properties
+        self.__properties_raw = None
+
     def has_text(self):
         """
         Returns true when this node has text.
@@ -233,6 +405,28 @@ class SvnDumpNode:
         """
         return self.__text_sha1
 
+    def has_sha256(self):
+        """
+        Returns true when this node has a SHA256 sum.
+
+        SHA256 sums are not contained in dump files, they are only
+        calculated for texts set with set_text_file() if enabled with
+        sdt_set_sha256().
+
+        @rtype: bool
+        @return: True when this node has a SHA256 sum.
+        """
+        return len(self.__text_sha256) > 0
+
+    def get_text_sha256(self):
+        """
+        Returns the SHA256 hash of the text.
+
+        @rtype: string
+        @return: SHA256 sum of the text or an empty string.
+        """
+        return self.__text_sha256
+
     def has_copy_from(self):
         """
         Returns True when this node has copy-from-path and copy-from-rev.
@@ -267,6 +461,8 @@ class SvnDumpNode:
         @rtype: integer
         @return: copy-from-rev.
         """
+        if revnr != self.__copy_from_rev:
+            self.__raw_len = -1
         self.__copy_from_rev = revnr
 
     def set_copy_from(self, path, revnr):
@@ -282,10 +478,12 @@ class SvnDumpNode:
         @param revnr: copy-from-rev
         """
 
-        if self.__action != "add" and self.__action != "replace":
+        if self.__action != ACTION_ADD and self.__action != ACTION_REPLACE:
             raise SvnDumpException("Cannot set copy-from for action '%s'" \
-                                   % self.__action)
-        self.__copy_from_path = path
+                                   % self.get_action())
+        if path != self.__copy_from_path or revnr != self.__copy_from_rev:
+            self.__raw_len = -1
+        self.__copy_from_path = intern(path)
         self.__copy_from_rev = revnr
 
     def set_kind(self, kind):
@@ -297,11 +495,12 @@ class SvnDumpNode:
         @type kind: string
         @param kind: New kind, either 'file' or 'dir'.
         """
-        if self.__kind != "":
+        if self.__kind != KIND_NONE:
             raise SvnDumpException("Cannot change node kind")
         if kind != "file" and kind != "dir":
             raise SvnDumpException("Unknown kind '%s'" % kind)
-        self.__kind = kind
+        self.__raw_len = -1
+        self.__kind = _kind_codes[kind]
 
     def set_property(self, name, value):
         """
@@ -315,11 +514,17 @@ class SvnDumpNode:
         @param value: Value of the property.
         """
 
-        if self.__action == "delete":
+        if self.__action == ACTION_DELETE:
             raise SvnDumpException("Cannot set properties for action '%s'" \
-                                   % self.__action)
+                                   % self.get_action())
+        if self.__properties_raw is not None:
+            self.__decode_properties()
         if self.__properties is None:
             self.__properties = {}
+        elif self.__properties.has_key(name) and \
+                self.__properties[name] == value:
+            return
+        self.__raw_len = -1
         self.__properties[name] = value
 
     def del_property(self, name):
@@ -329,11 +534,14 @@ class SvnDumpNode:
         @type name: string
         @param name: Name of the property to delete."""
 
-        if self.__action == "delete":
+        if self.__action == ACTION_DELETE:
             raise SvnDumpException("Cannot delete properties for action '%s'" \
-                                   % self.__action)
+                                   % self.get_action())
+        if self.__properties_raw is not None:
+            self.__decode_properties()
         if self.__properties is not None:
             if self.__properties.has_key(name):
+                self.__raw_len = -1
                 del self.__properties[name]
                 if len(self.__properties) == 0:
                     self.__properties = None
@@ -346,16 +554,44 @@ class SvnDumpNode:
         @param properties: A dict containing the properties.
         """
 
-        if self.__action == "delete":
+        if self.__action == ACTION_DELETE:
             raise SvnDumpException("Cannot set properties for action '%s'" \
-                                   % self.__action)
+                                   % self.get_action())
+        self.__raw_len = -1
         self.__properties = properties
+        self.__properties_raw = None
 
-    def set_text_file(self, filename, length=-1, md5="", delete=False, sha1=""):
+    def set_properties_raw(self, fileobj, offset, length):
+        """
+        Sets the properties for this node without decoding them.
+
+        The properties are decoded when they are accessed the first time.
+        If that never happens they are written out unchanged.
+
+        @type fileobj: file object
+        @param fileobj: A file object opened for reading and containing
+            the properties.
+        @type offset: integer
+        @param offset: Offset of the properties.
+        @type length: integer
+        @param length: Length of the properties including PROPS-END.
+        """
+
+        if self.__action == ACTION_DELETE:
+            raise SvnDumpException("Cannot set properties for action '%s'" \
+                                   % self.get_action())
+        self.__raw_len = -1
+        self.__properties = None
+        self.__properties_raw = (fileobj, offset, length)
+
+    def set_text_file(self, filename, length=-1, md5="", delete=False, sha1="",
+                      sha256=""):
         """
         Sets the text for this node.
 
-        The text will be read from the specified file.
+        The text will be read from the specified file. Missing sums are
+        calculated reading the file once, writers can pass the sums of a
+        TextDigestWriter to avoid reading the file at all.
 
         @type filename: string
         @param filename: Name of the file containing the text.
@@ -367,27 +603,30 @@ class SvnDumpNode:
         @param delete: When True delete the file.
         @type sha1: string, optional
         @param sha1: SHA1 sum of the text if known.
+        @type sha256: string, optional
+        @param sha256: SHA256 sum of the text if known.
         """
 
-        if self.__action == "delete":
+        if self.__action == ACTION_DELETE:
             raise SvnDumpException("Cannot set text for action '%s'" \
-                                   % self.__action)
-        if self.__kind != "file":
+                                   % self.get_action())
+        if self.__kind != KIND_FILE:
             raise SvnDumpException("Cannot set text for kind '%s'" \
-                                   % self.__kind)
+                                   % self.get_kind())
+        self.__raw_len = -1
+        self.__release_text()
         self.__file_name = filename
         self.__file_offset = 0
-        # hmm, no destructors, how to delete that damn temp file ? +++
         self.__file_delete = delete
+        if delete:
+            _temp_file_acquire(filename)
         if length == -1:
             length = stat(filename)[ST_SIZE]
         self.__text_len = length
         self.__text_md5 = md5
-        if not is_valid_md5_string(md5):
-            self.__calculate_md5()
         self.__text_sha1 = sha1
-        if not is_valid_sha1_string(sha1):
-            self.__calculate_sha1()
+        self.__text_sha256 = sha256
+        self.__calculate_digests()
 
     def set_text_fileobj(self, fileobj, offset, length, md5, sha1):
         """
@@ -397,7 +636,8 @@ class SvnDumpNode:
 
         @type fileobj: file object
         @param fileobj: A file object opened for reading and
-            containing the text.
+            containing the text or None if the text is not available
+            (skipped while reading a non-seekable dump file).
         @type offset: integer
         @param offset: Offset of the text.
         @type length: integer
@@ -408,12 +648,15 @@ class SvnDumpNode:
         @param sha1: SHA1 sum of the text.
         """
 
-        if self.__action == "delete":
+        if self.__action == ACTION_DELETE:
             raise SvnDumpException("Cannot set text for action '%s'" \
-                                   % self.__action)
-        if self.__kind != "file":
+                                   % self.get_action())
+        if self.__kind != KIND_FILE:
             raise SvnDumpException("Cannot set text for kind '%s'" \
-                                   % self.__kind)
+                                   % self.get_kind())
+        self.__raw_len = -1
+        self.__release_text()
+        self.__file_name = ""
         self.__file_obj = fileobj
         self.__file_offset = offset
         self.__text_len = length
@@ -421,6 +664,7 @@ class SvnDumpNode:
         # if !is_valid_md5_string( md5 ) or length == -1:
         #    self.__calculate_md5()
         self.__text_sha1 = sha1
+        self.__text_sha256 = ""
 
     def set_text_node(self, node):
         """
@@ -432,20 +676,107 @@ class SvnDumpNode:
         @param node: An other node.
         """
 
-        if self.__action == "delete":
+        if self.__action == ACTION_DELETE:
             raise SvnDumpException("Cannot set text for action '%s'" \
-                                   % self.__action)
-        if self.__kind != "file":
+                                   % self.get_action())
+        if self.__kind != KIND_FILE:
             raise SvnDumpException("Cannot set text for kind '%s'" \
-                                   % self.__kind)
+                                   % self.get_kind())
+        self.__raw_len = -1
+        if node.__file_delete:
+            # one more user of the temp file
+            _temp_file_acquire(node.__file_name)
+        self.__release_text()
         self.__file_name = node.__file_name
-        # dunno how to delete temp file so no special action here +++
         self.__file_delete = node.__file_delete
         self.__file_obj = node.__file_obj
         self.__file_offset = node.__file_offset
         self.__text_len = node.__text_len
         self.__text_md5 = node.__text_md5
         self.__text_sha1 = node.__text_sha1
+        self.__text_sha256 = node.__text_sha256
+
+    def set_raw_fileobj(self, fileobj, offset, length):
+        """
+        Sets the raw node record this node has been read from.
+
+        The record starts with the Node-path header line and ends after
+        the text. As long as the node isn't modified SvnDumpFile.add_node()
+        copies the record as is instead of creating it from the node.
+
+        Must be called after setting path, properties and text.
+
+        @type fileobj: file object
+        @param fileobj: A file object opened for reading and containing
+            the node record.
+        @type offset: integer
+        @param offset: Offset of the record.
+        @type length: integer
+        @param length: Length of the record.
+        """
+
+        self.__raw_file_obj = fileobj
+        self.__raw_offset = offset
+        self.__raw_len = length
+
+    def is_dirty(self):
+        """
+        Returns True if the raw node record is not available.
+
+        That's the case if this node has been modified after reading it
+        from a dump file or if it hasn't been read from a dump file at all.
+
+        @rtype: bool
+        @return: False if the raw node record can be used.
+        """
+        return self.__raw_len < 0
+
+    def write_raw_to_file(self, outfile):
+        """
+        Writes the raw node record to the given file object.
+
+        @type outfile: file object
+        @param outfile: A file object opened for writing.
+        """
+
+        if self.__raw_len < 0:
+            raise SvnDumpException("Node %s has no raw record" % self.__path)
+        sdt_copy_file_range(self.__raw_file_obj, self.__raw_offset,
+                            self.__raw_len, outfile)
+
+    def get_text_buffer(self):
+        """
+        Returns the text as zero-copy buffer if possible.
+
+        This is only possible if the text is in a memory mapped dump
+        file, see SvnDumpFile.set_use_mmap().
+
+        @rtype: buffer or memoryview
+        @return: The text or None.
+        """
+
+        if self.__text_len >= 0 and len(self.__file_name) == 0 and \
+                isinstance(self.__file_obj, mmap):
+            return sdt_buffer(self.__file_obj, self.__file_offset,
+                              self.__text_len)
+        return None
+
+    def get_text_offset(self):
+        """
+        Returns the offset of the text in the file object it is stored in.
+
+        This is the offset in the dump file for nodes read from a seekable
+        dump file.
+
+        @rtype: integer
+        @return: The offset or -1 if the text is stored in a file set with
+            set_text_file() or if there's no text.
+        """
+
+        if self.__text_len >= 0 and len(self.__file_name) == 0 and \
+                self.__file_obj is not None:
+            return self.__file_offset
+        return -1
 
     def write_text_to_file(self, outfile):
         """
@@ -457,20 +788,16 @@ class SvnDumpNode:
 
         if self.__text_len == -1:
             raise SvnDumpException("Node %s has no text" % self.__path)
+        self.__check_text_available()
         if len(self.__file_name) > 0:
-            self.__file_obj = open(self.__file_name, "rb")
+            fileobj = open(self.__file_name, "rb")
+            try:
+                sdt_copy_file_range(fileobj, 0, self.__text_len, outfile)
+            finally:
+                fileobj.close()
         else:
-            self.__file_obj.seek(self.__file_offset)
-        cnt = self.__text_len
-        while cnt > 0:
-            bcnt = cnt
-            if bcnt > 16384:
-                bcnt = 16384
-            outfile.write(self.__file_obj.read(bcnt))
-            cnt = cnt - bcnt
-        if len(self.__file_name) > 0:
-            self.__file_obj.close()
-            self.__file_obj = None
+            sdt_copy_file_range(self.__file_obj, self.__file_offset,
+                                self.__text_len, outfile)
 
     def text_open(self):
         """
@@ -492,6 +819,7 @@ class SvnDumpNode:
 
         if self.__text_len == -1:
             raise SvnDumpException("node has no text")
+        self.__check_text_available()
 
         # create handle
         handle = {}
@@ -507,10 +835,20 @@ class SvnDumpNode:
             handle["offset"] = self.__file_offset
             handle["length"] = self.__text_len
             handle["pos"] = 0
-            self.__file_obj.seek(self.__file_offset)
+            if not isinstance(self.__file_obj, mmap):
+                self.__file_obj.seek(self.__file_offset)
 
         return handle
 
+    def __check_text_available(self):
+        """
+        Raises a SvnDumpException if the text has been skipped.
+        """
+
+        if len(self.__file_name) == 0 and self.__file_obj is None:
+            raise SvnDumpException("Text of node %s is not available" %
+                                   self.__path)
+
     def text_reopen(self, handle):
         """
         Reopen the handle.
@@ -523,7 +861,8 @@ class SvnDumpNode:
         @param handle: A handle opened with text_open().
         """
 
-        handle["file_obj"].seek(handle["offset"])
+        if not isinstance(handle["file_obj"], mmap):
+            handle["file_obj"].seek(handle["offset"])
         handle["pos"] = 0
 
     def text_read(self, handle, count=16384):
@@ -547,8 +886,14 @@ class SvnDumpNode:
         # is more text requested than remains
         if (handle["pos"] + count) > handle["length"]:
             count = handle["length"] - handle["pos"]
-        # read it
-        data = handle["file_obj"].read(count)
+        # read it, memory mapped dump files are sliced so the read
+        # position of the dump file doesn't change
+        fileobj = handle["file_obj"]
+        if isinstance(fileobj, mmap):
+            offset = handle["offset"] + handle["pos"]
+            data = fileobj[offset:offset + count]
+        else:
+            data = fileobj.read(count)
         handle["pos"] = handle["pos"] + count
         return data
 
@@ -565,38 +910,30 @@ class SvnDumpNode:
         if handle["close"]:
             handle["file_obj"].close()
 
-    def __calculate_md5(self):
-        """
-        Calculates the md5 of the text of this node.
+    def __calculate_digests(self):
         """
+        Calculates the missing sums of the text of this node.
 
-        handle = self.text_open()
-        md = sdt_md5()
-        data = self.text_read(handle)
-        n = 0
-        while len(data) > 0:
-            n = n + len(data)
-            md.update(data)
-            data = self.text_read(handle)
-        self.__text_md5 = md.hexdigest()
-        if self.__text_len == -1:
-            self.__text_len = n
-        self.text_close(handle)
-
-    def __calculate_sha1(self):
-        """
-        Calculates the sha1 of the text of this node.
+        All sums are calculated reading the text once.
         """
 
+        sha256 = is_sha256_enabled() and \
+            not is_valid_sha256_string(self.__text_sha256)
+        if is_valid_md5_string(self.__text_md5) and \
+                is_valid_sha1_string(self.__text_sha1) and not sha256:
+            return
+        digest = TextDigest(sha256)
         handle = self.text_open()
-        sha1 = hashlib.sha1()
-        data = self.text_read(handle)
-        n = 0
+        data = self.text_read(handle, 1048576)
         while len(data) > 0:
-            n = n + len(data)
-            sha1.update(data)
-            data = self.text_read(handle)
-        self.__text_sha1 = sha1.hexdigest()
-        if self.__text_len == -1:
-            self.__text_len = n
+            digest.update(data)
+            data = self.text_read(handle, 1048576)
         self.text_close(handle)
+        if not is_valid_md5_string(self.__text_md5):
+            self.__text_md5 = digest.get_md5()
+        if not is_valid_sha1_string(self.__text_sha1):
+            self.__text_sha1 = digest.get_sha1()
+        if sha256:
+            self.__text_sha256 = digest.get_sha256()
+        if self.__text_len == -1:
+            self.__text_len = digest.get_length()
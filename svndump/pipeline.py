@@ -0,0 +1,734 @@
+# ===============================================================================
+#
+# Copyright (C) 2003 Martin Furter <mf@rola.ch>
+#
+# This file is part of SvnDumpTool
+#
+# SvnDumpTool is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# SvnDumpTool is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with SvnDumpTool; see the file COPYING.  If not, write to
+# the Free Software Foundation, 675 Mass Ave, Cambridge, MA 02139, USA.
+#
+# ===============================================================================
+
+import sys
+import threading
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from common import *
+from node import has_temp_files
+
+__doc__ = """Pipelined reading, transforming and writing of dump files."""
+
+
+class SvnDumpRevision(object):
+    """
+    A revision detached from the dump file it has been read from.
+
+    It has the same methods for accessing the revision and its nodes as
+    SvnDumpFile, so transformers and SvnDumpFile.add_rev_from_dump() can
+    use it in place of the dump file while the dump file is already
+    reading the next revision.
+    """
+
+    def __init__(self, dump):
+        """
+        Initialize from the current revision of a dump file.
+
+        The nodes are detached from the dump file, see
+        SvnDumpFile.detach_nodes().
+
+        @type dump: SvnDumpFile
+        @param dump: A dump file.
+        """
+
+        # UUID of the repository
+        self.__uuid = dump.get_uuid()
+        # revision number
+        self.__rev_nr = dump.get_rev_nr()
+        # revision properties
+        self.__rev_props = dump.get_rev_props()
+        # nodes of the revision
+        self.__nodes = dump.detach_nodes()
+        # the revision has been dropped by a transformer
+        self.__dropped = False
+
+    def release(self):
+        """
+        Releases the temp files of the nodes.
+        """
+
+        if has_temp_files():
+            for node in self.__nodes.itervalues():
+                node.release()
+        self.__nodes.clear()
+
+    def drop(self):
+        """
+        Drops this revision, it is not written.
+
+        Copy-from revisions referring to a dropped revision are mapped to
+        the revision written last, see SvnDumpRevMap.
+        """
+
+        self.__dropped = True
+
+    def is_dropped(self):
+        """
+        Returns True if this revision has been dropped.
+
+        @rtype: bool
+        @return: True if dropped.
+        """
+        return self.__dropped
+
+    def has_revision(self):
+        """
+        Returns True, a detached revision always exists.
+
+        @rtype: bool
+        @return: True.
+        """
+        return True
+
+    def get_uuid(self):
+        """
+        Returns the UUID of the dump file of this revision.
+
+        @rtype: string
+        @return: UUID or None.
+        """
+        return self.__uuid
+
+    def get_rev_nr(self):
+        """
+        Returns the revision number.
+
+        @rtype: integer
+        @return: The revision number.
+        """
+        return self.__rev_nr
+
+    def get_rev_date(self):
+        """
+        Returns the date of the revision as ( time_t, micros ).
+
+        @rtype: list( integer )
+        @return: The revision date.
+        """
+        return parse_svn_date_str(self.__rev_props["svn:date"])
+
+    def get_rev_date_str(self):
+        """
+        Returns the date of the revision as string.
+
+        @rtype: string
+        @return: The revision date.
+        """
+        return self.__rev_props["svn:date"]
+
+    def get_rev_author(self):
+        """
+        Returns the author of the revision.
+
+        @rtype: string
+        @return: Author of the revision.
+        """
+        return self.__rev_props["svn:author"]
+
+    def get_rev_log(self):
+        """
+        Returns the log message of the revision.
+
+        @rtype: string
+        @return: The log message.
+        """
+        return self.__rev_props["svn:log"]
+
+    def get_rev_prop_names(self):
+        """
+        Returns a list of revision property names.
+
+        @rtype: list( string )
+        @return: A list of revision property names.
+        """
+        return self.__rev_props.keys()
+
+    def has_rev_prop(self, name):
+        """
+        Returns true if the revision has a property with the specified name.
+
+        @rtype: bool
+        @return: True if the revision has that property.
+        """
+        return self.__rev_props.has_key(name)
+
+    def get_rev_props(self):
+        """
+        Returns a dict containing the revision properties.
+
+        @rtype: dict( string -> string )
+        @return: The revision properties.
+        """
+        return self.__rev_props
+
+    def get_rev_prop_value(self, name):
+        """
+        Returns the value of the revision property with the specified name.
+
+        @type name: string
+        @param name: Name of the property.
+        @rtype: string
+        @return: The value of the revision property.
+        """
+        return self.__rev_props[name]
+
+    def get_node_count(self):
+        """
+        Returns the count of nodes of the revision.
+
+        @rtype: integer
+        @return: Node count of the revision.
+        """
+        return len(self.__nodes)
+
+    def get_node(self, index):
+        """
+        Returns the node at the given index.
+
+        @type index: integer
+        @param index: Index of the node to return.
+        @rtype: SvnDumpNode
+        @return: The node at the given index.
+        """
+        return self.__nodes[index]
+
+    def get_nodes_by_path(self, path, actions="ACDR"):
+        """
+        Returns a list of nodes matching path and actions.
+
+        Actions is a string that may contain one or more of the letters
+        A, C, D and R which are the first letters of the actions Add, Change,
+        Delete and Replace.
+
+        @type path: string
+        @param path: Path of the node.
+        @type actions: string
+        @param actions: Actions to search for.
+        """
+
+        nodes = []
+        for a in actions:
+            upath = (a, path)
+            if self.__nodes.has_key(upath):
+                nodes.append(self.__nodes[upath])
+        return nodes
+
+    def get_nodes_iter(self):
+        """
+        Returns an iterator returning the nodes.
+        """
+
+        return self.__nodes.values()
+
+    def set_node(self, index, node):
+        """
+        Replaces the node at the given index.
+
+        The path and action of the new node must be the same as those of
+        the replaced one.
+
+        @type index: integer
+        @param index: Index of the node to replace.
+        @type node: SvnDumpNode
+        @param node: The new node.
+        """
+        self.__nodes[index] = node
+
+    def set_nodes(self, nodes):
+        """
+        Replaces all nodes of the revision.
+
+        @type nodes: list( SvnDumpNode )
+        @param nodes: The new nodes in order.
+        """
+
+        newnodes = ListDict()
+        for node in nodes:
+            newnodes[(node.get_action()[0].upper(), node.get_path())] = node
+        self.__nodes = newnodes
+
+    def set_rev_date(self, dateStr):
+        """
+        Check a date string, set and return a valid one.
+
+        @type dateStr: string
+        @param dateStr: A svn date string.
+        @rtype: string
+        @return: A svn date string.
+        """
+        if not is_canonical_svn_date_str(dateStr):
+            dateStr = create_svn_date_str(parse_svn_date_str(dateStr))
+        self.__rev_props["svn:date"] = dateStr
+        return dateStr
+
+    def set_rev_author(self, author):
+        """
+        Set the author of this revision.
+
+        @type author: string
+        @param author: The author to set for this revision.
+        """
+        self.__rev_props["svn:author"] = author
+
+    def set_rev_log(self, logMsg):
+        """
+        Set the log message of this revision.
+
+        @type logMsg: string
+        @param logMsg: The log message to set for this revision.
+        """
+        self.__rev_props["svn:log"] = logMsg
+
+    def set_rev_prop_value(self, name, value):
+        """
+        Set the value of the revision property with the specified name to the given value.
+
+        @type name: string
+        @param name: Name of the property.
+        @type value: string
+        @param value: Value of the property.
+        """
+        if name == "svn:date":
+            self.set_rev_date(value)
+        else:
+            self.__rev_props[name] = value
+
+
+class SvnDumpRevMap(object):
+    """
+    Maps the revision numbers of a source dump file to the numbers the
+    revisions got in the destination dump file and fixes the copy-from
+    revisions of the nodes accordingly.
+    """
+
+    def __init__(self):
+        """
+        Initialize.
+        """
+
+        # source revision number -> destination revision number
+        self.__revmap = {}
+
+    def add_rev(self, oldRevNr, newRevNr):
+        """
+        Adds a copied revision.
+
+        @type oldRevNr: integer
+        @param oldRevNr: Revision number in the source dump file.
+        @type newRevNr: integer
+        @param newRevNr: Revision number in the destination dump file.
+        """
+
+        self.__revmap[oldRevNr] = newRevNr
+
+    def map_nodes(self, dump):
+        """
+        Sets the copy-from revisions of the nodes of a revision.
+
+        If the copy-from revision is missing the nearest revision
+        preceding it is used.
+
+        @type dump: SvnDumpFile or SvnDumpRevision
+        @param dump: The revision.
+        """
+
+        revmap = self.__revmap
+        for node in dump.get_nodes_iter():
+            if node.has_copy_from():
+                if revmap.has_key(node.get_copy_from_rev()):
+                    node.set_copy_from_rev(revmap[node.get_copy_from_rev()])
+                else:
+                    # We have a problem, the copy from revision is missing.
+                    # We look for a previous revision containing the file
+                    found = False
+                    candidate = node.get_copy_from_rev()
+                    while candidate > 0 and not found:
+                        candidate = candidate - 1
+                        found = revmap.has_key(candidate)
+                    if found:
+                        revmap[node.get_copy_from_rev()] = candidate
+                        node.set_copy_from_rev(candidate)
+
+
+class SvnDumpTransformChain(object):
+    """
+    Runs several transformers on each revision, one after another.
+
+    A chain is a transformer itself, so a whole chain of transformations
+    is done in one pass by copy_dump_file(). It is pipeline safe and
+    shard safe if all its transformers are. The remaining transformers
+    are skipped for a revision which has been dropped.
+    """
+
+    def __init__(self, transformers):
+        """
+        Initialize.
+
+        @type transformers: list( class with method transform(dump) )
+        @param transformers: The transformers in order.
+        """
+
+        self.__transformers = list(transformers)
+        self.pipeline_safe = True
+        self.shard_safe = True
+        for transformer in self.__transformers:
+            if not getattr(transformer, "pipeline_safe", False):
+                self.pipeline_safe = False
+            if not getattr(transformer, "shard_safe", False):
+                self.shard_safe = False
+
+    def transform(self, dump):
+        """
+        Transforms one revision.
+
+        @type dump: SvnDumpFile or SvnDumpRevision
+        @param dump: The revision to transform.
+        """
+
+        for transformer in self.__transformers:
+            transformer.transform(dump)
+            if isinstance(dump, SvnDumpRevision) and dump.is_dropped():
+                return
+
+
+# marks the end of the revisions in the queues
+_end = object()
+
+
+class SvnDumpPipeline(object):
+    """
+    Reads, transforms and writes the revisions of a dump file in three
+    stages running in their own threads.
+
+    While revision N+1 is read and parsed, revision N is transformed and
+    revision N-1 is written. The stages are connected by bounded queues
+    and process the revisions in order, so the output is the same as
+    when doing everything one after another.
+
+    Transformers are objects with a transform(dump) method. It is called
+    with a SvnDumpRevision in the transform stage if the transformer has
+    an attribute pipeline_safe set to True, which means it uses only the
+    revision and its nodes and not the dump file they have been read
+    from. All other transformers are called with the dump file in the
+    read stage.
+
+    The stages run in one thread if the input file is not memory mapped
+    (see SvnDumpFile.set_use_mmap()) because the texts of the nodes are
+    then read using the file position of the dump file.
+    """
+
+    def __init__(self, srcdmp, transformer=None):
+        """
+        Initialize.
+
+        @type srcdmp: SvnDumpFile
+        @param srcdmp: The dump file to read, must be opened already.
+        @type transformer: class with method transform(dump)
+        @param transformer: A class to perform a transformation on each
+            revision, or None.
+        """
+
+        # the dump file to read
+        self.__srcdmp = srcdmp
+        # the transformer
+        self.__transformer = transformer
+        # maximum count of revisions waiting in each queue
+        self.__queue_size = 2
+        # set when one of the stages failed
+        self.__abort = threading.Event()
+        # sys.exc_info() of the failed stage
+        self.__exception = None
+
+    def set_queue_size(self, size):
+        """
+        Sets the maximum count of revisions waiting between two stages.
+
+        @type size: integer
+        @param size: Size of the queues, at least 1.
+        """
+
+        self.__queue_size = max(1, size)
+
+    def execute(self, writer):
+        """
+        Processes all revisions starting with the current one.
+
+        read_next_rev() must have been called on the dump file, nothing
+        is done if it returned False.
+
+        @type writer: function( SvnDumpRevision )
+        @param writer: Called for each transformed revision in order.
+        """
+
+        transformer = self.__transformer
+        if transformer is not None and \
+                not getattr(transformer, "pipeline_safe", False):
+            # transform in the read stage
+            readtransformer = transformer
+            transformer = None
+        else:
+            readtransformer = None
+        revisions = self.__read(readtransformer)
+        if not self.__srcdmp.is_mmapped():
+            # all stages in this thread
+            if transformer is not None:
+                revisions = self.__transform(revisions, transformer)
+            for revision in revisions:
+                self.__write(writer, revision)
+            return
+        self.__abort.clear()
+        self.__exception = None
+        stages = []
+        try:
+            readq = self.__start(revisions, stages)
+            if transformer is not None:
+                # transform stage
+                revisions = self.__transform(self.__iter_queue(readq),
+                                             transformer)
+                writeq = self.__start(revisions, stages)
+            else:
+                writeq = readq
+            # write stage
+            for revision in self.__iter_queue(writeq):
+                self.__write(writer, revision)
+        except:
+            self.__abort.set()
+            raise
+        finally:
+            self.__stop(stages)
+        if self.__exception is not None:
+            # re-raise with the traceback of the stage
+            exctype, value, tb = self.__exception
+            raise exctype, value, tb
+
+    def __read(self, transformer):
+        """
+        The read stage.
+
+        @type transformer: class with method transform(dump)
+        @param transformer: A transformer to call with the dump file or
+            None.
+        @rtype: generator
+        @return: Yields the detached revisions.
+        """
+
+        srcdmp = self.__srcdmp
+        hasrev = srcdmp.has_revision()
+        while hasrev:
+            if transformer is not None:
+                transformer.transform(srcdmp)
+            yield SvnDumpRevision(srcdmp)
+            hasrev = srcdmp.read_next_rev()
+
+    def __transform(self, revisions, transformer):
+        """
+        The transform stage.
+
+        @type revisions: iterable
+        @param revisions: The revisions to transform.
+        @type transformer: class with method transform(dump)
+        @param transformer: The transformer.
+        @rtype: generator
+        @return: Yields the transformed revisions.
+        """
+
+        for revision in revisions:
+            transformer.transform(revision)
+            yield revision
+
+    def __write(self, writer, revision):
+        """
+        Writes one revision and releases its nodes.
+
+        @type writer: function( SvnDumpRevision )
+        @param writer: The write function.
+        @type revision: SvnDumpRevision
+        @param revision: The revision.
+        """
+
+        try:
+            writer(revision)
+        finally:
+            revision.release()
+
+    def __start(self, revisions, stages):
+        """
+        Starts a thread putting the revisions into a new queue.
+
+        @type revisions: iterable
+        @param revisions: The revisions, iterated in the new thread.
+        @type stages: list( tuple( Thread, Queue ) )
+        @param stages: The started thread and its queue are appended.
+        @rtype: Queue
+        @return: The queue.
+        """
+
+        revq = queue.Queue(self.__queue_size)
+        thread = threading.Thread(target=self.__run, args=(revisions, revq))
+        thread.daemon = True
+        thread.start()
+        stages.append((thread, revq))
+        return revq
+
+    def __stop(self, stages):
+        """
+        Waits until the threads of the stages have finished.
+
+        The queues are emptied while waiting, so stages of an aborted
+        pipeline don't block on full queues.
+
+        @type stages: list( tuple( Thread, Queue ) )
+        @param stages: The threads and their queues.
+        """
+
+        for thread, revq in stages:
+            while thread.is_alive():
+                for otherthread, otherq in stages:
+                    try:
+                        while True:
+                            otherq.get_nowait()
+                    except queue.Empty:
+                        pass
+                thread.join(0.01)
+
+    def __run(self, revisions, revq):
+        """
+        Thread function of a stage.
+
+        Exceptions are passed to the main thread and stop all stages.
+
+        @type revisions: iterable
+        @param revisions: The revisions.
+        @type revq: Queue
+        @param revq: The queue to put them into.
+        """
+
+        try:
+            for revision in revisions:
+                if self.__abort.is_set():
+                    break
+                revq.put(revision)
+        except Exception:
+            if self.__exception is None:
+                self.__exception = sys.exc_info()
+            self.__abort.set()
+        revq.put(_end)
+
+    def __iter_queue(self, revq):
+        """
+        Iterates over the items of a queue until the end marker.
+
+        Stops early if the pipeline has been aborted.
+
+        @type revq: Queue
+        @param revq: The queue.
+        @rtype: generator
+        @return: Yields the items.
+        """
+
+        while True:
+            item = revq.get()
+            if item is _end or self.__abort.is_set():
+                return
+            yield item
+
+
+class SvnDumpWriterThread(object):
+    """
+    Calls a writer function for each item put into it in a thread of its
+    own.
+
+    The items are passed through a bounded queue, so the thread putting
+    them only has to wait when the writer falls behind by more than the
+    size of the queue. Several of them let a reader feed several outputs
+    without a slow one holding up the others.
+
+    When the writer function fails the remaining items are discarded and
+    the exception is raised by the next put() or by finish().
+    """
+
+    def __init__(self, writer, queuesize=4):
+        """
+        Initialize and start the thread.
+
+        @type writer: function( object )
+        @param writer: Called for each item in order.
+        @type queuesize: integer
+        @param queuesize: Maximum count of items waiting, at least 1.
+        """
+
+        self.__writer = writer
+        self.__queue = queue.Queue(max(1, queuesize))
+        # sys.exc_info() of the exception raised by the writer
+        self.__exception = None
+        self.__thread = threading.Thread(target=self.__run)
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    def put(self, item):
+        """
+        Passes an item to the writer.
+
+        @type item: object
+        @param item: The item.
+        """
+
+        self.__raise_exception()
+        self.__queue.put(item)
+
+    def finish(self):
+        """
+        Waits until all items have been written and stops the thread.
+        """
+
+        self.__queue.put(_end)
+        self.__thread.join()
+        self.__raise_exception()
+
+    def __raise_exception(self):
+        """
+        Re-raises the exception of the writer with its traceback.
+        """
+
+        if self.__exception is not None:
+            exctype, value, tb = self.__exception
+            raise exctype, value, tb
+
+    def __run(self):
+        """
+        Thread function.
+        """
+
+        while True:
+            item = self.__queue.get()
+            if item is _end:
+                return
+            if self.__exception is None:
+                try:
+                    self.__writer(item)
+                except Exception:
+                    self.__exception = sys.exc_info()
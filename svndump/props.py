@@ -28,7 +28,8 @@ import os
 import re
 import sys
 
-from svndump import __version, copy_dump_file, SvnDumpFile
+from svndump import __version, copy_dump_file
+from common import sdt_redirect_stdout
 
 
 def re_sub(pattern, replacement, string):
@@ -67,6 +68,9 @@ class RevisionPropertyTransformer:
     A class for transforming the revision properties of a dump file class.
     """
 
+    pipeline_safe = True
+    shard_safe = True
+
     def __init__(self, propertyName, regexStr, replaceTemplate):
         """
         Creates a RevisionPropertyTransformer class.
@@ -107,16 +111,22 @@ def svndump_transform_revprop_cmdline(appname, args):
     @return: Return code (0 = OK).
     """
 
-    usage = "usage: %s propname regex replace source destination" % appname
+    usage = "usage: %s [options] propname regex replace source destination" % appname
     parser = OptionParser(usage=usage, version="%prog " + __version)
+    parser.add_option("-j", "--jobs",
+                      action="store", type="int", dest="jobs", default=1,
+                      help="number of processes copying the dump file")
     (options, args) = parser.parse_args(args)
 
     if len(args) != 5:
         print("specify exactly one propname to transform, one regex to match the value against,\n"
               "one replacement string, one source dump file and one destination dump file.")
         return 1
+    if args[4] == "-":
+        sdt_redirect_stdout()
 
-    copy_dump_file(args[3], args[4], RevisionPropertyTransformer(args[0], args[1], args[2]))
+    copy_dump_file(args[3], args[4], RevisionPropertyTransformer(args[0], args[1], args[2]),
+                   options.jobs)
     return 0
 
 
@@ -125,6 +135,9 @@ class EolRevisionPropertyTransformer:
     A class for fixing EOL of the revision properties of a dump file class.
     """
 
+    pipeline_safe = True
+    shard_safe = True
+
     def __init__(self, propertyName):
         """
         Creates a EolRevisionPropertyTransformer class.
@@ -159,15 +172,21 @@ def svndump_eolfix_revprop_cmdline(appname, args):
     @return: Return code (0 = OK).
     """
 
-    usage = "usage: %s propname source destination" % appname
+    usage = "usage: %s [options] propname source destination" % appname
     parser = OptionParser(usage=usage, version="%prog " + __version)
+    parser.add_option("-j", "--jobs",
+                      action="store", type="int", dest="jobs", default=1,
+                      help="number of processes copying the dump file")
     (options, args) = parser.parse_args(args)
 
     if len(args) != 3:
         print("specify exactly one propname to fix EOL, one source dump file and one destination dump file.")
         return 1
+    if args[2] == "-":
+        sdt_redirect_stdout()
 
-    copy_dump_file(args[1], args[2], EolRevisionPropertyTransformer(args[0]))
+    copy_dump_file(args[1], args[2], EolRevisionPropertyTransformer(args[0]),
+                   options.jobs)
     return 0
 
 
@@ -176,6 +195,9 @@ class PropertyTransformer:
     A class for transforming the properties of a dump file class.
     """
 
+    pipeline_safe = True
+    shard_safe = True
+
     def __init__(self, propertyName, regexStr, replaceTemplate):
         """
         Creates a RevisionPropertyTransformer class.
@@ -215,16 +237,22 @@ def svndump_transform_prop_cmdline(appname, args):
     @return: Return code (0 = OK).
     """
 
-    usage = "usage: %s propname regex replace source destination" % appname
+    usage = "usage: %s [options] propname regex replace source destination" % appname
     parser = OptionParser(usage=usage, version="%prog " + __version)
+    parser.add_option("-j", "--jobs",
+                      action="store", type="int", dest="jobs", default=1,
+                      help="number of processes copying the dump file")
     (options, args) = parser.parse_args(args)
 
     if len(args) != 5:
         print("specify exactly one propname to transform, one regex to match the value against,\n"
               "one replacement string, one source dump file and one destination dump file.")
         return 1
+    if args[4] == "-":
+        sdt_redirect_stdout()
 
-    copy_dump_file(args[3], args[4], PropertyTransformer(args[0], args[1], args[2]))
+    copy_dump_file(args[3], args[4], PropertyTransformer(args[0], args[1], args[2]),
+                   options.jobs)
     return 0
 
 
@@ -233,6 +261,9 @@ class EolPropertyTransformer:
     A class for fixing EOL of the properties of a dump file class.
     """
 
+    pipeline_safe = True
+    shard_safe = True
+
     def __init__(self, propertyName):
         """
         Creates a EolPropertyTransformer class.
@@ -267,15 +298,21 @@ def svndump_eolfix_prop_cmdline(appname, args):
     @return: Return code (0 = OK).
     """
 
-    usage = "usage: %s propname source destination" % appname
+    usage = "usage: %s [options] propname source destination" % appname
     parser = OptionParser(usage=usage, version="%prog " + __version)
+    parser.add_option("-j", "--jobs",
+                      action="store", type="int", dest="jobs", default=1,
+                      help="number of processes copying the dump file")
     (options, args) = parser.parse_args(args)
 
     if len(args) != 3:
         print("specify exactly one propname to fix EOL, one source dump file and one destination dump file.")
         return 1
+    if args[2] == "-":
+        sdt_redirect_stdout()
 
-    copy_dump_file(args[1], args[2], EolPropertyTransformer(args[0]))
+    copy_dump_file(args[1], args[2], EolPropertyTransformer(args[0]),
+                   options.jobs)
     return 0
 
 
@@ -365,6 +402,8 @@ class ApplyAutoprops:
     A class for applying auto-props to a Subversion dump file.
     """
 
+    pipeline_safe = True
+
     def __init__(self, inputfilename, outputfilename, configfile):
         """
         Initializes the ApplyAutoprops object.
@@ -387,30 +426,27 @@ class ApplyAutoprops:
         """
         try:
             self._read_config()
-            inDump = SvnDumpFile()
-            outDump = SvnDumpFile()
-            inDump.open(self.inputfilename)
-            inDump.read_next_rev()
-            outDump.create_like(self.outputfilename, inDump)
-            while inDump.has_revision():
-                print("revision %d" % inDump.get_rev_nr())
-                outDump.add_rev(inDump.get_rev_props())
-                for index in range(0, inDump.get_node_count()):
-                    node = inDump.get_node(index)
-                    action = node.get_action()
-                    if action in ("add", "replace"):
-                        self._set_properties(node)
-                    elif action == "change" and node.has_properties():
-                        self._set_properties(node)
-                    outDump.add_node(node)
-                inDump.read_next_rev()
-            inDump.close()
-            outDump.close()
+            copy_dump_file(self.inputfilename, self.outputfilename, self)
         except Exception as ex:
             print("Error:", ex)
             return 1
         return 0
 
+    def transform(self, dump):
+        """
+        Applies the auto-props to one revision.
+
+        @type dump: SvnDumpFile or SvnDumpRevision
+        @param dump: The revision to transform.
+        """
+        print("revision %d" % dump.get_rev_nr())
+        for node in dump.get_nodes_iter():
+            action = node.get_action()
+            if action in ("add", "replace"):
+                self._set_properties(node)
+            elif action == "change" and node.has_properties():
+                self._set_properties(node)
+
     def _set_properties(self, node):
         """
         Set the auto-props.
@@ -567,6 +603,8 @@ def svndump_apply_autoprops_cmdline(appname, args):
     configfile = options.configfile
     if configfile is None:
         configfile = svnconf.path()
+    if args[1] == "-":
+        sdt_redirect_stdout()
 
     aa = ApplyAutoprops(args[0], args[1], configfile)
     return aa.apply()
@@ -27,58 +27,49 @@ from __future__ import print_function
 from optparse import OptionParser
 import re
 
-from svndump import __version, SvnDumpFile
+from svndump import __version, copy_dump_file
+from common import sdt_redirect_stdout
 
 
-def copy_remove_prop(propname, regex, srcfile, dstfile):
+class RemovePropertyTransformer:
     """
-    Copy a dump file while removing all properties with values matching a given regex.
-
-    @type srcfile: string
-    @param srcfile: Source filename.
-    @type dstfile: string
-    @param dstfile: Destination filename.
+    A class removing all properties with values matching a given regex.
     """
 
-    _regex = re.compile(regex, re.M)
+    pipeline_safe = True
+    shard_safe = True
 
-    # SvnDumpFile classes for reading/writing dumps
-    srcdmp = SvnDumpFile()
-    dstdmp = SvnDumpFile()
+    def __init__(self, propname, regex):
+        """
+        Creates a RemovePropertyTransformer class.
 
-    # open source file
-    srcdmp.open(srcfile)
+        @type propname: string
+        @param propname: Name of the property to remove.
+        @type regex: string
+        @param regex: The regular expression to match the value against.
+        """
+        self.__propname = propname
+        self.__regex = re.compile(regex, re.M)
 
-    # used to ensure that copyfrom-revs are correct after the copy.  If
-    # there are any empty revision in the source dump file, the copyfrom-revs
-    # could be affected.
-    revmap = {}
+    def transform(self, dump):
+        for node in dump.get_nodes_iter():
+            propvalue = node.get_property(self.__propname)
+            if propvalue is not None and self.__regex.match(propvalue):
+                print("removing property " + self.__propname + " with value " + propvalue.strip())
+                node.del_property(self.__propname)
 
-    hasrev = srcdmp.read_next_rev()
-    if hasrev:
-        # create the dump file
-        dstdmp.create_like(dstfile, srcdmp)
-        # now copy all the revisions
-        while hasrev:
-            dstdmp.add_rev(srcdmp.get_rev_props())
-            for node in srcdmp.get_nodes_iter():
-                if node.has_copy_from():
-                    node.set_copy_from(node.get_copy_from_path(), revmap[node.get_copy_from_rev()])
 
-                propvalue = node.get_property(propname)
-                if propvalue is not None and _regex.match(propvalue):
-                    print("removing property " + propname + " with value " + propvalue.strip())
-                    node.del_property(propname)
-                dstdmp.add_node(node)
+def copy_remove_prop(propname, regex, srcfile, dstfile):
+    """
+    Copy a dump file while removing all properties with values matching a given regex.
 
-            revmap[srcdmp.get_rev_nr()] = dstdmp.get_rev_nr()
-            hasrev = srcdmp.read_next_rev()
-    else:
-        print("no revisions in the source dump '%s' ???" % srcfile)
+    @type srcfile: string
+    @param srcfile: Source filename.
+    @type dstfile: string
+    @param dstfile: Destination filename.
+    """
 
-    # cleanup
-    srcdmp.close()
-    dstdmp.close()
+    copy_dump_file(srcfile, dstfile, RemovePropertyTransformer(propname, regex))
 
 
 def svndump_remove_prop(appname, args):
@@ -105,6 +96,8 @@ def svndump_remove_prop(appname, args):
     if len(args) != 4:
         print("specify a property name, regex, source dump file and a destination dump file")
         return 1
+    if args[3] == "-":
+        sdt_redirect_stdout()
 
     copy_remove_prop(args[0], args[1], args[2], args[3])
     return 0
@@ -38,16 +38,25 @@ except ImportError:
 from svndump import __version
 from optparse import OptionParser
 from file import SvnDumpFile
+from common import TextDigestWriter, sdt_redirect_stdout
 from __init__ import copy_dump_file
 
 
 class SanitizeDumpFile(object):
+    pipeline_safe = True
+
     def __init__(self, options):
         self.__options = options
         self.sanitize_salt = self.salthex_to_salt(options.salt)
         print("Using salt %s" % (options.salt,))
         self.sanitized_authors = []
 
+    @property
+    def shard_safe(self):
+        """Revisions can be sanitized independently unless usernames are
+        replaced, authorN is numbered in order of appearance."""
+        return not self.__options.usernames
+
     def transform(self, dump):
         """The dump object passed to this method has been set to the revision
         we're to transform"""
@@ -106,7 +115,7 @@ class SanitizeDumpFile(object):
             origdatafile.seek(0)
             # New data tempfile
             (fd, newname) = tempfile.mkstemp(prefix="svndumptool")
-            newdatafile = os.fdopen(fd, "wb+")
+            newdatafile = TextDigestWriter(os.fdopen(fd, "wb+"))
             if self.__options.file_data_method == "whole":
                 # Calculate the salted md5sum
                 md5sum = sdt_md5()
@@ -129,8 +138,11 @@ class SanitizeDumpFile(object):
             # clean up the original tempfile
             origdatafile.close()
             os.remove(origname)
-            # Set the new content.
-            node.set_text_file(newname, delete=True)
+            # Set the new content, the writer calculated its sums.
+            digest = newdatafile.get_digest()
+            node.set_text_file(newname, digest.get_length(),
+                               digest.get_md5(), True, digest.get_sha1(),
+                               digest.get_sha256())
 
         if self.__options.filenames and node.get_path():
             node.set_path(self.sanitize_path(node.get_path()))
@@ -165,6 +177,35 @@ def svndump_sanitize_cmdline(appname, args):
     """
 
     usage = "usage: %s [options] source destination" % appname
+    parser = sanitize_option_parser(usage)
+    parser.add_option("-j", "--jobs",
+                      action="store", type="int", dest="jobs", default=1,
+                      help="number of processes sanitizing the dump file "
+                           "(not with usernames sanitized)")
+
+    (options, args) = parser.parse_args(args)
+
+    if len(args) != 2:
+        print("specify exactly one source and one destination dump file.")
+        return 1
+    if args[1] == "-":
+        sdt_redirect_stdout()
+
+    sanitizer = SanitizeDumpFile(options)
+    copy_dump_file(args[0], args[1], sanitizer, options.jobs)
+    return 0
+
+
+def sanitize_option_parser(usage):
+    """
+    Creates an option parser for the sanitize options.
+
+    @type usage: string
+    @param usage: Usage string for the help text.
+    @rtype: OptionParser
+    @return: The option parser.
+    """
+
     parser = OptionParser(usage=usage, version="%prog " + __version)
     parser.add_option("-f", "--no-file-data",
                       help="Do not sanitize file data.  (Equivalent to --file-data=none.)",
@@ -189,16 +230,7 @@ def svndump_sanitize_cmdline(appname, args):
     parser.add_option("-s", "--salt",
                       help="Specify the salt to use in hex",
                       dest="salt", default=random_salt)
-
-    (options, args) = parser.parse_args(args)
-
-    if len(args) != 2:
-        print("specify exactly one source and one destination dump file.")
-        return 1
-
-    sanitizer = SanitizeDumpFile(options)
-    copy_dump_file(args[0], args[1], sanitizer)
-    return 0
+    return parser
 
 
 def sdt_md5():
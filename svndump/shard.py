@@ -0,0 +1,248 @@
+# ===============================================================================
+#
+# Copyright (C) 2003 Martin Furter <mf@rola.ch>
+#
+# This file is part of SvnDumpTool
+#
+# SvnDumpTool is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# SvnDumpTool is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with SvnDumpTool; see the file COPYING.  If not, write to
+# the Free Software Foundation, 675 Mass Ave, Cambridge, MA 02139, USA.
+#
+# ===============================================================================
+
+from __future__ import print_function
+
+import bisect
+import os
+import sys
+import tempfile
+from cStringIO import StringIO
+
+try:
+    import multiprocessing
+except ImportError:
+    multiprocessing = None
+
+from common import SvnDumpException
+from compress import is_compressed_file
+from file import SvnDumpFile
+from index import SvnDumpIndex
+
+__doc__ = """Copying dump files in revision shards using several processes."""
+
+# header of the fragments, fragments are created without UUID
+_FRAGMENT_HEADER = "SVN-fs-dump-format-version: 2\n\n"
+# minimum size of a shard
+_MIN_SHARD_SIZE = 16 * 1024 * 1024
+# count of shards per process
+_SHARDS_PER_JOB = 4
+
+
+def is_shard_safe(transformer):
+    """
+    Returns True if a transformer can be used for copying in shards.
+
+    That's the case if the transformer has an attribute shard_safe set to
+    True, which means the transformation of a revision doesn't depend on
+    the revisions preceding it.
+
+    @type transformer: class with method transform(dump)
+    @param transformer: A transformer or None.
+    @rtype: bool
+    @return: True if transformer is None or shard safe.
+    """
+
+    return transformer is None or getattr(transformer, "shard_safe", False)
+
+
+def copy_dump_shards(srcfile, srcdmp, dstfile, dstdmp, transformer, jobs):
+    """
+    Copies the remaining revisions of a dump file using several processes.
+
+    The revisions starting with the current one of srcdmp are split into
+    shards at revision boundaries, using the index file of the dump file
+    or a scan of the revision headers. Each shard is copied in a separate
+    process into a fragment file. The fragments are then appended to
+    dstdmp in order and the output of the processes is printed.
+
+    Nothing is done and False is returned if the dump file cannot be
+    split: transformer isn't shard safe (see is_shard_safe()), the dump
+    file isn't an uncompressed regular file, the revisions are not numbered
+    contiguously starting at the next revision number of dstdmp or they
+    don't fill enough shards.
+
+    @type srcfile: string
+    @param srcfile: Name of the source dump file.
+    @type srcdmp: SvnDumpFile
+    @param srcdmp: The source dump file, opened and at the first revision
+        to copy.
+    @type dstfile: string
+    @param dstfile: Name of the destination dump file.
+    @type dstdmp: SvnDumpFile
+    @param dstdmp: The destination dump file, created.
+    @type transformer: class with method transform(dump)
+    @param transformer: A class to perform a transformation on each
+        revision, or None.
+    @type jobs: integer
+    @param jobs: Count of processes.
+    @rtype: bool
+    @return: True if the revisions have been copied.
+    """
+
+    if multiprocessing is None or jobs < 2 or \
+            not is_shard_safe(transformer) or \
+            not isinstance(srcfile, str) or not os.path.isfile(srcfile) or \
+            not isinstance(dstfile, str) or is_compressed_file(srcfile) or \
+            not srcdmp.has_revision() or \
+            srcdmp.get_rev_nr() != dstdmp.get_rev_nr() + 1:
+        return False
+    shards = _split_revisions(srcfile, srcdmp.get_rev_nr(),
+                              jobs * _SHARDS_PER_JOB)
+    if len(shards) < 2:
+        return False
+
+    fragdir = os.path.dirname(os.path.abspath(dstfile))
+    fragments = []
+    pool = None
+    try:
+        tasks = []
+        for firstrev, lastrev, offset in shards:
+            fd, fragname = tempfile.mkstemp(prefix=".svndumptool",
+                                            suffix=".part", dir=fragdir)
+            os.close(fd)
+            fragments.append(fragname)
+            tasks.append((srcfile, fragname, firstrev, lastrev, offset,
+                          transformer))
+        pool = multiprocessing.Pool(min(jobs, len(tasks)))
+        i = 0
+        for output in pool.imap(_copy_shard, tasks):
+            sys.stdout.write(output)
+            fragname = fragments[i]
+            _append_fragment(dstdmp, fragname, tasks[i][3])
+            os.remove(fragname)
+            i += 1
+        pool.close()
+        pool.join()
+        pool = None
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+        for fragname in fragments:
+            if os.path.exists(fragname):
+                os.remove(fragname)
+    return True
+
+
+def _split_revisions(srcfile, firstrev, count):
+    """
+    Splits the revisions of a dump file into shards of similar size.
+
+    @type srcfile: string
+    @param srcfile: Name of the dump file.
+    @type firstrev: integer
+    @param firstrev: Number of the first revision to split.
+    @type count: integer
+    @param count: Maximum count of shards.
+    @rtype: list( tuple( integer, integer, integer ) )
+    @return: First and last revision number and offset of each shard,
+        an empty list if the revisions are not numbered contiguously.
+    """
+
+    index = SvnDumpIndex()
+    if not index.load(srcfile):
+        index.create(srcfile)
+    revnrs = index.get_rev_nrs()
+    i = bisect.bisect_left(revnrs, firstrev)
+    if i >= len(revnrs) or revnrs[i] != firstrev or \
+            revnrs[-1] - firstrev != len(revnrs) - 1 - i:
+        return []
+    start = index.get_rev_offset(firstrev)
+    size = os.path.getsize(srcfile) - start
+    shardsize = max(size // count, _MIN_SHARD_SIZE)
+    shards = []
+    shardrev = firstrev
+    shardoffset = start
+    for revnr in revnrs[i + 1:]:
+        offset = index.get_rev_offset(revnr)
+        if offset - shardoffset >= shardsize:
+            shards.append((shardrev, revnr - 1, shardoffset))
+            shardrev = revnr
+            shardoffset = offset
+    shards.append((shardrev, revnrs[-1], shardoffset))
+    return shards
+
+
+def _copy_shard(task):
+    """
+    Copies one shard into a fragment file, runs in a worker process.
+
+    @type task: tuple
+    @param task: Source file name, fragment file name, first and last
+        revision number, offset of the first revision and transformer.
+    @rtype: string
+    @return: The output printed while copying.
+    """
+
+    srcfile, fragname, firstrev, lastrev, offset, transformer = task
+    stdout = sys.stdout
+    sys.stdout = output = StringIO()
+    try:
+        srcdmp = SvnDumpFile()
+        srcdmp.set_use_mmap(True)
+        srcdmp.open(srcfile)
+        srcdmp.seek_rev_offset(firstrev, offset)
+        dstdmp = SvnDumpFile()
+        dstdmp.create_with_rev_n(fragname, None, firstrev)
+        # the revisions keep their numbers, so the copy-from revisions
+        # don't need to be mapped
+        hasrev = srcdmp.read_next_rev()
+        while hasrev:
+            if transformer is not None:
+                transformer.transform(srcdmp)
+            dstdmp.add_rev_from_dump(srcdmp)
+            if srcdmp.get_rev_nr() >= lastrev:
+                break
+            hasrev = srcdmp.read_next_rev()
+        srcdmp.close()
+        dstdmp.close()
+    finally:
+        sys.stdout = stdout
+    if dstdmp.get_rev_nr() != lastrev:
+        raise SvnDumpException("shard r%d-r%d ended at r%d" %
+                               (firstrev, lastrev, dstdmp.get_rev_nr()))
+    return output.getvalue()
+
+
+def _append_fragment(dstdmp, fragname, lastrev):
+    """
+    Appends the revisions of a fragment file to a dump file.
+
+    @type dstdmp: SvnDumpFile
+    @param dstdmp: The destination dump file.
+    @type fragname: string
+    @param fragname: Name of the fragment file.
+    @type lastrev: integer
+    @param lastrev: Number of the last revision in the fragment.
+    """
+
+    fragfile = open(fragname, "rb")
+    try:
+        header = fragfile.read(len(_FRAGMENT_HEADER))
+        if header != _FRAGMENT_HEADER:
+            raise SvnDumpException("unexpected header in fragment %s" %
+                                   fragname)
+        length = os.path.getsize(fragname) - len(header)
+        dstdmp.add_raw_revs(fragfile, len(header), length, lastrev)
+    finally:
+        fragfile.close()
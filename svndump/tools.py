@@ -22,12 +22,21 @@
 
 from __future__ import print_function
 
+import os
 import sys
+import tempfile
+from collections import deque
 from optparse import OptionParser
 
 from svndump import __version, copy_dump_file
-from common import create_svn_date_str
+from common import create_svn_date_str, parse_svn_date_str, \
+    sdt_redirect_stdout, SvnDumpException, ListDict
+from compress import is_compressed_file
 from file import SvnDumpFileWithHistory, SvnDumpFile
+from index import SvnDumpIndex, get_copy_sources
+from node import SvnDumpNode
+from pipeline import SvnDumpRevision, SvnDumpWriterThread
+from tree import SvnDumpTree
 
 __doc__ = """Various tools."""
 
@@ -53,13 +62,18 @@ def svndump_copy_cmdline(appname, args):
 
     usage = "usage: %s [options] source destination" % appname
     parser = OptionParser(usage=usage, version="%prog " + __version)
+    parser.add_option("-j", "--jobs",
+                      action="store", type="int", dest="jobs", default=1,
+                      help="number of processes copying the dump file")
     (options, args) = parser.parse_args(args)
 
     if len(args) != 2:
         print("specify exactly one source and one destination dump file.")
         return 1
+    if args[1] == "-":
+        sdt_redirect_stdout()
 
-    copy_dump_file(args[0], args[1])
+    copy_dump_file(args[0], args[1], None, options.jobs)
     return 0
 
 
@@ -111,6 +125,14 @@ class SvnDumpExport:
         """
         Executes the export.
 
+        The dump file is read once up to the last export revision. The
+        repository tree is built on the way, it knows which node contains
+        the text of a file which has not been changed in the export
+        revision. Texts which can't be reached by the tree anymore are
+        dropped. If the dump file has an index file the tree keeps only
+        the copy sources stored in it, otherwise all revisions are kept.
+        The texts of stdin are spooled into a temp file.
+
         @type dumpfilename: string
         @param dumpfilename: Name of the svn dump file.
         @type directory: string
@@ -119,29 +141,91 @@ class SvnDumpExport:
 
         dump = SvnDumpFile()
         dump.open(dumpfilename)
-
-        while dump.read_next_rev():
-            revnr = dump.get_rev_nr()
-            if self.__exports.has_key(revnr):
+        lastrev = max(self.__exports.keys())
+        tree = SvnDumpTree()
+        tree.set_keep_texts(True)
+        tree.set_kept_revs(get_copy_sources(dumpfilename))
+        # nodes containing the texts, { (revnr, path) -> node }
+        texts = {}
+        # size of texts triggering the next purge of unreachable texts
+        purgesize = 1024
+        spool = None
+        if not dump.is_seekable():
+            spool = tempfile.TemporaryFile(prefix="svndumptool")
+        try:
+            while dump.read_next_rev():
+                revnr = dump.get_rev_nr()
+                if revnr > lastrev:
+                    break
+                for node in dump.get_nodes_iter():
+                    tree.process_node(revnr, node)
+                    if node.has_text():
+                        texts[(revnr, node.get_path())] = \
+                            self.__keep_text(node, spool)
+                if len(texts) >= purgesize:
+                    refs = tree.get_text_refs()
+                    for ref in texts.keys():
+                        if ref not in refs:
+                            del texts[ref]
+                    purgesize = max(2 * len(texts), 1024)
+                if not self.__exports.has_key(revnr):
+                    continue
                 for path, filename in self.__exports[revnr].items():
                     print("r%-6d %s" % (revnr, path))
-                    nodes = dump.get_nodes_by_path(path, "ACR")
-                    saved = False
-                    for node in nodes:
-                        if node.has_text():
-                            outfile = open(filename, "wb")
-                            node.write_text_to_file(outfile)
-                            outfile.close()
-                            saved = True
-                            print("  saved as %s" % filename)
-                    if not saved:
-                        if len(nodes) == 0:
-                            print("  not found")
-                        else:
-                            print("  has no text")
-        dump.close()
+                    ref = tree.get_text_ref(revnr, path)
+                    if ref is not None:
+                        self.__save_text(texts[ref], filename)
+                    elif tree.get_kind(revnr, path) is None:
+                        print("  not found")
+                    else:
+                        print("  has no text")
+        finally:
+            if spool is not None:
+                spool.close()
+            dump.close()
         return 0
 
+    def __keep_text(self, node, spool):
+        """
+        Returns a node keeping the text of a node for later exports.
+
+        @type node: SvnDumpNode
+        @param node: A node with text.
+        @type spool: file object
+        @param spool: File for the texts of a non-seekable dump file or
+            None if they can be read from the dump file later.
+        @rtype: SvnDumpNode
+        @return: A node with the text.
+        """
+
+        textnode = SvnDumpNode(node.get_path(), "add", "file")
+        if spool is None:
+            textnode.set_text_node(node)
+            return textnode
+        # the texts of a non-seekable dump file are gone after reading
+        # the next revision
+        spool.seek(0, 2)
+        offset = spool.tell()
+        node.write_text_to_file(spool)
+        textnode.set_text_fileobj(spool, offset, node.get_text_length(),
+                                  node.get_text_md5(), node.get_text_sha1())
+        return textnode
+
+    def __save_text(self, node, filename):
+        """
+        Saves the text of a node in a file.
+
+        @type node: SvnDumpNode
+        @param node: A node with text.
+        @type filename: string
+        @param filename: Name of the exported file.
+        """
+
+        outfile = open(filename, "wb")
+        node.write_text_to_file(outfile)
+        outfile.close()
+        print("  saved as %s" % filename)
+
 
 def __svndump_export_opt_e(option, opt, value, parser, *args):
     """
@@ -210,6 +294,10 @@ class SvnDumpCheck:
         self.__check_dates = False
         # check md5 sums
         self.__check_md5 = False
+        # check sha1 sums
+        self.__check_sha1 = False
+        # worker processes for md5/sha1 checks
+        self.__workers = 1
         # verbose output
         self.__verbose = False
 
@@ -243,6 +331,26 @@ class SvnDumpCheck:
 
         self.__check_md5 = docheck
 
+    def set_check_sha1(self, docheck):
+        """
+        Set the check sha1 sums flag to the given value.
+
+        @type docheck: bool
+        @param docheck: New value for the flag.
+        """
+
+        self.__check_sha1 = docheck
+
+    def set_workers(self, count):
+        """
+        Set the number of worker processes checking md5/sha1 sums.
+
+        @type count: int
+        @param count: Number of worker processes.
+        """
+
+        self.__workers = count
+
     def set_verbose(self, doverbose):
         """
         Set for verbose output mode
@@ -266,27 +374,66 @@ class SvnDumpCheck:
             dump.set_check_dates(True)
         if self.__check_md5:
             dump.set_check_md5(True)
+        if self.__check_sha1:
+            dump.set_check_sha1(True)
+        if self.__check_md5 or self.__check_sha1:
+            if self.__workers > 1:
+                dump.set_check_workers(self.__workers)
+            else:
+                dump.set_use_mmap(True)
+        else:
+            dump.set_text_spooling(False)
         dump.open(dumpfilename)
         rc = 0
 
+        # revisions read but not printed yet, ( revnr, nodes )
+        pending = deque()
         while dump.read_next_rev():
-            self.__next_rev()
-            revnr = dump.get_rev_nr()
-            if self.__verbose:
-                self.__print_rev(revnr)
-            if self.__print_rev_errors(dump):
-                rc = 1
-            for node in dump.get_nodes_iter():
-                self.__next_node()
-                if self.__verbose:
-                    self.__print_node(revnr, node)
-                    self.__print_action(node)
-                if self.__print_node_errors(dump, node):
+            pending.append((dump.get_rev_nr(), list(dump.get_nodes_iter())))
+            # print revisions in order as soon as the workers are done
+            while len(pending) > 0 and (len(pending) > 1000 or
+                                        dump.is_rev_checked(pending[0][0])):
+                revnr, nodes = pending.popleft()
+                if self.__print_revision(dump, revnr, nodes):
                     rc = 1
+        while len(pending) > 0:
+            revnr, nodes = pending.popleft()
+            if self.__print_revision(dump, revnr, nodes):
+                rc = 1
         dump.close()
         print(["OK", "Not OK"][rc])
         return rc
 
+    def __print_revision(self, dump, revnr, nodes):
+        """
+        Prints a revision and its errors.
+
+        @type dump: SvnDumpFile
+        @param dump: Current dump file.
+        @type revnr: int
+        @param revnr: Revision number.
+        @type nodes: list( SvnDumpNode )
+        @param nodes: The nodes of the revision.
+        @rtype: int
+        @return: 1 if there were errors, else 0.
+        """
+
+        rc = 0
+        self.__next_rev()
+        errlist = dump.get_rev_errors(revnr)
+        if self.__verbose:
+            self.__print_rev(revnr)
+        if self.__print_rev_errors(dump, revnr, errlist):
+            rc = 1
+        for node in nodes:
+            self.__next_node()
+            if self.__verbose:
+                self.__print_node(revnr, node)
+                self.__print_action(node)
+            if self.__print_node_errors(dump, revnr, errlist, node):
+                rc = 1
+        return rc
+
     def __next_rev(self):
         """
         Clears the rev_printed flag.
@@ -341,23 +488,25 @@ class SvnDumpCheck:
                     node.get_copy_from_path())
             print(actionmsg)
 
-    def __print_rev_errors(self, dump):
+    def __print_rev_errors(self, dump, revnr, errlist):
         """
-        Prints all revision errors for the current dump revision
+        Prints all revision errors for a dump revision
 
         @type dump: SvnDumpFile
         @param dump: Current dump file.
+        @type revnr: int
+        @param revnr: Revision number.
+        @type errlist: list
+        @param errlist: The errors of the revision or None.
         """
 
         rc = 0
-        errlist = dump.get_rev_errors()
         if errlist is None:
             return rc
-        revnr = dump.get_rev_nr()
         for err in errlist:
-            if err[0] == SvnDumpFile.ERR_REV_DATE_OLDER:
+            if err[0] == dump.ERR_REV_DATE_OLDER:
                 rc = 1
-                self.print_rev(revnr)
+                self.__print_rev(revnr)
                 revdate = parse_svn_date_str(err[1][0])
                 prevdate = parse_svn_date_str(err[1][1])
                 print("    rev date: %s  %10d.%06d" % (
@@ -366,36 +515,43 @@ class SvnDumpCheck:
                     err[1][1], prevdate[0], prevdate[1]))
         return rc
 
-    def __print_node_errors(self, dump, node):
+    def __print_node_errors(self, dump, revnr, errlist, node):
         """
-        Prints all node errors for the current dump node
+        Prints all node errors for a dump node
 
         @type dump: SvnDumpFile
         @param dump: Current dump file.
+        @type revnr: int
+        @param revnr: Revision number.
+        @type errlist: list
+        @param errlist: The errors of the revision or None.
+        @type node: SvnDumpNode
+        @param node: The node.
         """
 
         rc = 0
-        errlist = dump.get_rev_errors()
         if errlist is None:
             return rc
-        revnr = dump.get_rev_nr()
         for err in errlist:
             if node.get_path() == err[1][0]:
                 rc = 1
                 self.__print_node(revnr, node)
-                if err[0] == SvnDumpFile.ERR_NODE_MD5_FAIL:
-                    print("      ERROR - md5 calc: %s" % err[1][0])
-                    print("        diff than md5 node: %s" % err[1][1])
-                if err[0] == SvnDumpFile.ERR_NODE_EXISTS:
+                if err[0] == dump.ERR_NODE_MD5_FAIL:
+                    print("      ERROR - md5 calc: %s" % err[1][1])
+                    print("        diff than md5 node: %s" % err[1][2])
+                if err[0] == dump.ERR_NODE_SHA1_FAIL:
+                    print("      ERROR - sha1 calc: %s" % err[1][1])
+                    print("        diff than sha1 node: %s" % err[1][2])
+                if err[0] == dump.ERR_NODE_EXISTS:
                     print("      ERROR - Node already exists.")
-                if err[0] == SvnDumpFile.ERR_NODE_NO_PARENT:
+                if err[0] == dump.ERR_NODE_NO_PARENT:
                     print("      ERROR - Parent doesn't exist.")
-                if err[0] == SvnDumpFile.ERR_NODE_PARENT_NOT_DIR:
+                if err[0] == dump.ERR_NODE_PARENT_NOT_DIR:
                     print("      ERROR - Parent is not a directory.")
-                if err[0] == SvnDumpFile.ERR_NODE_NO_COPY_SRC:
+                if err[0] == dump.ERR_NODE_NO_COPY_SRC:
                     print("      ERROR - Copy-from path doesn't exist."
                           "  r%d %s" % (err[1][2], err[1][3]))
-                if err[0] == SvnDumpFile.ERR_NODE_GONE:
+                if err[0] == dump.ERR_NODE_GONE:
                     print("      ERROR - Node doesn't exist.")
         return rc
 
@@ -428,9 +584,15 @@ def svndump_check_cmdline(appname, args):
     parser.add_option("-m", "--check-md5",
                       action="store_true", dest="check_md5", default=False,
                       help="check md5 sums of the files")
+    parser.add_option("-s", "--check-sha1",
+                      action="store_true", dest="check_sha1", default=False,
+                      help="check sha1 sums of the files (if present)")
     parser.add_option("-A", "--all-checks",
                       action="store_true", dest="check_all", default=False,
                       help="do all checks")
+    parser.add_option("-j", "--jobs",
+                      action="store", type="int", dest="jobs", default=1,
+                      help="number of processes checking md5/sha1 sums")
     parser.add_option("-v", "--verbose",
                       action="store_true", dest="verbose", default=False,
                       help="verbose output")
@@ -446,6 +608,11 @@ def svndump_check_cmdline(appname, args):
     if options.check_md5 or options.check_all:
         check.set_check_md5(True)
         checks = True
+    if options.check_sha1 or options.check_all:
+        check.set_check_sha1(True)
+        checks = True
+    if options.jobs > 1:
+        check.set_workers(options.jobs)
     if options.verbose:
         check.set_verbose(True)
 
@@ -468,134 +635,120 @@ class SvnDumpLs:
     A class for listing files in a dump.
     """
 
-    def __init__(self, revNr):
+    def __init__(self, revNr=-1):
         """
         Initialize.
+
+        @type revNr: integer
+        @param revNr: Revision number to list, -1 for HEAD.
+        """
+
+        # revisions to list, -1 is HEAD
+        self.__revnrs = []
+        self.add_revision(revNr)
+
+    def add_revision(self, revnr):
+        """
+        Adds a revision to list.
+
+        @type revnr: integer
+        @param revnr: Revision number, -1 for HEAD.
+        """
+
+        if revnr not in self.__revnrs:
+            self.__revnrs.append(revnr)
+
+    def set_revision(self, revision):
+        """
+        Set the revisions to list.
+
+        @type revision: string
+        @param revision: Comma separated list of revision numbers and HEAD.
+        @rtype: bool
+        @return: False if the revision argument is malformed.
         """
 
-        self.revNr = revNr
-        if revNr == -1:
-            self.revNr = 2000000000
+        self.__revnrs = []
+        for part in revision.split(","):
+            part = part.strip()
+            if part == "HEAD":
+                self.add_revision(-1)
+                continue
+            try:
+                revnr = int(part)
+            except ValueError:
+                revnr = -2
+            if revnr < 0:
+                print("Wrong format of revision argument '%s'" % revision)
+                return False
+            self.add_revision(revnr)
+        return True
 
     def execute(self, dumpfilename):
         """
         Print file list of a dump file.
 
+        All revisions are listed in one pass over the dump file. If more
+        than one revision has been given each list starts with a line
+        containing the revision number.
+
         @type dumpfilename: string
         @param dumpfilename: Name of the file to log.
         """
 
-        # pass 1: search copy-from revisions
-        dump = SvnDumpFile()
-        dump.open(dumpfilename)
-        copyfromrevs = {}
-        filedict = {}
-
-        while dump.read_next_rev():
-            revnr = dump.get_rev_nr()
-            if revnr > self.revNr:
-                break
-            for node in dump.get_nodes_iter():
-                # action = actions[node.get_action()]
-                action = node.get_action()
-                path = node.get_path()
-                if path == "" or path[0] != "/":
-                    path = "/" + path
-                if action == "add" and node.has_copy_from():
-                    copyfromrevs[node.get_copy_from_rev()] = True
-        dump.close()
+        # revisions still to list, in ascending order
+        pending = [revnr for revnr in self.__revnrs if revnr >= 0]
+        pending.sort(reverse=True)
+        listhead = -1 in self.__revnrs
+        headers = len(self.__revnrs) > 1
 
-        # pass 2: do the work
         dump = SvnDumpFile()
+        dump.set_text_spooling(False)
         dump.open(dumpfilename)
-        filedict = {}
+        tree = SvnDumpTree()
+        tree.set_kept_revs(get_copy_sources(dumpfilename))
+        lastrev = 0
 
-        prevrevnr = 0
-        while dump.read_next_rev():
+        while (listhead or len(pending) > 0) and dump.read_next_rev():
             revnr = dump.get_rev_nr()
-            # loop over missing revisions
-            prevrevnr += 1
-            while prevrevnr < revnr:
-                if copyfromrevs.has_key(prevrevnr):
-                    copyfromrevs[prevrevnr] = filedict.keys()[:]
-                prevrevnr += 1
-            if revnr > self.revNr:
-                break
+            # revisions missing in the dump file, before changing the tree
+            while len(pending) > 0 and pending[-1] < revnr:
+                self.__print_list(tree, pending.pop(), headers)
             for node in dump.get_nodes_iter():
-                action = node.get_action()
-                path = node.get_path()
-                if path == "" or path[0] != "/":
-                    path = "/" + path
-                if action == "add":
-                    filedict[path] = path
-                    if node.has_copy_from():
-                        frompath = node.get_copy_from_path() + "/"
-                        if frompath[0] != "/":
-                            frompath = "/" + frompath
-                        fromlen = len(frompath)
-                        topath = path + "/"
-                        for path in copyfromrevs[node.get_copy_from_rev()]:
-                            if path.startswith(frompath):
-                                newpath = topath + path[fromlen:]
-                                filedict[newpath] = newpath
-                elif action == "delete":
-                    del filedict[path]
-                    if path[-1] != "/":
-                        path = path + "/"
-                    for subpath in filedict.keys()[:]:
-                        if subpath.startswith(path):
-                            del filedict[subpath]
-            if copyfromrevs.has_key(revnr):
-                copyfromrevs[revnr] = filedict.keys()[:]
+                tree.process_node(revnr, node)
+            lastrev = revnr
+            while len(pending) > 0 and pending[-1] == revnr:
+                self.__print_list(tree, pending.pop(), headers)
         dump.close()
 
-        filelist = []
-        for path in filedict:
-            filelist.append(path)
-        filelist.sort()
-        for path in filelist:
-            print(path)
+        # revisions at or behind the end of the dump file
+        while len(pending) > 0:
+            self.__print_list(tree, pending.pop(), headers)
+        if listhead:
+            self.__print_list(tree, lastrev, headers)
 
         return 0
 
-    def old_execute(self, dumpfilename):
+    def __print_list(self, tree, revnr, header):
         """
-        Print file list of a dump file.
+        Prints the sorted file list of a revision.
 
-        @type dumpfilename: string
-        @param dumpfilename: Name of the file to log.
+        @type tree: SvnDumpTree
+        @param tree: The tree of the dump file.
+        @type revnr: integer
+        @param revnr: Revision number.
+        @type header: bool
+        @param header: Print the revision number before the list.
         """
 
-        dump = SvnDumpFile()
-        dump.open(dumpfilename)
-        actions = {"add": "A", "change": "M", "delete": "D", "replace": "R"}
-        lines = ""
-
-        while dump.read_next_rev():
-            revnr = dump.get_rev_nr()
-            if revnr == self.revNr or self.revNr == -1:
-                lines = ""
-                for node in dump.get_nodes_iter():
-                    action = actions[node.get_action()]
-                    path = node.get_path()
-                    if path == "" or path[0] != "/":
-                        path = "/" + path
-                    if node.has_copy_from():
-                        fpath = node.get_copy_from_path()
-                        frev = node.get_copy_from_rev()
-                        if fpath == "" or fpath[0] != "/":
-                            fpath = "/" + fpath
-                        path += " (from %s:%d)" % (fpath, frev)
-                    lines += "   %s %s\n" % (action, path)
-                if revnr == self.revNr:
-                    print(lines, end='')
-                    lines = ""
-                    break
-        if len(lines) > 0:
-            print(lines, end='')
-
-        dump.close()
-        return 0
+        filelist = []
+        for path, kind in tree.walk(revnr):
+            filelist.append("/" + path)
+        filelist.sort()
+        if header:
+            print("Revision %d:" % revnr)
+        for path in filelist:
+            print(path)
 
 
 def svndump_ls_cmdline(appname, args):
@@ -617,12 +770,15 @@ def svndump_ls_cmdline(appname, args):
     usage = "usage: %s [options] dumpfiles..." % appname
     parser = OptionParser(usage=usage, version="%prog " + __version)
     parser.add_option("-r", "--revision",
-                      action="store", type="int",
-                      dest="revnr", default=-1,
-                      help="revision number")
+                      action="store", type="string",
+                      dest="revision", default="HEAD",
+                      help="comma separated revision numbers, "
+                           "HEAD is the last revision")
     (options, args) = parser.parse_args(args)
 
-    log = SvnDumpLs(options.revnr)
+    log = SvnDumpLs()
+    if not log.set_revision(options.revision):
+        return 1
 
     if len(args) == 1:
         return log.execute(args[0])
@@ -709,12 +865,18 @@ class SvnDumpLog:
         line = "-" * 72
         print("Dumpfile: " + dumpfilename)
         dump = SvnDumpFile()
+        dump.set_text_spooling(False)
         dump.open(dumpfilename)
         actions = {"add": "A", "change": "M", "delete": "D", "replace": "R"}
 
+        if self.__from_rev > 0:
+            # skip the revisions before the range, fast if there's an index
+            dump.seek_rev(self.__from_rev)
         while dump.read_next_rev():
             revnr = dump.get_rev_nr()
-            if self.__from_rev <= revnr <= self.__to_rev:
+            if revnr > self.__to_rev:
+                break
+            if self.__from_rev <= revnr:
                 author = dump.get_rev_author()
                 date = dump.get_rev_date_str()
                 log = dump.get_rev_log()
@@ -787,18 +949,137 @@ def svndump_log_cmdline(appname, args):
 # -------------------------------------------------------------------------------
 # join
 
+def _raw_copy_index(filename):
+    """
+    Returns the revision index of a dump file for copying its revisions
+    as raw bytes.
+
+    The index file is used if there is an up to date one, otherwise the
+    revision records are located by scanning the record headers.
+
+    @type filename: string
+    @param filename: Name of the dump file.
+    @rtype: SvnDumpIndex
+    @return: The index or None if the dump file is not an uncompressed
+        regular file or its revisions are not numbered contiguously.
+    """
+
+    if not isinstance(filename, str) or not os.path.isfile(filename) or \
+            is_compressed_file(filename):
+        return None
+    index = SvnDumpIndex()
+    if not index.load(filename):
+        try:
+            index.create(filename)
+        except SvnDumpException:
+            return None
+    if not index.is_contiguous():
+        return None
+    return index
+
+
+def _read_dump_header(filename, index):
+    """
+    Reads UUID and the date of revision 0 of a dump file.
+
+    @type filename: string
+    @param filename: Name of the dump file.
+    @type index: SvnDumpIndex
+    @param index: The index of the dump file.
+    @rtype: tuple( string, string )
+    @return: UUID and svn date string of revision 0 (None if the dump
+        file doesn't start with revision 0).
+    """
+
+    dump = SvnDumpFile()
+    dump.open(filename)
+    uuid = dump.get_uuid()
+    r0date = None
+    if index.get_rev_offset(0) >= 0:
+        dump.read_next_rev()
+        r0date = dump.get_rev_date_str()
+    dump.close()
+    return uuid, r0date
+
+
+def _join_raw(inputlist, indexes, outfilename):
+    """
+    Joins dump files copying the revision records as raw bytes.
+
+    @type inputlist: list
+    @param inputlist: A list containing the input filenames.
+    @type indexes: list( SvnDumpIndex )
+    @param indexes: The indexes of the input files.
+    @type outfilename: string
+    @param outfilename: Name of the output dump file or '-' for stdout.
+    @rtype: int
+    @return: 0 for success.
+    """
+
+    outdump = None
+    noutrev = 0
+    lastrev = -1
+    for filename, index in zip(inputlist, indexes):
+        print("reading %s ..." % filename)
+        ninrev = 0
+        revs = index.get_rev_range(1, index.get_last_rev_nr())
+        if outdump is None:
+            if index.get_rev_count() > 0:
+                uuid, r0date = _read_dump_header(filename, index)
+                outdump = SvnDumpFile()
+                if r0date is not None:
+                    # create new dump with revision 0
+                    outdump.create_with_rev_0(outfilename, uuid, r0date)
+                else:
+                    # create new dump starting with the
+                    # same revNr as the original dump
+                    outdump.create_with_rev_n(outfilename, uuid, revs[0])
+        elif revs is not None and (lastrev + 1) != revs[0]:
+            print("renumbering of revisions not supported.")
+            print("last rev was %d, next is %d." % (lastrev, revs[0]))
+            outdump.close()
+            return 1
+        if revs is not None:
+            firstrev, lastrev, offset, length = revs
+            infile = open(filename, "rb")
+            try:
+                outdump.add_raw_revs(infile, offset, length, lastrev)
+            finally:
+                infile.close()
+            ninrev = lastrev - firstrev + 1
+        print("  copied %d revisions." % ninrev)
+        noutrev += ninrev
+    if outdump is not None:
+        outdump.close()
+    print("wrote %d revisions, last was r%d." % (noutrev, lastrev))
+    return 0
+
+
 def join_dumpfiles(inputlist, outfilename):
     """
     Joins dump files.
 
+    If all input files are uncompressed regular files with contiguously
+    numbered revisions the revision records are copied as raw bytes,
+    only the header of the output file is created.
+
     @type inputlist: list
     @param inputlist: A list containing the input filenames.
     @type outfilename: string
-    @param outfilename: Name of the output dump file.
+    @param outfilename: Name of the output dump file or '-' for stdout.
     @rtype: int
     @return: 0 for success.
     """
 
+    indexes = []
+    for filename in inputlist:
+        index = _raw_copy_index(filename)
+        if index is None:
+            break
+        indexes.append(index)
+    if len(indexes) == len(inputlist):
+        return _join_raw(inputlist, indexes, outfilename)
+
     outdump = None
     noutrev = 0
     lastrev = -1
@@ -866,7 +1147,8 @@ def svndump_join_cmdline(appname, args):
     parser.add_option("-o", "--output-file",
                       action="store", type="string",
                       dest="outfile", default=None,
-                      help="set the name of the output dump file.")
+                      help="set the name of the output dump file "
+                           "('-' for stdout).")
     (options, args) = parser.parse_args(args)
 
     if options.outfile is None:
@@ -875,6 +1157,8 @@ def svndump_join_cmdline(appname, args):
     if len(args) == 0:
         print("please specify at least one input dump file.")
         return 1
+    if options.outfile == "-":
+        sdt_redirect_stdout()
 
     return join_dumpfiles(args, options.outfile)
 
@@ -882,10 +1166,312 @@ def svndump_join_cmdline(appname, args):
 # -------------------------------------------------------------------------------
 # split
 
+# size of the chunks read when splitting into overlapping ranges
+_SPLIT_CHUNK_SIZE = 1024 * 1024
+
+
+class _SplitOutput:
+    """
+    An output dump file of a split.
+
+    The items are written by a SvnDumpWriterThread or directly.
+    """
+
+    def __init__(self, outdump, writer, threaded):
+        """
+        Initialize.
+
+        @type outdump: SvnDumpFile
+        @param outdump: The output dump file, created already.
+        @type writer: function( object )
+        @param writer: Writes an item to outdump.
+        @type threaded: bool
+        @param threaded: Write in a thread of its own.
+        """
+
+        self.outdump = outdump
+        self.__writer = writer
+        self.__thread = None
+        if threaded:
+            self.__thread = SvnDumpWriterThread(writer)
+
+    def put(self, item):
+        """
+        Writes an item.
+
+        @type item: object
+        @param item: The item.
+        """
+
+        if self.__thread is not None:
+            self.__thread.put(item)
+        else:
+            self.__writer(item)
+
+    def finish(self):
+        """
+        Waits until all items have been written and closes the dump file.
+        """
+
+        try:
+            if self.__thread is not None:
+                self.__thread.finish()
+        finally:
+            self.outdump.close()
+
+
+def _finish_split_outputs(outputs):
+    """
+    Finishes all outputs of a split.
+
+    @type outputs: list( _SplitOutput )
+    @param outputs: The outputs, None and False entries are ignored.
+    """
+
+    error = None
+    for output in outputs:
+        if output:
+            try:
+                output.finish()
+            except Exception:
+                if error is None:
+                    error = sys.exc_info()
+    if error is not None:
+        # re-raise the first exception with its traceback
+        exctype, value, tb = error
+        raise exctype, value, tb
+
+
+def _create_raw_split_output(outfile, uuid, r0date, index, startrev,
+                             endrev):
+    """
+    Creates an output file of a split copying raw bytes.
+
+    @type outfile: string
+    @param outfile: Name of the output file.
+    @type uuid: string
+    @param uuid: UUID of the input file.
+    @type r0date: string
+    @param r0date: Date of revision 0 of the input file.
+    @type index: SvnDumpIndex
+    @param index: The index of the input file.
+    @type startrev: integer
+    @param startrev: First revision number of the range.
+    @type endrev: integer
+    @param endrev: Last revision number of the range.
+    @rtype: tuple( SvnDumpFile, tuple )
+    @return: The created dump file (None if the range contains no
+        revisions) and the revisions to copy as returned by
+        SvnDumpIndex.get_rev_range().
+    """
+
+    revs = index.get_rev_range(startrev, endrev)
+    if revs is None:
+        return None, None
+    outdump = SvnDumpFile()
+    if revs[0] == 0:
+        # create new dump with revision 0
+        outdump.create_with_rev_0(outfile, uuid, r0date)
+        revs = index.get_rev_range(1, endrev)
+    else:
+        # create new dump starting with the
+        # same revNr as the original dump
+        outdump.create_with_rev_n(outfile, uuid, revs[0])
+    return outdump, revs
+
+
+def _split_raw(inputfilename, index, outlist):
+    """
+    Splits a dump file copying the revision records as raw bytes.
+
+    @type inputfilename: string
+    @param inputfilename: Name of the input file.
+    @type index: SvnDumpIndex
+    @param index: The index of the input file.
+    @type outlist: list
+    @param outlist: Sorted list of tuples containing start revnr, end
+        revnr and filename, the ranges must not overlap.
+    """
+
+    uuid, r0date = _read_dump_header(inputfilename, index)
+    infile = open(inputfilename, "rb")
+    try:
+        for startrev, endrev, outfile in outlist:
+            outdump, revs = _create_raw_split_output(outfile, uuid, r0date,
+                                                     index, startrev, endrev)
+            if outdump is None:
+                continue
+            if revs is not None:
+                outdump.add_raw_revs(infile, revs[2], revs[3], revs[1])
+            outdump.close()
+    finally:
+        infile.close()
+
+
+def _split_raw_overlapping(inputfilename, index, outlist):
+    """
+    Splits a dump file into overlapping ranges copying the revision
+    records as raw bytes.
+
+    The input file is read once in chunks, each chunk is passed to the
+    writer threads of all outputs whose records it overlaps.
+
+    @type inputfilename: string
+    @param inputfilename: Name of the input file.
+    @type index: SvnDumpIndex
+    @param index: The index of the input file.
+    @type outlist: list
+    @param outlist: Sorted list of tuples containing start revnr, end
+        revnr and filename.
+    """
+
+    uuid, r0date = _read_dump_header(inputfilename, index)
+    # start and end offset and output
+    ranges = []
+    outputs = []
+    try:
+        for startrev, endrev, outfile in outlist:
+            outdump, revs = _create_raw_split_output(outfile, uuid, r0date,
+                                                     index, startrev, endrev)
+            if outdump is None:
+                continue
+            if revs is None:
+                outdump.close()
+                continue
+            lastrev, offset, length = revs[1:]
+            output = _SplitOutput(outdump,
+                                  lambda data, outdump=outdump,
+                                  lastrev=lastrev:
+                                  outdump.add_raw_data(data, lastrev),
+                                  True)
+            outputs.append(output)
+            ranges.append((offset, offset + length, output))
+        if len(ranges) == 0:
+            return
+        infile = open(inputfilename, "rb")
+        try:
+            end = max([stop for start, stop, output in ranges])
+            pos = -1
+            while pos < end:
+                # skip gaps between the ranges
+                start = min([start for start, stop, output in ranges
+                             if stop > pos])
+                if start > pos:
+                    pos = start
+                    infile.seek(pos)
+                data = infile.read(min(_SPLIT_CHUNK_SIZE, end - pos))
+                if len(data) == 0:
+                    raise SvnDumpException("unexpected end of file %s" %
+                                           inputfilename)
+                dataend = pos + len(data)
+                for start, stop, output in ranges:
+                    if start < dataend and stop > pos:
+                        output.put(data[max(start - pos, 0):
+                                        min(stop, dataend) - pos])
+                pos = dataend
+        finally:
+            infile.close()
+    finally:
+        _finish_split_outputs(outputs)
+
+
+def _write_split_rev(outdump, item):
+    """
+    Writes a revision to an output file of a split.
+
+    @type outdump: SvnDumpFile
+    @param outdump: The output dump file.
+    @type item: tuple( SvnDumpRevision, ListDict )
+    @param item: The revision and a copy of its revision properties.
+    """
+
+    revision, revprops = item
+    outdump.add_rev(revprops)
+    for node in revision.get_nodes_iter():
+        outdump.add_node(node)
+
+
+def _split_overlapping(inputfilename, outlist):
+    """
+    Splits a dump file into overlapping ranges reading it once.
+
+    Each revision is passed to all outputs whose range contains it. If the
+    input file can be memory mapped each output is written in a thread of
+    its own, otherwise the outputs are written one after another.
+
+    @type inputfilename: string
+    @param inputfilename: Name of the input file.
+    @type outlist: list
+    @param outlist: Sorted list of tuples containing start revnr, end
+        revnr and filename.
+    """
+
+    indump = SvnDumpFile()
+    indump.set_use_mmap(True)
+    indump.open(inputfilename)
+    threaded = indump.is_mmapped()
+    # None = not created yet, False = done
+    outputs = [None] * len(outlist)
+    done = 0
+    try:
+        if outlist[0][0] > 0:
+            # skip the revisions before the ranges
+            indump.seek_rev(outlist[0][0])
+        while done < len(outlist) and indump.read_next_rev():
+            revnr = indump.get_rev_nr()
+            revision = SvnDumpRevision(indump)
+            for i in range(len(outlist)):
+                startrev, endrev, outfile = outlist[i]
+                if revnr < startrev or outputs[i] is False:
+                    continue
+                if outputs[i] is None:
+                    outdump = SvnDumpFile()
+                    if revnr == 0:
+                        # create new dump with revision 0
+                        outdump.create_with_rev_0(outfile, indump.get_uuid(),
+                                                  indump.get_rev_date_str())
+                    else:
+                        # create new dump starting with the
+                        # same revNr as the original dump
+                        outdump.create_with_rev_n(outfile, indump.get_uuid(),
+                                                  revnr)
+                    outputs[i] = _SplitOutput(
+                        outdump,
+                        lambda item, outdump=outdump:
+                        _write_split_rev(outdump, item),
+                        threaded)
+                if revnr > 0:
+                    # each output gets its own copy of the revision
+                    # properties, add_rev() modifies them
+                    revprops = ListDict()
+                    for name, value in revision.get_rev_props().items():
+                        revprops[name] = value
+                    outputs[i].put((revision, revprops))
+                if revnr >= endrev:
+                    # end revision reached
+                    outputs[i].finish()
+                    outputs[i] = False
+                    done += 1
+            if not threaded:
+                revision.release()
+    finally:
+        try:
+            _finish_split_outputs(outputs)
+        finally:
+            indump.close()
+
+
 def split_dumpfiles(inputfilename, outlist):
     """
     Splits a dump file.
 
+    If the input file is an uncompressed regular file with contiguously
+    numbered revisions the revision records are copied as raw bytes, only
+    the headers of the output files are created.
+
+    The ranges may overlap, the input file is read only once then and
+    each output file is written by a thread of its own.
+
     @type inputfilename: string
     @param inputfilename: Name of the input file.
     @type outlist: list
@@ -901,10 +1487,17 @@ def split_dumpfiles(inputfilename, outlist):
     outlist.sort()
     parallel = False
     for i in range(0, len(outlist) - 1):
-        if outlist[i][1] > outlist[i + 1][0]:
+        if outlist[i][1] >= outlist[i + 1][0]:
             parallel = True
             break
 
+    index = _raw_copy_index(inputfilename)
+    if index is not None:
+        if parallel:
+            _split_raw_overlapping(inputfilename, index, outlist)
+        else:
+            _split_raw(inputfilename, index, outlist)
+        return 0
     if not parallel:
         indump = SvnDumpFile()
         indump.open(inputfilename)
@@ -913,6 +1506,9 @@ def split_dumpfiles(inputfilename, outlist):
         endrev = outlist[index][1]
         outfile = outlist[index][2]
         outdump = None
+        if startrev > 0:
+            # skip the revisions before the range, fast if there's an index
+            indump.seek_rev(startrev)
         while indump.read_next_rev():
             revnr = indump.get_rev_nr()
             if outdump is None:
@@ -943,12 +1539,13 @@ def split_dumpfiles(inputfilename, outlist):
                     startrev = outlist[index][0]
                     endrev = outlist[index][1]
                     outfile = outlist[index][2]
+                    if startrev > revnr + 1:
+                        indump.seek_rev(startrev)
         if outdump is not None:
             outdump.close()
         indump.close()
     else:
-        print("overlapping revision ranges not supported (yet).")
-        return 1
+        _split_overlapping(inputfilename, outlist)
     return 0
 
 
@@ -982,5 +1579,7 @@ def svndump_split_cmdline(appname, args):
     outlist = []
     for i in range(1, len(args), 3):
         outlist.append((int(args[i]), int(args[i + 1]), args[i + 2]))
+        if args[i + 2] == "-":
+            sdt_redirect_stdout()
 
     return split_dumpfiles(infile, outlist)
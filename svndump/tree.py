@@ -0,0 +1,651 @@
+# ===============================================================================
+#
+# Copyright (C) 2003 Martin Furter <mf@rola.ch>
+#
+# This file is part of SvnDumpTool
+#
+# SvnDumpTool is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# SvnDumpTool is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with SvnDumpTool; see the file COPYING.  If not, write to
+# the Free Software Foundation, 675 Mass Ave, Cambridge, MA 02139, USA.
+#
+# ===============================================================================
+
+import bisect
+import heapq
+
+from common import SvnDumpException
+
+__doc__ = """Persistent repository tree with snapshots of revisions."""
+
+# bits of the name hash used per level of the hash trie of a directory
+_BITS = 5
+_FANOUT = 1 << _BITS
+_MASK = _FANOUT - 1
+# entries of a leaf before it is split, and the deepest shift splitting
+_BUCKET_SIZE = 32
+_MAX_SHIFT = 60
+
+
+class _Bucket(object):
+    """
+    A node of the hash trie holding the entries of a directory.
+
+    A node is either a leaf with a dict of up to _BUCKET_SIZE entries or
+    a list of _FANOUT child nodes (or None) selected by the next bits of
+    the hash of the name. Nodes are shared between revisions and never
+    changed once their revision is done. Only nodes created in the
+    current revision (owned by the current edit token) are changed in
+    place, so a change copies one small node per level.
+    """
+
+    __slots__ = ("entries", "owner")
+
+    def __init__(self, entries, owner):
+        """
+        Initialize.
+
+        @type entries: dict( string -> _TreeDir or file value ) or
+            list( _Bucket )
+        @param entries: The entries of a leaf or the children.
+        @type owner: object
+        @param owner: Edit token of the revision creating this node.
+        """
+
+        self.entries = entries
+        self.owner = owner
+
+
+class _TreeDir(_Bucket):
+    """
+    A directory of the tree, the root node of the trie of its entries.
+    """
+
+    __slots__ = ()
+
+
+# marker for entries not found
+_missing = object()
+
+
+def _own(node, token):
+    """
+    Returns the node if it is owned by token, else a copy owned by token.
+
+    @type node: _Bucket
+    @param node: A node.
+    @type token: object
+    @param token: Edit token of the current revision.
+    @rtype: _Bucket
+    @return: A node which may be changed.
+    """
+
+    if node.owner is token:
+        return node
+    if node.entries.__class__ is list:
+        return node.__class__(node.entries[:], token)
+    return node.__class__(node.entries.copy(), token)
+
+
+def _get(dir, name):
+    """
+    Returns an entry of a directory.
+
+    @type dir: _TreeDir
+    @param dir: The directory.
+    @type name: string
+    @param name: Name of the entry.
+    @rtype: _TreeDir or file value
+    @return: The entry or _missing.
+    """
+
+    hashval = hash(name)
+    shift = 0
+    entries = dir.entries
+    while entries.__class__ is list:
+        node = entries[(hashval >> shift) & _MASK]
+        if node is None:
+            return _missing
+        entries = node.entries
+        shift += _BITS
+    return entries.get(name, _missing)
+
+
+def _leaf(dir, name, token):
+    """
+    Returns the leaf of a name, copying the nodes on the way if needed.
+
+    @type dir: _TreeDir
+    @param dir: A directory owned by token.
+    @type name: string
+    @param name: Name of the entry.
+    @type token: object
+    @param token: Edit token of the current revision.
+    @rtype: tuple( _Bucket, int )
+    @return: The leaf owned by token and the shift of its level.
+    """
+
+    hashval = hash(name)
+    shift = 0
+    node = dir
+    while node.entries.__class__ is list:
+        index = (hashval >> shift) & _MASK
+        child = node.entries[index]
+        if child is None:
+            child = _Bucket({}, token)
+        else:
+            child = _own(child, token)
+        node.entries[index] = child
+        node = child
+        shift += _BITS
+    return node, shift
+
+
+def _split(node, shift, token):
+    """
+    Turns a full leaf into a list of leaves.
+
+    @type node: _Bucket
+    @param node: A leaf owned by token.
+    @type shift: int
+    @param shift: Shift of the level of the leaf.
+    @type token: object
+    @param token: Edit token of the current revision.
+    """
+
+    children = [None] * _FANOUT
+    for name, value in node.entries.iteritems():
+        index = (hash(name) >> shift) & _MASK
+        if children[index] is None:
+            children[index] = _Bucket({}, token)
+        children[index].entries[name] = value
+    node.entries = children
+    shift += _BITS
+    if shift > _MAX_SHIFT:
+        return
+    for child in children:
+        if child is not None and len(child.entries) > _BUCKET_SIZE:
+            _split(child, shift, token)
+
+
+def _set(dir, name, value, token):
+    """
+    Sets an entry of a directory.
+
+    @type dir: _TreeDir
+    @param dir: A directory owned by token.
+    @type name: string
+    @param name: Name of the entry.
+    @type value: _TreeDir or file value
+    @param value: The entry.
+    @type token: object
+    @param token: Edit token of the current revision.
+    """
+
+    node, shift = _leaf(dir, name, token)
+    node.entries[name] = value
+    if len(node.entries) > _BUCKET_SIZE and shift <= _MAX_SHIFT:
+        _split(node, shift, token)
+
+
+def _remove(dir, name, token):
+    """
+    Removes an existing entry of a directory.
+
+    @type dir: _TreeDir
+    @param dir: A directory owned by token.
+    @type name: string
+    @param name: Name of the entry.
+    @type token: object
+    @param token: Edit token of the current revision.
+    """
+
+    del _leaf(dir, name, token)[0].entries[name]
+
+
+def _iter_entries(dir):
+    """
+    Iterates over the entries of a directory.
+
+    @type dir: _TreeDir
+    @param dir: The directory.
+    @rtype: generator
+    @return: Yields ( name, entry ) tuples in no particular order.
+    """
+
+    stack = [dir]
+    while len(stack) > 0:
+        entries = stack.pop().entries
+        if entries.__class__ is list:
+            for node in entries:
+                if node is not None:
+                    stack.append(node)
+        else:
+            for item in entries.iteritems():
+                yield item
+
+
+class SvnDumpTree(object):
+    """
+    The tree of a repository in all revisions.
+
+    Directories are persistent hash tries, changing the tree copies only
+    one small node per level of the path to the changed node, everything
+    else is shared with the previous revision. This makes snapshots of
+    revisions and copies of subtrees cheap, so revisions can be kept and
+    queried. By default the trees of all revisions are kept, see
+    set_kept_revs() for keeping only the copy sources.
+
+    Files are stored as a value, which is (revnr, path) of the node
+    containing the text of the file if enabled with set_keep_texts() or
+    None.
+    """
+
+    def __init__(self):
+        """
+        Initialize.
+        """
+
+        # track text of files
+        self.__keep_texts = False
+        # revisions queried after they're done, { revnr -> last revnr
+        #   querying it } or None for all revisions
+        self.__kept = None
+        self.__keptnrs = []
+        self.__expiry = []
+        self.__revnrs = []
+        self.__roots = []
+        self.__cur_rev = 0
+        self.__cur_root = None
+        self.__token = None
+        self.__changed = False
+        self.clear()
+
+    def set_keep_texts(self, keep):
+        """
+        Sets the keep texts flag.
+
+        If set process_node() stores (revnr, path) of the node which
+        contains the text of a file, see get_text_ref().
+
+        @type keep: bool
+        @param keep: New value for the flag.
+        """
+
+        self.__keep_texts = keep
+
+    def set_kept_revs(self, revs):
+        """
+        Sets the revisions which are queried after they are done.
+
+        The trees of all other revisions are released, querying them
+        raises an SvnDumpException. The tree of a revision is released
+        too after the last revision querying it. Copy sources are
+        queried by the revisions copying them, see
+        index.get_copy_sources().
+
+        Must be called before adding the first revision.
+
+        @type revs: dict( int -> int )
+        @param revs: Maps revision numbers to the last revision querying
+            them, None keeps all revisions.
+        """
+
+        self.__kept = revs
+        self.clear()
+
+    def clear(self):
+        """
+        Removes all revisions, only an empty root directory is kept.
+        """
+
+        # revision numbers and root directories of done revisions
+        self.__revnrs = []
+        self.__roots = []
+        self.__cur_rev = 0
+        self.__token = object()
+        self.__cur_root = _TreeDir({}, self.__token)
+        # the current revision changed the tree
+        self.__changed = False
+        # sorted kept revisions and a heap of ( last revnr, revnr )
+        self.__keptnrs = []
+        self.__expiry = []
+        if self.__kept is not None:
+            self.__keptnrs = sorted(self.__kept.keys())
+            self.__expiry = [(last, revnr) for revnr, last
+                             in self.__kept.iteritems()]
+            heapq.heapify(self.__expiry)
+
+    def __begin(self, revnr):
+        """
+        Starts a new revision if revnr isn't the current revision.
+
+        @type revnr: int
+        @param revnr: Revision number.
+        """
+
+        if revnr == self.__cur_rev:
+            return
+        if revnr < self.__cur_rev:
+            raise SvnDumpException("cannot change r%d, r%d is the current "
+                                   "revision" % (revnr, self.__cur_rev))
+        if self.__changed:
+            self.__revnrs.append(self.__cur_rev)
+            self.__roots.append(self.__cur_root)
+            self.__changed = False
+        self.__cur_rev = revnr
+        self.__token = object()
+        if self.__kept is None:
+            return
+        # the range of the newest roots changed, check them
+        for index in range(len(self.__roots) - 1,
+                           max(len(self.__roots) - 3, -1), -1):
+            self.__release_root(index)
+        # release roots after the last revision querying them
+        while len(self.__expiry) > 0 and self.__expiry[0][0] < revnr:
+            keptnr = heapq.heappop(self.__expiry)[1]
+            self.__release_root(bisect.bisect_right(self.__revnrs,
+                                                    keptnr) - 1)
+
+    def __release_root(self, index):
+        """
+        Releases a root if no kept revision is queried in its range.
+
+        @type index: int
+        @param index: Index of the root.
+        """
+
+        if index < 0:
+            return
+        if index + 1 < len(self.__revnrs):
+            endnr = self.__revnrs[index + 1]
+        else:
+            endnr = self.__cur_rev
+        keptnrs = self.__keptnrs
+        i = bisect.bisect_left(keptnrs, self.__revnrs[index])
+        while i < len(keptnrs) and keptnrs[i] < endnr:
+            if self.__kept[keptnrs[i]] >= self.__cur_rev:
+                return
+            i += 1
+        del self.__revnrs[index]
+        del self.__roots[index]
+
+    def __get_root(self, revnr):
+        """
+        Returns the root directory of a revision.
+
+        @type revnr: int
+        @param revnr: Revision number.
+        @rtype: _TreeDir
+        @return: The root directory.
+        """
+
+        if revnr >= self.__cur_rev:
+            return self.__cur_root
+        if self.__kept is not None and not self.__kept.has_key(revnr):
+            raise SvnDumpException("the tree of r%d is not kept" % revnr)
+        i = bisect.bisect_right(self.__revnrs, revnr) - 1
+        if i < 0:
+            return _TreeDir({}, None)
+        return self.__roots[i]
+
+    def __lookup(self, revnr, path):
+        """
+        Returns the entry of a path.
+
+        @type revnr: int
+        @param revnr: Revision number.
+        @type path: string
+        @param path: Path of a node.
+        @rtype: _TreeDir or file value
+        @return: The entry or _missing.
+        """
+
+        entry = self.__get_root(revnr)
+        if len(path) == 0:
+            return entry
+        for name in path.split("/"):
+            if entry.__class__ is not _TreeDir:
+                return _missing
+            entry = _get(entry, name)
+            if entry is _missing:
+                return _missing
+        return entry
+
+    def __mutable_dir(self, names):
+        """
+        Returns a directory of the current revision which may be changed.
+
+        Missing directories and files in the way are replaced by empty
+        directories.
+
+        @type names: list( string )
+        @param names: Path of the directory split at slashes.
+        @rtype: _TreeDir
+        @return: The directory.
+        """
+
+        self.__changed = True
+        token = self.__token
+        dir = _own(self.__cur_root, token)
+        self.__cur_root = dir
+        for name in names:
+            child = _get(dir, name)
+            if child.__class__ is not _TreeDir:
+                child = _TreeDir({}, token)
+                _set(dir, name, child, token)
+            elif child.owner is not token:
+                child = _own(child, token)
+                _set(dir, name, child, token)
+            dir = child
+        return dir
+
+    def get_kind(self, revnr, path):
+        """
+        Returns the kind of a node if it exists, else None.
+
+        @type revnr: int
+        @param revnr: Revision number.
+        @type path: string
+        @param path: Path of a node.
+        @rtype: string
+        @return: "D" for dirs, "F" for files or None.
+        """
+
+        entry = self.__lookup(revnr, path)
+        if entry is _missing:
+            return None
+        if entry.__class__ is _TreeDir:
+            return "D"
+        return "F"
+
+    def get_text_ref(self, revnr, path):
+        """
+        Returns the node containing the text of a file.
+
+        @type revnr: int
+        @param revnr: Revision number.
+        @type path: string
+        @param path: Path of a file.
+        @rtype: tuple( int, string )
+        @return: (revnr, path) of the node or None if the path is not a
+            file or has no text.
+        """
+
+        entry = self.__lookup(revnr, path)
+        if entry is _missing or entry.__class__ is _TreeDir:
+            return None
+        return entry
+
+    def add(self, revnr, path, kind, cfpath=None, cfrev=-1, value=None):
+        """
+        Adds a node, with all its children if it's a dir with copy-from.
+
+        @type revnr: int
+        @param revnr: Current revision number.
+        @type path: string
+        @param path: Path of the node.
+        @type kind: string
+        @param kind: "D" for dirs, "F" for files.
+        @type cfpath: string
+        @param cfpath: Copy-from path or None.
+        @type cfrev: int
+        @param cfrev: Copy-from revision.
+        @type value: tuple( int, string )
+        @param value: Value of a file, copied from cfpath if None.
+        """
+
+        self.__begin(revnr)
+        if len(path) == 0:
+            return
+        names = path.split("/")
+        entry = _missing
+        if cfpath is not None:
+            entry = self.__lookup(cfrev, cfpath)
+            if entry.__class__ is _TreeDir and entry.owner is self.__token:
+                # copy from the current revision, freeze it
+                self.__token = object()
+        if kind == "F":
+            if value is None and entry is not _missing and \
+                    entry.__class__ is not _TreeDir:
+                value = entry
+            entry = value
+        elif entry is _missing or entry.__class__ is not _TreeDir:
+            entry = _TreeDir({}, self.__token)
+        _set(self.__mutable_dir(names[:-1]), names[-1], entry, self.__token)
+
+    def change(self, revnr, path, value):
+        """
+        Changes the value of a file.
+
+        @type revnr: int
+        @param revnr: Current revision number.
+        @type path: string
+        @param path: Path of the file.
+        @type value: tuple( int, string )
+        @param value: New value of the file.
+        """
+
+        self.__begin(revnr)
+        if self.get_kind(revnr, path) != "F":
+            return
+        names = path.split("/")
+        _set(self.__mutable_dir(names[:-1]), names[-1], value, self.__token)
+
+    def delete(self, revnr, path):
+        """
+        Deletes a node, with all its children if it's a dir.
+
+        @type revnr: int
+        @param revnr: Current revision number.
+        @type path: string
+        @param path: Path of the node.
+        """
+
+        self.__begin(revnr)
+        if len(path) == 0 or self.get_kind(revnr, path) is None:
+            return
+        names = path.split("/")
+        _remove(self.__mutable_dir(names[:-1]), names[-1], self.__token)
+
+    def process_node(self, revnr, node):
+        """
+        Applies the action of a node to the tree.
+
+        Nodes without kind are added as dirs.
+
+        @type revnr: int
+        @param revnr: Current revision number.
+        @type node: SvnDumpNode
+        @param node: The node.
+        """
+
+        path = node.get_path()
+        action = node.get_action()
+        value = None
+        if self.__keep_texts and node.has_text():
+            value = (revnr, path)
+        if action == "change":
+            if value is not None:
+                self.change(revnr, path, value)
+            return
+        if action != "add":
+            self.delete(revnr, path)
+            if action == "delete":
+                return
+        kind = "D"
+        if node.get_kind() == "file":
+            kind = "F"
+        if node.has_copy_from():
+            self.add(revnr, path, kind, node.get_copy_from_path(),
+                     node.get_copy_from_rev(), value)
+        else:
+            self.add(revnr, path, kind, None, -1, value)
+
+    def walk(self, revnr, path=""):
+        """
+        Iterates over a dir and all its children.
+
+        @type revnr: int
+        @param revnr: Revision number.
+        @type path: string
+        @param path: Path of the dir.
+        @rtype: generator
+        @return: Yields ( path, kind ) tuples in no particular order, kind
+            is "D" for dirs and "F" for files.
+        """
+
+        entry = self.__lookup(revnr, path)
+        if entry.__class__ is not _TreeDir:
+            return
+        if len(path) > 0:
+            path += "/"
+        stack = [(path, entry)]
+        while len(stack) > 0:
+            prefix, dir = stack.pop()
+            for name, child in _iter_entries(dir):
+                if child.__class__ is _TreeDir:
+                    yield prefix + name, "D"
+                    stack.append((prefix + name + "/", child))
+                else:
+                    yield prefix + name, "F"
+
+    def get_text_refs(self):
+        """
+        Returns the text values of all files in the kept revisions.
+
+        Texts not in this set can't be reached by copies anymore.
+
+        @rtype: set( tuple( int, string ) )
+        @return: The values of the files which are not None.
+        """
+
+        refs = set()
+        seen = set()
+        stack = [self.__cur_root] + self.__roots
+        while len(stack) > 0:
+            node = stack.pop()
+            if id(node) in seen:
+                continue
+            seen.add(id(node))
+            entries = node.entries
+            if entries.__class__ is list:
+                for child in entries:
+                    if child is not None:
+                        stack.append(child)
+                continue
+            for value in entries.itervalues():
+                if value.__class__ is _TreeDir:
+                    stack.append(value)
+                elif value is not None:
+                    refs.add(value)
+        return refs
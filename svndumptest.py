@@ -23,17 +23,33 @@
 
 from __future__ import print_function
 
+import gzip
+import multiprocessing
+import random
 import sys
-from os import mkdir, system, listdir, remove, rmdir
-from os.path import isdir, isfile, abspath
+import threading
+from os import mkdir, urandom, system, listdir, remove, rmdir
+from os.path import isdir, isfile, abspath, dirname, join
 import time  # for svn cp bug
 import zlib
+from hashlib import md5, sha1, sha256
 
 import svndump
+import svndump.node
+import svndump.shard
+from svndump.compress import create_dump_file
+from svndump.common import ListDict, SvnDumpException, \
+    TextDigestWriter, create_prop_string, create_svn_date_str, \
+    is_canonical_svn_date_str, parse_prop_block, parse_svn_date_str
 from svndump.node import SvnDumpNode
 from svndump.file import SvnDumpFile
 from svndump.diff import svndump_diff_cmdline
 from svndump.eolfix import svndump_eol_fix_cmdline
+from svndump.index import get_copy_sources, index_filename
+from svndump.tree import SvnDumpTree
+
+# the commandline tool, for testing stdin, stdout and printed output
+svndumptool = join(dirname(abspath(__file__)), "svndumptool.py")
 
 
 def run(cmd):
@@ -43,6 +59,11 @@ def run(cmd):
     return rc
 
 
+def run_tool(args):
+    """Runs svndumptool.py, args is a shell command line."""
+    return run("'%s' '%s' %s" % (sys.executable, svndumptool, args))
+
+
 def kill_dir(dir):
     """'rm -rf dir' in python ;-)"""
     if isdir(dir):
@@ -604,7 +625,7 @@ def test_eolfix(params):
     py_create_dump_file(broken, "eolfix", data_test1, tempfiles)
     # eolfix
     svndump_eol_fix_cmdline("svndumptest.py",
-                            ["-mregexp", "-r", "\\.txt$", broken, fixed])
+                            ["-r", "\\.txt$", broken, fixed])
     # compare broken and fixed
     rc = svndump_diff_cmdline("svndumptest.py",
                               ["-e", "-IEOL", "-ITextLen", "-ITextMD5",
@@ -615,7 +636,7 @@ def test_eolfix(params):
         return 1
     # eolfix and add eol-style
     svndump_eol_fix_cmdline("svndumptest.py",
-                            ["-mregexp", "-r", "\\.txt$", "-Enative",
+                            ["-r", "\\.txt$", "-Enative",
                              broken, fixed2])
     # compare broken and fixed
     rc = svndump_diff_cmdline("svndumptest.py",
@@ -631,9 +652,1106 @@ def test_eolfix(params):
     return 0
 
 
+def create_copy_dump_file(filename):
+    """
+    Creates a dump file with a copied file like svnadmin dump does.
+
+    The text of a.txt has CRLF line endings and b.txt is a copy of it with
+    a Text-copy-source-md5 header.
+    """
+
+    text = "line A\r\nline B\r\n"
+    textmd5 = md5(text).hexdigest()
+    props = "K 10\nsvn:author\nV 1\nt\nK 8\nsvn:date\n" \
+            "V 27\n2004-01-01T12:00:00.000000Z\nK 7\nsvn:log\nV 3\nlog\n" \
+            "PROPS-END\n"
+    fileobj = open(filename, "wb")
+    fileobj.write("SVN-fs-dump-format-version: 2\n\n"
+                  "UUID: 11111111-1111-1111-1111-111111111111\n\n")
+    fileobj.write("Revision-number: 1\nProp-content-length: %d\n"
+                  "Content-length: %d\n\n%s\n" %
+                  (len(props), len(props), props))
+    fileobj.write("Node-path: a.txt\nNode-kind: file\nNode-action: add\n"
+                  "Prop-content-length: 10\nText-content-length: %d\n"
+                  "Text-content-md5: %s\nContent-length: %d\n\n"
+                  "PROPS-END\n%s\n\n" %
+                  (len(text), textmd5, len(text) + 10, text))
+    fileobj.write("Node-path: b.txt\nNode-kind: file\nNode-action: add\n"
+                  "Node-copyfrom-rev: 1\nNode-copyfrom-path: a.txt\n"
+                  "Text-copy-source-md5: %s\n\n\n" % textmd5)
+    fileobj.close()
+    return textmd5
+
+
+def test_eolfix_copy(params):
+    """Test 3: Test eolfix of a dump with a copied file."""
+
+    # get params
+    tempdir = params["tempdir"]
+
+    # broken and fixed dumps
+    broken = tempdir + "/test_eolfix_copy_1"
+    fixed = tempdir + "/test_eolfix_copy_2"
+
+    # create dump, a.txt is copied to b.txt in the same revision
+    oldmd5 = create_copy_dump_file(broken)
+    # eolfix
+    svndump_eol_fix_cmdline("svndumptest.py",
+                            ["-r", "\\.txt$", broken, fixed])
+    # the checksum of the unfixed copy source must be gone
+    fileobj = open(fixed, "rb")
+    data = fileobj.read()
+    fileobj.close()
+    rc = 0
+    if data.find(oldmd5) >= 0:
+        rc = 1
+    add_test_result(params, "test_eolfix_copy", "no old copy source md5", rc)
+    if rc != 0:
+        print("old copy source md5 found :(")
+        return 1
+    # the copy is still there
+    dump = SvnDumpFile()
+    dump.open(fixed)
+    dump.read_next_rev()
+    node = dump.get_node(1)
+    rc = 0
+    if node.get_path() != "b.txt" or node.get_copy_from_path() != "a.txt":
+        rc = 1
+    dump.close()
+    add_test_result(params, "test_eolfix_copy", "copy of b.txt", rc)
+    if rc != 0:
+        print("copy lost :(")
+        return 1
+
+    # done.
+    return 0
+
+
+def check_listdict(ld, keys, values):
+    """Returns True if a ListDict contains the given keys and values."""
+
+    items = list(zip(keys, values))
+    if len(ld) != len(keys) or list(ld) != keys or \
+            ld.keys() != keys or ld.values() != values or \
+            ld.items() != items:
+        return False
+    for i in range(len(keys)):
+        if ld[i] != values[i] or ld[i - len(keys)] != values[i] or \
+                ld.key(i) != keys[i] or ld.item(i) != items[i] or \
+                ld[keys[i]] != values[i]:
+            return False
+    if ld.keys()[1:-1:2] != keys[1:-1:2] or \
+            ld.values()[::3] != values[::3] or \
+            ld.items()[-2:] != items[-2:]:
+        return False
+    for i in [len(keys), -len(keys) - 1]:
+        try:
+            ld[i]
+            return False
+        except IndexError:
+            pass
+    return True
+
+
+def test_listdict(params):
+    """Test 4: Test ListDict order, index lookup and views."""
+
+    # compare with a list of keys and values after each operation
+    rnd = random.Random(4)
+    ld = ListDict()
+    keys = []
+    values = []
+    rc = 0
+    for step in range(600):
+        op = rnd.randint(0, 9)
+        if op < 4 or len(keys) < 2:
+            # add a new or a previously deleted key at the end
+            key = "k%d" % rnd.randint(0, 300)
+            if key in keys:
+                continue
+            ld[key] = step
+            keys.append(key)
+            values.append(step)
+        elif op < 6:
+            # delete by index
+            i = rnd.randint(-len(keys), len(keys) - 1)
+            del ld[i]
+            del keys[i]
+            del values[i]
+        elif op < 8:
+            # delete by key
+            i = rnd.randint(0, len(keys) - 1)
+            del ld[keys[i]]
+            del keys[i]
+            del values[i]
+        else:
+            # replace a value by index and by key, the order is kept
+            i = rnd.randint(0, len(keys) - 1)
+            ld[i] = -step
+            ld[keys[-1]] = step
+            values[i] = -step
+            values[-1] = step
+        if not check_listdict(ld, keys, values):
+            print("wrong ListDict after step %d :(" % step)
+            rc = 1
+            break
+    add_test_result(params, "test_listdict", "deletes and inserts", rc)
+    if rc != 0:
+        return 1
+
+    # views reflect later changes
+    ld = ListDict()
+    keys = ld.keys()
+    items = ld.items()
+    ld["a"] = 1
+    ld["b"] = 2
+    ld["c"] = 3
+    del ld[1]
+    if keys != ["a", "c"] or "b" in keys or "c" not in keys or \
+            ("c", 3) not in items or ("a", 3) in items or \
+            3 not in ld.values() or len(items) != 2:
+        rc = 1
+    ld.clear()
+    if len(keys) != 0 or list(items) != []:
+        rc = 1
+    add_test_result(params, "test_listdict", "views", rc)
+    if rc != 0:
+        print("wrong view :(")
+        return 1
+
+    # done.
+    return 0
+
+
+def test_tree(params):
+    """Test 16: Test changing a wide dir of a tree many times."""
+
+    start = time.time()
+
+    # r1 is the copy source of the last revision, the others are released
+    tree = SvnDumpTree()
+    tree.set_kept_revs({1: 8002})
+    tree.add(1, "d", "D")
+    for i in range(20000):
+        tree.add(1, "d/f%d" % i, "F", value=(1, "d/f%d" % i))
+    for revnr in range(2, 8002):
+        path = "d/f%d" % (revnr * 7 % 20000)
+        tree.change(revnr, path, (revnr, path))
+    tree.add(8002, "t", "D", "d", 1)
+    rc = 0
+    if tree.get_text_ref(8002, "t/f14") != (1, "d/f14") or \
+            tree.get_text_ref(8002, "d/f14") != (2, "d/f14") or \
+            len(list(tree.walk(8002, "t"))) != 20000:
+        rc = 1
+    add_test_result(params, "test_tree", "copy of a kept revision", rc)
+    if rc != 0:
+        print("wrong tree :(")
+        return 1
+
+    try:
+        tree.get_kind(500, "d")
+        rc = 1
+    except SvnDumpException:
+        pass
+    add_test_result(params, "test_tree", "released revision", rc)
+    if rc != 0:
+        print("revision not released :(")
+        return 1
+
+    # copying the dir on each change ran out of memory
+    seconds = time.time() - start
+    print("SvnDumpTree changes: %.2fs" % seconds)
+    if seconds > 30:
+        rc = 1
+    add_test_result(params, "test_tree", "changes time", rc)
+    if rc != 0:
+        print("too slow :(")
+        return 1
+
+    # done.
+    return 0
+
+
+def compare_files(params, funcname, descr, file1, file2):
+    """Compares two files and adds the result to the test results."""
+    rc = run("cmp '%s' '%s'" % (file1, file2))
+    add_test_result(params, funcname, descr, rc)
+    if rc != 0:
+        print("diffs found :(")
+    return rc
+
+
+def plain_copy(srcfile, dstfile, usemmap=False):
+    """Copies a dump file (name or file object) revision by revision
+    without pipeline."""
+
+    srcdmp = SvnDumpFile()
+    srcdmp.set_use_mmap(usemmap)
+    srcdmp.open(srcfile)
+    dstdmp = SvnDumpFile()
+    srcdmp.read_next_rev()
+    hasrev = dstdmp.create_like(dstfile, srcdmp)
+    while hasrev:
+        dstdmp.add_rev_from_dump(srcdmp)
+        hasrev = srcdmp.read_next_rev()
+    srcdmp.close()
+    dstdmp.close()
+
+
+def test_source(params):
+    """Returns the name of the dump file used by the following tests."""
+
+    if not params.has_key("testsource"):
+        source = params["tempdir"] + "/test_source"
+        py_create_dump_file(source, "source", data_test1,
+                            params["tempfiles"])
+        params["testsource"] = source
+    return params["testsource"]
+
+
+def read_revisions(dump, revnrs):
+    """Seeks to and reads the given revisions, returns what was read."""
+
+    revs = []
+    for revnr in revnrs:
+        dump.seek_rev(revnr)
+        if not dump.read_next_rev():
+            revs.append(None)
+            continue
+        paths = [node.get_path() for node in dump.get_nodes_iter()]
+        revs.append((dump.get_rev_nr(), dump.get_rev_log(), paths))
+    return revs
+
+
+def test_index(params):
+    """Test 5: Test seek_rev() with and without index file."""
+
+    source = test_source(params)
+    revnrs = [9, 3, 0, 5, 5, 1, 8, 2]
+    indexfile = index_filename(source)
+    if isfile(indexfile):
+        remove(indexfile)
+
+    # without index
+    dump = SvnDumpFile()
+    dump.open(source)
+    expected = read_revisions(dump, revnrs)
+    dump.close()
+    # the last revision copying from each copy source
+    dump = SvnDumpFile()
+    dump.open(source)
+    sources = {}
+    while dump.read_next_rev():
+        for node in dump.get_nodes_iter():
+            if node.has_copy_from():
+                sources[node.get_copy_from_rev()] = dump.get_rev_nr()
+    dump.close()
+    # with index
+    rc = run_tool("index '%s'" % source)
+    add_test_result(params, "test_index", "create index", rc)
+    if rc != 0:
+        return 1
+    dump = SvnDumpFile()
+    dump.open(source)
+    revs = read_revisions(dump, revnrs)
+    dump.close()
+    rc = 0
+    if revs != expected or expected[0][0] != 9 or expected[2][0] != 0:
+        rc = 1
+    add_test_result(params, "test_index", "seek_rev with index", rc)
+    if rc != 0:
+        print("diffs found :(")
+        remove(indexfile)
+        return 1
+    if len(sources) == 0 or get_copy_sources(source) != sources:
+        rc = 1
+    remove(indexfile)
+    add_test_result(params, "test_index", "copy sources", rc)
+    if rc != 0:
+        print("wrong copy sources :(")
+        return 1
+
+    # done.
+    return 0
+
+
+def test_stdin(params):
+    """Test 6: Test reading from stdin."""
+
+    tempdir = params["tempdir"]
+    source = test_source(params)
+    plain = tempdir + "/test_stdin_1"
+    piped = tempdir + "/test_stdin_2"
+
+    run_tool("copy '%s' '%s'" % (source, plain))
+    run_tool("copy - '%s' < '%s'" % (piped, source))
+    if compare_files(params, "test_stdin", "copy from stdin",
+                     plain, piped) != 0:
+        return 1
+    run_tool("ls -r 8 '%s' > '%s'" % (source, plain))
+    run_tool("ls -r 8 - < '%s' > '%s'" % (source, piped))
+    if compare_files(params, "test_stdin", "ls from stdin",
+                     plain, piped) != 0:
+        return 1
+
+    # done.
+    return 0
+
+
+def test_mmap(params):
+    """Test 7: Test reading a memory mapped dump file."""
+
+    tempdir = params["tempdir"]
+    source = test_source(params)
+    plain = tempdir + "/test_mmap_1"
+    mapped = tempdir + "/test_mmap_2"
+
+    plain_copy(source, plain, False)
+    plain_copy(source, mapped, True)
+    if compare_files(params, "test_mmap", "copy memory mapped",
+                     plain, mapped) != 0:
+        return 1
+
+    # done.
+    return 0
+
+
+def test_ls_revs(params):
+    """Test 8: Test listing several revisions at once."""
+
+    tempdir = params["tempdir"]
+    source = test_source(params)
+    single = tempdir + "/test_ls_revs_1"
+    multi = tempdir + "/test_ls_revs_2"
+
+    if isfile(single):
+        remove(single)
+    for rev, name in [("2", "2"), ("8", "8"), ("HEAD", "9")]:
+        run("echo 'Revision %s:' >> '%s'" % (name, single))
+        run_tool("ls -r %s '%s' >> '%s'" % (rev, source, single))
+    run_tool("ls -r 2,8,HEAD '%s' > '%s'" % (source, multi))
+    if compare_files(params, "test_ls_revs", "ls -r 2,8,HEAD",
+                     single, multi) != 0:
+        return 1
+
+    # done.
+    return 0
+
+
+def test_check_jobs(params):
+    """Test 9: Test checking md5/sha1 sums with worker processes."""
+
+    tempdir = params["tempdir"]
+    source = test_source(params)
+    broken = tempdir + "/test_check_jobs_1"
+    single = tempdir + "/test_check_jobs_2"
+    multi = tempdir + "/test_check_jobs_3"
+
+    # break one md5 sum
+    fileobj = open(source, "rb")
+    data = fileobj.read()
+    fileobj.close()
+    i = data.index("Text-content-md5: ") + 18
+    data = data[:i] + "0" * 32 + data[i + 32:]
+    fileobj = open(broken, "wb")
+    fileobj.write(data)
+    fileobj.close()
+
+    run_tool("check -A '%s' > '%s'" % (broken, single))
+    run_tool("check -A -j 2 '%s' > '%s'" % (broken, multi))
+    if compare_files(params, "test_check_jobs", "check -A -j 2",
+                     single, multi) != 0:
+        return 1
+    rc = run("grep -q md5 '%s'" % multi)
+    add_test_result(params, "test_check_jobs", "md5 error found", rc)
+    if rc != 0:
+        return 1
+
+    # done.
+    return 0
+
+
+def test_pipeline(params):
+    """Test 10: Test copying in a pipeline and in shards."""
+
+    tempdir = params["tempdir"]
+    source = test_source(params)
+    plain = tempdir + "/test_pipeline_1"
+    piped = tempdir + "/test_pipeline_2"
+    shards = tempdir + "/test_pipeline_3"
+
+    plain_copy(source, plain)
+    svndump.copy_dump_file(source, piped)
+    if compare_files(params, "test_pipeline", "pipeline copy",
+                     plain, piped) != 0:
+        return 1
+    # the test dump is far too small for shards of the normal size
+    minsize = svndump.shard._MIN_SHARD_SIZE
+    svndump.shard._MIN_SHARD_SIZE = 1
+    try:
+        svndump.copy_dump_file(source, shards, None, 4)
+    finally:
+        svndump.shard._MIN_SHARD_SIZE = minsize
+    if compare_files(params, "test_pipeline", "copy in shards",
+                     plain, shards) != 0:
+        return 1
+
+    # done.
+    return 0
+
+
+def test_pipeline_cmd(params):
+    """Test 11: Test the pipeline command."""
+
+    tempdir = params["tempdir"]
+    source = test_source(params)
+    step1 = tempdir + "/test_pipeline_cmd_1"
+    step2 = tempdir + "/test_pipeline_cmd_2"
+    chained = tempdir + "/test_pipeline_cmd_3"
+
+    run_tool("transform-revprop svn:log file FILE '%s' '%s'" %
+             (source, step1))
+    run_tool("remove-prop test true '%s' '%s'" % (step1, step2))
+    run_tool("pipeline --transform-revprop svn:log file FILE "
+             "--remove-prop test true '%s' '%s'" % (source, chained))
+    if compare_files(params, "test_pipeline_cmd", "pipeline vs commands",
+                     step2, chained) != 0:
+        return 1
+
+    # done.
+    return 0
+
+
+def test_compression(params):
+    """Test 12: Test reading and writing compressed dump files."""
+
+    tempdir = params["tempdir"]
+    source = test_source(params)
+    plain = tempdir + "/test_compression_1"
+    unpacked = tempdir + "/test_compression_2"
+
+    run_tool("copy '%s' '%s'" % (source, plain))
+    for ext, pack in [(".gz", "gzip -c"), (".bz2", "bzip2 -c")]:
+        packed = tempdir + "/test_compression_3" + ext
+        run("%s '%s' > '%s'" % (pack, source, packed))
+        run_tool("copy '%s' '%s'" % (packed, unpacked))
+        if compare_files(params, "test_compression", "read " + ext,
+                         plain, unpacked) != 0:
+            return 1
+
+    # write compressed
+    for ext, unpack in [(".gz", "gzip -dc"), (".bz2", "bzip2 -dc")]:
+        packed = tempdir + "/test_compression_4" + ext
+        run_tool("copy '%s' '%s'" % (source, packed))
+        run("%s '%s' > '%s'" % (unpack, packed, unpacked))
+        if compare_files(params, "test_compression", "write " + ext,
+                         plain, unpacked) != 0:
+            return 1
+
+    # several compressed outputs share the compression threads
+    fileobj = open(plain, "rb")
+    data = fileobj.read()
+    fileobj.close()
+    threads = threading.active_count()
+    packed = [tempdir + "/test_compression_5_%d.gz" % i for i in range(4)]
+    outputs = [create_dump_file(name) for name in packed]
+    for output in outputs:
+        output.write(data)
+    threads = threading.active_count() - threads
+    for output in outputs:
+        output.close()
+    rc = 0
+    # a ThreadPool has 3 threads besides its workers
+    if threads > multiprocessing.cpu_count() + 3:
+        rc = 1
+    add_test_result(params, "test_compression", "shared threads", rc)
+    if rc != 0:
+        print("%d compression threads :(" % threads)
+        return 1
+    for name in packed:
+        run("gzip -dc '%s' > '%s'" % (name, unpacked))
+        if compare_files(params, "test_compression", "write shared",
+                         plain, unpacked) != 0:
+            return 1
+
+    # done.
+    return 0
+
+
+def test_stdout(params):
+    """Test 13: Test writing to stdout."""
+
+    tempdir = params["tempdir"]
+    source = test_source(params)
+    plain = tempdir + "/test_stdout_1"
+    piped = tempdir + "/test_stdout_2"
+
+    run_tool("copy '%s' '%s'" % (source, plain))
+    run_tool("copy '%s' - > '%s'" % (source, piped))
+    if compare_files(params, "test_stdout", "copy to stdout",
+                     plain, piped) != 0:
+        return 1
+    run_tool("join -o - '%s' > '%s'" % (source, piped))
+    if compare_files(params, "test_stdout", "join to stdout",
+                     plain, piped) != 0:
+        return 1
+    # library functions writing to stdout don't redirect sys.stdout
+    script = "import svndump; svndump.copy_dump_file('%s', '-'); " \
+             "print('done')" % source
+    run("cd '%s' && '%s' -c \"%s\" > '%s'" %
+        (dirname(svndumptool), sys.executable, script, piped))
+    run("echo done >> '%s'" % plain)
+    if compare_files(params, "test_stdout", "stdout kept by library",
+                     plain, piped) != 0:
+        return 1
+
+    # done.
+    return 0
+
+
+def test_split_join(params):
+    """Test 14: Test raw and overlapping split and join."""
+
+    tempdir = params["tempdir"]
+    source = test_source(params)
+    packed = tempdir + "/test_split_join.gz"
+    base = tempdir + "/test_split_join_"
+
+    # the raw copy is used for uncompressed files only
+    run("gzip -c '%s' > '%s'" % (source, packed))
+    ranges = "0 3 %s1 4 6 %s2 7 9 %s3"
+    run_tool("split '%s' %s" % (source, ranges % (base, base, base)))
+    base2 = base + "gz"
+    run_tool("split '%s' %s" % (packed, ranges % (base2, base2, base2)))
+    for i in range(1, 4):
+        if compare_files(params, "test_split_join", "split part %d" % i,
+                         "%s%d" % (base, i), "%s%d" % (base2, i)) != 0:
+            return 1
+    run_tool("join -o '%sjoined' '%s1' '%s2' '%s3'" %
+             (base, base, base, base))
+    run("gzip -c '%s1' > '%s1.gz'" % (base, base))
+    run_tool("join -o '%sjoined' '%s1.gz' '%s2' '%s3'" %
+             (base2, base, base, base))
+    if compare_files(params, "test_split_join", "join raw",
+                     base + "joined", base2 + "joined") != 0:
+        return 1
+    if compare_files(params, "test_split_join", "join of split",
+                     source, base + "joined") != 0:
+        return 1
+
+    # overlapping and nested ranges are read in one pass
+    overlap = "0 6 %so1 4 9 %so2 5 5 %so3" % (base, base, base)
+    run_tool("split '%s' %s" % (source, overlap))
+    overlap = "0 6 %so1 4 9 %so2 5 5 %so3" % (base2, base2, base2)
+    run_tool("split '%s' %s" % (packed, overlap))
+    i = 1
+    for revs in ["0 6", "4 9", "5 5"]:
+        single = "%ss%d" % (base, i)
+        run_tool("split '%s' %s '%s'" % (source, revs, single))
+        if compare_files(params, "test_split_join", "overlapping %d" % i,
+                         single, "%so%d" % (base, i)) != 0:
+            return 1
+        if compare_files(params, "test_split_join",
+                         "overlapping gz %d" % i,
+                         single, "%so%d" % (base2, i)) != 0:
+            return 1
+        i += 1
+
+    # done.
+    return 0
+
+
+class CountingFile:
+    """A read-only file object counting the bytes read."""
+
+    def __init__(self, filename):
+        self.name = filename
+        self.count = 0
+        self.__file = open(filename, "rb")
+
+    def read(self, size=-1):
+        data = self.__file.read(size)
+        self.count += len(data)
+        return data
+
+    def readline(self, size=-1):
+        data = self.__file.readline(size)
+        self.count += len(data)
+        return data
+
+    def seek(self, offset, whence=0):
+        self.__file.seek(offset, whence)
+
+    def tell(self):
+        return self.__file.tell()
+
+    def close(self):
+        self.__file.close()
+
+
+def test_compressed_seek(params):
+    """Test 15: Test the cost of seeking back in a compressed dump file."""
+
+    tempdir = params["tempdir"]
+    plain = tempdir + "/test_compressed_seek_1"
+    packed = tempdir + "/test_compressed_seek_2.gz"
+    copied = tempdir + "/test_compressed_seek_3"
+    textfile = tempdir + "/test_compressed_seek_text"
+
+    # incompressible texts, far more than the checkpoint distance
+    dump = SvnDumpFile()
+    dump.create_with_rev_0(plain, "11111111-1111-1111-1111-111111111111",
+                           "2004-01-01T12:00:00.000000Z")
+    for revnr in range(1, 121):
+        dump.add_rev({"svn:date": "2004-01-01T12:00:00.000000Z"})
+        fileobj = open(textfile, "wb")
+        fileobj.write(urandom(100000))
+        fileobj.close()
+        action = "change"
+        if revnr <= 4:
+            action = "add"
+        node = SvnDumpNode("f%d" % (revnr % 4), action, "file")
+        node.set_property("test", "true")
+        node.set_text_file(textfile)
+        dump.add_node(node)
+    dump.close()
+    fileobj = open(plain, "rb")
+    gzfile = gzip.open(packed, "wb")
+    gzfile.write(fileobj.read())
+    gzfile.close()
+    fileobj.close()
+
+    # reading the texts and raw records seeks back over each node
+    counter = CountingFile(packed)
+    plain_copy(counter, copied)
+    counter.close()
+    if compare_files(params, "test_compressed_seek", "copy from gzip",
+                     plain, copied) != 0:
+        return 1
+    size = len(open(packed, "rb").read())
+    print("read %d bytes of %d" % (counter.count, size))
+    rc = 0
+    if counter.count > size * 3 // 2:
+        rc = 1
+    add_test_result(params, "test_compressed_seek", "compressed bytes read",
+                    rc)
+    if rc != 0:
+        print("compressed data read too often :(")
+        return 1
+
+    # done.
+    return 0
+
+
+def test_props_edit(params):
+    """Test 17: Test editing the dict returned by get_properties()."""
+
+    tempdir = params["tempdir"]
+    source = test_source(params)
+    edited = tempdir + "/test_props_edit_1"
+
+    # edit the dict in place and pass the same object back
+    srcdmp = SvnDumpFile()
+    srcdmp.open(source)
+    dstdmp = SvnDumpFile()
+    srcdmp.read_next_rev()
+    hasrev = dstdmp.create_like(edited, srcdmp)
+    count = 0
+    while hasrev:
+        for node in srcdmp.get_nodes_iter():
+            if node.has_properties():
+                properties = node.get_properties()
+                properties["mutated"] = "yes"
+                node.set_properties(properties)
+                count += 1
+        dstdmp.add_rev_from_dump(srcdmp)
+        hasrev = srcdmp.read_next_rev()
+    srcdmp.close()
+    dstdmp.close()
+
+    # all edits have been written
+    dump = SvnDumpFile()
+    dump.open(edited)
+    found = 0
+    while dump.read_next_rev():
+        for node in dump.get_nodes_iter():
+            if node.get_property("mutated") == "yes":
+                found += 1
+    dump.close()
+    rc = 0
+    if count == 0 or found != count:
+        rc = 1
+    add_test_result(params, "test_props_edit", "edited properties", rc)
+    if rc != 0:
+        print("%d of %d edits written :(" % (found, count))
+        return 1
+
+    # done.
+    return 0
+
+
+def test_skip_texts(params):
+    """Test 18: Test reading metadata without reading the node texts."""
+
+    tempdir = params["tempdir"]
+    plain = tempdir + "/test_skip_texts_1"
+    textfile = tempdir + "/test_skip_texts_text"
+
+    dump = SvnDumpFile()
+    dump.create_with_rev_0(plain, "11111111-1111-1111-1111-111111111111",
+                           "2004-01-01T12:00:00.000000Z")
+    for revnr in range(1, 21):
+        dump.add_rev({"svn:date": "2004-01-01T12:00:00.000000Z"})
+        fileobj = open(textfile, "wb")
+        fileobj.write(("line %d\n" % revnr) * 10000)
+        fileobj.close()
+        action = "change"
+        if revnr == 1:
+            action = "add"
+        node = SvnDumpNode("f", action, "file")
+        node.set_text_file(textfile)
+        dump.add_node(node)
+    dump.close()
+
+    # only the headers and properties are read
+    counter = CountingFile(plain)
+    dump = SvnDumpFile()
+    dump.open(counter)
+    count = 0
+    while dump.read_next_rev():
+        for node in dump.get_nodes_iter():
+            if node.get_text_length() > 0:
+                count += 1
+    dump.close()
+    counter.close()
+    size = len(open(plain, "rb").read())
+    print("read %d bytes of %d" % (counter.count, size))
+    rc = 0
+    if count != 20 or counter.count > size // 10:
+        rc = 1
+    add_test_result(params, "test_skip_texts", "texts skipped", rc)
+    if rc != 0:
+        print("texts have been read :(")
+        return 1
+
+    # done.
+    return 0
+
+
+def test_svn_date(params):
+    """Test 19: Test parsing and creating svn date strings."""
+
+    # ( date string, canonical, time_t, micros )
+    dates = [
+        ("2004-02-29T23:59:59.999999Z", True, 1078099199, 999999),
+        ("2000-02-29T00:00:00.000000Z", True, 951782400, 0),
+        ("1970-01-01T00:00:00.000000Z", True, 0, 0),
+        ("2038-01-19T03:14:08.000001Z", True, 2147483648, 1),
+        # leap second, handled by strptime
+        ("2016-12-31T23:59:60.500000Z", False, 1483228800, 500000),
+        # before 1970
+        ("1969-12-31T23:59:59.000000Z", False, -1, 0),
+        ("1901-03-01T12:00:00.000001Z", False, -2172312000, 1),
+    ]
+    rc = 0
+    # not a leap year
+    if is_canonical_svn_date_str("2003-02-29T12:00:00.000000Z"):
+        print("2003-02-29 is canonical :(")
+        rc = 1
+    for datestr, canonical, secs, micros in dates:
+        if is_canonical_svn_date_str(datestr) != canonical:
+            print("wrong canonical flag for %s :(" % datestr)
+            rc = 1
+        if parse_svn_date_str(datestr) != (secs, micros):
+            print("%s parsed as %s :(" % (datestr,
+                                          parse_svn_date_str(datestr)))
+            rc = 1
+    add_test_result(params, "test_svn_date", "parse date strings", rc)
+    if rc != 0:
+        return 1
+
+    for datestr, canonical, secs, micros in dates:
+        if canonical or secs < 0:
+            if create_svn_date_str((secs, micros)) != datestr:
+                print("%s created as %s :(" %
+                      (datestr, create_svn_date_str((secs, micros))))
+                rc = 1
+    add_test_result(params, "test_svn_date", "create date strings", rc)
+    if rc != 0:
+        return 1
+
+    # done.
+    return 0
+
+
+def test_prop_block(params):
+    """Test 20: Test parsing property blocks."""
+
+    props = ListDict()
+    props["svn:ignore"] = "*.o\n*.a\n"
+    props["empty"] = ""
+    props["tricky"] = "V 3\nPROPS-END\n"
+    props["deleted"] = None
+    block = create_prop_string(props)
+    parsed = parse_prop_block(block)
+    rc = 0
+    if parsed is None or list(parsed.items()) != list(props.items()):
+        rc = 1
+    add_test_result(params, "test_prop_block", "parse property block", rc)
+    if rc != 0:
+        print("wrong properties %s :(" % parsed)
+        return 1
+
+    # broken blocks
+    for broken in [block[:-1], block[1:], block.replace("K 5\n", "K 6\n"),
+                   block.replace("V 0\n", "X 0\n"), "PROPS-END"]:
+        if parse_prop_block(broken) is not None:
+            print("broken block parsed: %r :(" % broken)
+            rc = 1
+    add_test_result(params, "test_prop_block", "broken property blocks", rc)
+    if rc != 0:
+        return 1
+
+    # done.
+    return 0
+
+
+def test_lazy_props(params):
+    """Test 21: Test copying nodes whose properties have been read."""
+
+    tempdir = params["tempdir"]
+    source = test_source(params)
+    plain = tempdir + "/test_lazy_props_1"
+    copied = tempdir + "/test_lazy_props_2"
+
+    plain_copy(source, plain)
+    srcdmp = SvnDumpFile()
+    srcdmp.open(source)
+    dstdmp = SvnDumpFile()
+    srcdmp.read_next_rev()
+    hasrev = dstdmp.create_like(copied, srcdmp)
+    count = 0
+    dirty = 0
+    while hasrev:
+        for node in srcdmp.get_nodes_iter():
+            if node.has_properties():
+                # reading properties doesn't change the node
+                node.get_property("svn:ignore")
+                node.get_properties_string()
+                count += 1
+            if node.is_dirty():
+                dirty += 1
+        dstdmp.add_rev_from_dump(srcdmp)
+        hasrev = srcdmp.read_next_rev()
+    srcdmp.close()
+    dstdmp.close()
+    rc = 0
+    if count == 0 or dirty != 0:
+        rc = 1
+    add_test_result(params, "test_lazy_props", "nodes passed through", rc)
+    if rc != 0:
+        print("%d nodes are dirty :(" % dirty)
+        return 1
+    if compare_files(params, "test_lazy_props", "copy of read properties",
+                     plain, copied) != 0:
+        return 1
+
+    # done.
+    return 0
+
+
+def test_digests(params):
+    """Test 22: Test calculating all text digests in a single read."""
+
+    tempdir = params["tempdir"]
+    textfile = tempdir + "/test_digests_text"
+
+    # more than one chunk of the digest calculation
+    text = urandom(3000000)
+    fileobj = open(textfile, "wb")
+    fileobj.write(text)
+    fileobj.close()
+    expected = (md5(text).hexdigest(), sha1(text).hexdigest(),
+                sha256(text).hexdigest())
+
+    # count the files the node opens and the bytes read from them
+    opened = []
+
+    def counting_open(filename, mode="r"):
+        fileobj = CountingFile(filename)
+        opened.append(fileobj)
+        return fileobj
+
+    svndump.common.sdt_set_sha256(True)
+    svndump.node.open = counting_open
+    try:
+        node = SvnDumpNode("f", "add", "file")
+        node.set_text_file(textfile)
+        # sums passed by a writer, nothing is read
+        digest = TextDigestWriter(open(tempdir + "/test_digests_copy", "wb"))
+        digest.write(text)
+        digest.close()
+        digest = digest.get_digest()
+        node2 = SvnDumpNode("f", "add", "file")
+        node2.set_text_file(textfile, len(text), digest.get_md5(), False,
+                            digest.get_sha1(), digest.get_sha256())
+    finally:
+        del svndump.node.open
+        svndump.common.sdt_set_sha256(False)
+    rc = 0
+    for n in (node, node2):
+        if (n.get_text_md5(), n.get_text_sha1(),
+                n.get_text_sha256()) != expected:
+            rc = 1
+    add_test_result(params, "test_digests", "md5, sha1 and sha256", rc)
+    if rc != 0:
+        print("wrong sums :(")
+        return 1
+    if len(opened) != 1 or opened[0].count != len(text):
+        rc = 1
+    add_test_result(params, "test_digests", "text read once", rc)
+    if rc != 0:
+        print("text opened %d times :(" % len(opened))
+        return 1
+
+    # done.
+    return 0
+
+
+def create_buffered_dump_file(filename, textfile, bufsize):
+    """Creates a dump file with many properties and texts of several
+    sizes using the given write buffer size."""
+
+    dump = SvnDumpFile()
+    if bufsize is not None:
+        dump.set_write_buffer_size(bufsize)
+    dump.create_with_rev_0(filename, "11111111-1111-1111-1111-111111111111",
+                           "2004-01-01T12:00:00.000000Z")
+    for revnr in range(1, 11):
+        revprops = {"svn:date": "2004-01-01T12:00:00.000000Z",
+                    "svn:log": "log %d" % revnr}
+        dump.add_rev(revprops)
+        node = SvnDumpNode("f%d" % revnr, "add", "file")
+        for i in range(revnr * 100):
+            node.set_property("p%d" % i, "value %d\n" % (i * revnr))
+        node.set_text_file(textfile, revnr * 20000)
+        dump.add_node(node)
+    dump.close()
+
+
+def test_write_buffer(params):
+    """Test 23: Test writing with different write buffer sizes."""
+
+    tempdir = params["tempdir"]
+    textfile = tempdir + "/test_write_buffer_text"
+    default = tempdir + "/test_write_buffer_1"
+    other = tempdir + "/test_write_buffer_2"
+
+    # texts below and above the size copied in one read
+    fileobj = open(textfile, "wb")
+    fileobj.write(urandom(200000))
+    fileobj.close()
+
+    create_buffered_dump_file(default, textfile, None)
+    for bufsize in [0, 4096, 100000, -1]:
+        create_buffered_dump_file(other, textfile, bufsize)
+        if compare_files(params, "test_write_buffer",
+                         "buffer size %d" % bufsize, default, other) != 0:
+            return 1
+
+    # all properties written
+    dump = SvnDumpFile()
+    dump.open(default)
+    rc = 0
+    while dump.read_next_rev():
+        revnr = dump.get_rev_nr()
+        for node in dump.get_nodes_iter():
+            props = node.get_properties()
+            if len(props) != revnr * 100 or \
+                    props["p99"] != "value %d\n" % (99 * revnr) or \
+                    node.get_text_length() != revnr * 20000:
+                rc = 1
+    dump.close()
+    add_test_result(params, "test_write_buffer", "read buffered dump", rc)
+    if rc != 0:
+        print("wrong node :(")
+        return 1
+
+    # done.
+    return 0
+
+
+def test_raw_headers(params):
+    """Test 24: Test copying nodes with headers add_node() doesn't write."""
+
+    tempdir = params["tempdir"]
+    source = tempdir + "/test_raw_headers_1"
+    copied = tempdir + "/test_raw_headers_2"
+
+    # a.txt has a leading '/' and a Prop-delta header, b.txt has its
+    # headers in the order svnadmin writes them
+    props = "K 10\nsvn:author\nV 1\nt\nK 8\nsvn:date\n" \
+            "V 27\n2004-01-01T12:00:00.000000Z\nK 7\nsvn:log\nV 3\nlog\n" \
+            "PROPS-END\n"
+    text = "text\n"
+    textmd5 = md5(text).hexdigest()
+    fileobj = open(source, "wb")
+    fileobj.write("SVN-fs-dump-format-version: 2\n\n"
+                  "UUID: 11111111-1111-1111-1111-111111111111\n\n")
+    fileobj.write("Revision-number: 1\nProp-content-length: %d\n"
+                  "Content-length: %d\n\n%s\n" %
+                  (len(props), len(props), props))
+    fileobj.write("Node-path: /a.txt\nNode-kind: file\nNode-action: add\n"
+                  "Prop-delta: false\nProp-content-length: 10\n"
+                  "Text-content-length: %d\nText-content-md5: %s\n"
+                  "Content-length: %d\n\nPROPS-END\n%s\n\n" %
+                  (len(text), textmd5, len(text) + 10, text))
+    fileobj.write("Node-path: b.txt\nNode-kind: file\nNode-action: add\n"
+                  "Prop-content-length: 10\nText-content-length: %d\n"
+                  "Text-content-md5: %s\nContent-length: %d\n\n"
+                  "PROPS-END\n%s\n\n" %
+                  (len(text), textmd5, len(text) + 10, text))
+    fileobj.close()
+
+    srcdmp = SvnDumpFile()
+    srcdmp.open(source)
+    srcdmp.read_next_rev()
+    rc = 0
+    if not srcdmp.get_node(0).is_dirty() or srcdmp.get_node(1).is_dirty():
+        rc = 1
+    add_test_result(params, "test_raw_headers", "raw nodes", rc)
+    if rc != 0:
+        print("wrong nodes copied as is :(")
+        srcdmp.close()
+        return 1
+    dstdmp = SvnDumpFile()
+    dstdmp.create_like(copied, srcdmp)
+    dstdmp.add_rev_from_dump(srcdmp)
+    srcdmp.close()
+    dstdmp.close()
+
+    # a.txt is rewritten, b.txt is copied as is
+    fileobj = open(copied, "rb")
+    data = fileobj.read()
+    fileobj.close()
+    rc = 0
+    if data.find("Node-path: a.txt\n") < 0 or data.find("/a.txt") >= 0 or \
+            data.find("Prop-delta") >= 0 or \
+            data.find("Node-action: add\nProp-content-length: 10\n"
+                      "Text-content-length") < 0:
+        rc = 1
+    add_test_result(params, "test_raw_headers", "copied headers", rc)
+    if rc != 0:
+        print("wrong headers :(")
+        return 1
+
+    # done.
+    return 0
+
+
 if __name__ == '__main__':
 
-    tests = 255
+    tests = 16777215
     if len(sys.argv) > 1:
         tests = int(sys.argv[1])
 
@@ -643,4 +1761,48 @@ if __name__ == '__main__':
         rc = test_dumps(params)
     if rc == 0 and tests & 2 != 0:
         rc = test_eolfix(params)
+    if rc == 0 and tests & 4 != 0:
+        rc = test_eolfix_copy(params)
+    if rc == 0 and tests & 8 != 0:
+        rc = test_listdict(params)
+    if rc == 0 and tests & 16 != 0:
+        rc = test_index(params)
+    if rc == 0 and tests & 32 != 0:
+        rc = test_stdin(params)
+    if rc == 0 and tests & 64 != 0:
+        rc = test_mmap(params)
+    if rc == 0 and tests & 128 != 0:
+        rc = test_ls_revs(params)
+    if rc == 0 and tests & 256 != 0:
+        rc = test_check_jobs(params)
+    if rc == 0 and tests & 512 != 0:
+        rc = test_pipeline(params)
+    if rc == 0 and tests & 1024 != 0:
+        rc = test_pipeline_cmd(params)
+    if rc == 0 and tests & 2048 != 0:
+        rc = test_compression(params)
+    if rc == 0 and tests & 4096 != 0:
+        rc = test_stdout(params)
+    if rc == 0 and tests & 8192 != 0:
+        rc = test_split_join(params)
+    if rc == 0 and tests & 16384 != 0:
+        rc = test_compressed_seek(params)
+    if rc == 0 and tests & 32768 != 0:
+        rc = test_tree(params)
+    if rc == 0 and tests & 65536 != 0:
+        rc = test_props_edit(params)
+    if rc == 0 and tests & 131072 != 0:
+        rc = test_skip_texts(params)
+    if rc == 0 and tests & 262144 != 0:
+        rc = test_svn_date(params)
+    if rc == 0 and tests & 524288 != 0:
+        rc = test_prop_block(params)
+    if rc == 0 and tests & 1048576 != 0:
+        rc = test_lazy_props(params)
+    if rc == 0 and tests & 2097152 != 0:
+        rc = test_digests(params)
+    if rc == 0 and tests & 4194304 != 0:
+        rc = test_write_buffer(params)
+    if rc == 0 and tests & 8388608 != 0:
+        rc = test_raw_headers(params)
     show_test_results(params)
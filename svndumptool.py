@@ -26,10 +26,12 @@ from __future__ import print_function
 import sys
 
 from svndump import __version
+from svndump.chain import svndump_pipeline_cmdline
 from svndump.cvs2svnfix import svndump_cvs2svnfix_cmdline
 from svndump.diff import svndump_diff_cmdline
 from svndump.edit import svndump_edit_cmdline
 from svndump.eolfix import svndump_eol_fix_cmdline
+from svndump.index import svndump_index_cmdline
 from svndump.merge import svndump_merge_cmdline
 from svndump.props import svndump_transform_revprop_cmdline, \
     svndump_transform_prop_cmdline, \
@@ -61,11 +63,13 @@ __commands = {
     "eolfix-prop": svndump_eolfix_prop_cmdline,
     "eolfix-revprop": svndump_eolfix_revprop_cmdline,
     "export": svndump_export_cmdline,
+    "index": svndump_index_cmdline,
     "join": svndump_join_cmdline,
     "list-large-files": svndump_list_large_files,
     "log": svndump_log_cmdline,
     "ls": svndump_ls_cmdline,
     "merge": svndump_merge_cmdline,
+    "pipeline": svndump_pipeline_cmdline,
     "remove-prop": svndump_remove_prop,
     "sanitize": svndump_sanitize_cmdline,
     "split": svndump_split_cmdline,
@@ -95,12 +99,14 @@ def __help(appname, args):
         print("    eolfix-revprop       fix EOL of revision property")
         print("    eolfix-prop          fix EOL of node property")
         print("    export               export files from a dump file")
+        print("    index                create revision index files for dump files")
         print("    join                 join dump files")
         print("    list-large-files     list large files in a dump file")
         print("    list-authors         list all the authors in a dump file")
         print("    log                  show the log of a dump file")
-        print("    ls                   list files of a given revision")
+        print("    ls                   list files of given revisions")
         print("    merge                merge dump files")
+        print("    pipeline             do several transformations in one pass")
         print("    remove-prop          remove a node property")
         print("    sanitize             sanitize dump files")
         print("    split                split dump files")